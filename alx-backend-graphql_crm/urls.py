@@ -1,9 +1,14 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import CRMGraphQLView, document_cache_stats, export_data, metrics_endpoint
+from crm.async_views import AsyncGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path("graphql/document-cache", document_cache_stats),
+    path("graphql/async", csrf_exempt(AsyncGraphQLView.as_view())),
+    path("export/<str:kind>", export_data),
+    path("metrics", metrics_endpoint),
 ]
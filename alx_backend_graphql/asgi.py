@@ -0,0 +1,16 @@
+"""
+ASGI config for alx_backend_graphql project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The async GraphQL endpoint (crm.async_views.AsyncGraphQLView) only runs
+concurrently when served through this entry point, e.g.
+``uvicorn alx_backend_graphql.asgi:application``.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+
+application = get_asgi_application()
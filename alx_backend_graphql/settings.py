@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -70,6 +71,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'alx_backend_graphql.wsgi.application'
+ASGI_APPLICATION = 'alx_backend_graphql.asgi.application'
 
 
 # Database
@@ -82,6 +84,22 @@ DATABASES = {
     }
 }
 
+# Read replica (see crm/routing.py). Locally, point CRM_REPLICA_DB at a
+# second SQLite file and fill it with `python manage.py sync_replica`.
+if os.environ.get('CRM_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['CRM_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['crm.routing.ReplicaRouter']
+CRM_DATABASE_ROUTING = {
+    'replicas': ['replica'],
+    'pin_seconds': 5,
+    'pin_cookie': 'crm_primary',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,3 +141,63 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# GraphQL query budgets (see crm/query_cost.py for the cost model)
+
+CRM_QUERY_COST = {
+    'max_cost': 5000,
+    'max_depth': 12,
+    'default_list_size': 10,
+    'field_weights': {},
+}
+
+# Parsed GraphQL documents kept in memory (also the persisted query store)
+
+CRM_DOCUMENT_CACHE_SIZE = 500
+
+# Opt-in cache of GraphQL query results (see crm/response_cache.py)
+
+CRM_RESPONSE_CACHE = {
+    'enabled': False,
+    'backend': 'local',
+    'max_bytes': 64 * 1024 * 1024,
+    'timeout': 300,
+}
+
+# How cron/Celery jobs run GraphQL documents (see crm/graphql_client.py)
+
+CRM_GRAPHQL_EXECUTOR = 'inprocess'  # or 'http'
+CRM_GRAPHQL_SCHEMA = 'alx_backend_graphql.schema.schema'
+CRM_GRAPHQL_URL = 'http://localhost:8000/graphql'
+
+# Resolver timing and SQL metrics, served at /metrics (see crm/metrics.py)
+
+GRAPHENE = {
+    'SCHEMA': 'alx_backend_graphql.schema.schema',
+    'MIDDLEWARE': ['crm.metrics.MetricsMiddleware'],
+}
+CRM_METRICS = {
+    'enabled': True,
+    'max_series': 1000,
+}
+
+# Sampled cProfile captures of slow operations (see crm/profiling.py)
+
+CRM_PROFILER = {
+    'enabled': False,
+    'sample_rate': 0.01,
+    'threshold_ms': 500,
+    'directory': str(BASE_DIR / 'profiles'),
+    'max_files': 200,
+    'max_bytes': 100 * 1024 * 1024,
+}
+
+# Order reminders, queued to Celery in batches (see crm/reminders.py)
+
+CRM_REMINDERS = {
+    'lookback_days': 7,
+    'batch_size': 100,
+    'rate_per_second': 50,
+    'claim_timeout': 600,
+}
@@ -1 +1,3 @@
-cr
+from django.contrib import admin
+
+# Register your models here.
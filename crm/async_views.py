@@ -0,0 +1,74 @@
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from graphene_django.views import HttpError
+from graphql import ExecutionResult, OperationType, execute
+
+from . import metrics, routing
+from . import search as text_search
+from .loaders import context_loaders
+from .views import CRMGraphQLView, PreparedOperation
+
+
+class AsyncGraphQLView(CRMGraphQLView):
+    """
+    ASGI counterpart of CRMGraphQLView.
+
+    Queries execute on the event loop: the root connections page with the
+    async ORM and the loaders return awaitables, so graphql-core resolves
+    independent root fields concurrently and the process keeps serving
+    other requests while one waits on the database. Mutations keep their
+    synchronous, atomic execution in a worker thread.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(["GET", "POST"], "GraphQL only supports GET and POST requests.")
+                )
+            data = self.parse_body(request)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            result = await self.execute_graphql_request_async(request, data, query, variables, operation_name)
+        except HttpError as e:
+            return e.response
+
+        status_code = 200
+        response = {}
+        if result.errors:
+            response["errors"] = [self.format_error(e) for e in result.errors]
+        if result.errors and any(not getattr(e, "path", None) for e in result.errors):
+            status_code = 400
+        else:
+            response["data"] = result.data
+
+        content = self.json_encode(request, response)
+        response = self.add_cache_headers(
+            request, HttpResponse(content, status=status_code, content_type="application/json")
+        )
+        return self.add_pin_cookie(request, response)
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        prepared = self.prepare_operation(request, data, query, variables, operation_name)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+        if prepared.operation.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_prepared)(request, prepared, variables, operation_name)
+
+        options = self.execution_options(request, prepared, variables, operation_name)
+        context_loaders(request).use_async()
+        try:
+            with metrics.record_operation(prepared.operation), \
+                    routing.use_replica(not routing.is_pinned(request)) as alias:
+                if not text_search.index_checked(alias):
+                    # Search filters pick their SQL from this, on the event loop
+                    await sync_to_async(text_search.check_index)(alias)
+                result = execute(self.schema.graphql_schema, **options)
+                if isawaitable(result):
+                    result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return self.finish(prepared, result, alias)
@@ -0,0 +1,469 @@
+"""
+Deterministic CRM datasets and a per-operation benchmark suite.
+
+``generate()`` fills the database up to a requested number of customers,
+products and orders. Random draws are seeded per block of ``BLOCK`` rows,
+so two databases generated with the same seed and sizes hold the same
+data, and rerunning an interrupted generation finishes it with the rows a
+single run would have written.
+
+``run_suite()`` executes every root query, every filter of every
+connection and every mutation through the project schema, in-process (no
+HTTP, no response cache), and records p50/p95/p99 latency, SQL statements
+per operation and throughput. Mutations run inside a transaction that is
+rolled back, so the dataset is the same for every run. Results are plain
+JSON; ``compare()`` diffs two of them.
+"""
+import json
+import os
+import random
+import subprocess
+import time
+import warnings
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from graphene.utils.str_converters import to_camel_case
+
+from .graphql_client import DEFAULT_SCHEMA, GraphQLExecutionError, execute_in_process
+from .models import CRMSummary, Customer, Order, OrderItem, Product
+from .pagination import row_cursor
+from .response_cache import bump_model_versions
+
+
+# Preset sizes for generate_crm_data --scale
+SCALES = {
+    "small": {"customers": 10_000, "products": 1_000, "orders": 20_000, "lines_per_order": 3},
+    "medium": {"customers": 100_000, "products": 10_000, "orders": 200_000, "lines_per_order": 5},
+    "large": {"customers": 1_000_000, "products": 100_000, "orders": 2_000_000, "lines_per_order": 5},
+}
+
+# Rows per random seed and per transaction
+BLOCK = 10_000
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+ORDER_DATE_SPAN = timedelta(days=2 * 365)
+
+FIRST_NAMES = (
+    "Alice", "Bob", "Carla", "David", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jonas",
+    "Kemi", "Liam", "Maya", "Nikhil", "Olga", "Pedro", "Quinn", "Rosa", "Samir", "Tara",
+)
+LAST_NAMES = (
+    "Adams", "Baker", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Jensen",
+    "Kowalski", "Lopez", "Mensah", "Nguyen", "Okafor", "Patel", "Rossi", "Silva", "Tanaka", "Weber",
+)
+PRODUCT_WORDS = (
+    "Laptop", "Phone", "Monitor", "Keyboard", "Mouse", "Headset", "Camera", "Router",
+    "Speaker", "Tablet", "Charger", "Cable", "Printer", "Scanner", "Drive", "Dock",
+)
+PRODUCT_GRADES = ("Basic", "Plus", "Pro", "Max", "Mini", "Ultra", "Lite", "Air")
+
+
+def _rng(seed, kind, block):
+    return random.Random(f"{seed}:{kind}:{block}")
+
+
+def customer_values(i):
+    first = FIRST_NAMES[i % len(FIRST_NAMES)]
+    last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    return {"name": f"{first} {last}", "email": f"customer{i}@example.com", "phone": f"+1555{i:07d}"}
+
+
+def product_values(i, rng):
+    word = PRODUCT_WORDS[i % len(PRODUCT_WORDS)]
+    grade = PRODUCT_GRADES[(i // len(PRODUCT_WORDS)) % len(PRODUCT_GRADES)]
+    return {
+        "name": f"{word} {grade} {i}",
+        "price": Decimal(rng.randint(100, 200_000)) / 100,
+        # About one product in ten is low on stock
+        "stock": rng.randint(0, 9) if rng.random() < 0.1 else rng.randint(10, 500),
+    }
+
+
+# ---------------------------------------------------------
+# Data generation
+# ---------------------------------------------------------
+
+def _blocks(kind, target, done, seed):
+    """Yield ``(rng, row indexes)`` for the blocks still missing, from ``done``."""
+    start = done - done % BLOCK
+    for block_start in range(start, target, BLOCK):
+        first = max(block_start, done)
+        yield _rng(seed, kind, block_start // BLOCK), range(first, min(block_start + BLOCK, target))
+
+
+def _draws(rng, rows, skip):
+    # Rows of a partially generated block still consume their draws, so
+    # the rest of the block comes out as it would in one run
+    for _ in range(skip):
+        rows(rng)
+
+
+def generate(customers, products, orders, lines_per_order=5, seed=42, batch_size=BLOCK, progress=None):
+    """
+    Insert rows until the tables hold the requested sizes. Rows are written
+    with ``bulk_create`` a block per transaction, with CRMSummary and the
+    response-cache versions updated as the bulk mutations do.
+    """
+    progress = progress or (lambda message: None)
+
+    done = Customer.objects.count()
+    for _, indexes in _blocks("customers", customers, done, seed):
+        with transaction.atomic():
+            created = Customer.objects.bulk_create(
+                (Customer(**customer_values(i)) for i in indexes), batch_size=batch_size
+            )
+            CRMSummary.adjust(customers=len(created))
+        progress(f"customers {indexes.stop}/{customers}")
+    bump_model_versions(Customer)
+
+    done = Product.objects.count()
+    for rng, indexes in _blocks("products", products, done, seed):
+        _draws(rng, lambda r: product_values(0, r), indexes.start % BLOCK)
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                (Product(**product_values(i, rng)) for i in indexes), batch_size=batch_size
+            )
+        progress(f"products {indexes.stop}/{products}")
+    bump_model_versions(Product)
+
+    customer_ids = list(Customer.objects.order_by("pk").values_list("pk", flat=True))
+    prices = dict(Product.objects.order_by("pk").values_list("pk", "price"))
+    product_ids = list(prices)
+    if not customer_ids or len(product_ids) < lines_per_order:
+        return
+
+    span = int(ORDER_DATE_SPAN.total_seconds())
+
+    def order_row(rng):
+        return (
+            rng.choice(customer_ids),
+            EPOCH + timedelta(seconds=rng.randrange(span)),
+            rng.sample(product_ids, lines_per_order),
+        )
+
+    done = Order.objects.count()
+    for rng, indexes in _blocks("orders", orders, done, seed):
+        _draws(rng, order_row, indexes.start % BLOCK)
+        rows = [order_row(rng) for _ in indexes]
+        with transaction.atomic():
+            created = Order.objects.bulk_create(
+                [
+                    Order(customer_id=customer_id, order_date=order_date,
+                          total_amount=sum(prices[pid] for pid in pids))
+                    for customer_id, order_date, pids in rows
+                ],
+                batch_size=batch_size,
+            )
+            OrderItem.objects.bulk_create(
+                (
+                    OrderItem(order_id=order.pk, product_id=pid, unit_price=prices[pid])
+                    for order, (_, _, pids) in zip(created, rows)
+                    for pid in pids
+                ),
+                batch_size=batch_size,
+            )
+            CRMSummary.adjust(orders=len(created), revenue=sum(order.total_amount for order in created))
+        progress(f"orders {indexes.stop}/{orders}")
+    bump_model_versions(Order)
+
+
+# ---------------------------------------------------------
+# Operations
+# ---------------------------------------------------------
+
+# name: unique label; document: GraphQL text; variables: dict;
+# mutation: run inside a rolled-back transaction
+Operation = namedtuple("Operation", "name document variables mutation")
+
+PAGE_SIZE = 50
+
+NODE_SELECTIONS = {
+    "customers": "id name email phone",
+    "products": "id name price stock",
+    "orders": "id orderDate totalAmount customer { id name } products { id name price }",
+}
+
+
+def _middle(model, using=None):
+    """The row halfway through the table by pk, found by a pk range, not OFFSET."""
+    queryset = model._default_manager.using(using).order_by("pk")
+    first, last = queryset.values_list("pk", flat=True).first(), queryset.values_list("pk", flat=True).last()
+    if first is None:
+        return None
+    return queryset.filter(pk__gte=(first + last) // 2).first()
+
+
+def filter_values(customer, product, order):
+    """Sample value for every filter, keyed by connection and filter name."""
+    day = order.order_date.date().isoformat()
+    return {
+        "customers": {
+            "name": customer.name.split()[-1],
+            "email": customer.email,
+            "phone_pattern": customer.phone[:6],
+            "search": customer.name.split()[0],
+        },
+        "products": {
+            "name": product.name.split()[0],
+            "price__gte": str(product.price),
+            "price__lte": str(product.price),
+            "stock__gte": "400",
+            "stock__lte": "5",
+            "low_stock": True,
+            "search": product.name.split()[0],
+        },
+        "orders": {
+            "total_amount__gte": str(order.total_amount),
+            "total_amount__lte": str(order.total_amount),
+            "order_date__gte": day,
+            "order_date__lte": day,
+            "customer_name": customer.name,
+            "product_name": product.name,
+            "product_id": str(product.pk),
+            "search": customer.name.split()[0],
+        },
+    }
+
+
+def _connection_filters(schema, field):
+    """(filter name, GraphQL argument, GraphQL type) of a connection's filters."""
+    from .schema import Query
+
+    arguments = schema.graphql_schema.query_type.fields[field].args
+    filterset_class = Query._meta.fields[field].filterset_class
+    for name in filterset_class.base_filters:
+        argument = to_camel_case(name)
+        yield name, argument, str(arguments[argument].type)
+
+
+def operations(schema):
+    """
+    Build the suite from the current data. Filters are enumerated from the
+    FilterSets, so a filter without a sample value in ``filter_values``
+    is returned in the second list rather than silently left out.
+    """
+    customer, product, order = _middle(Customer), _middle(Product), _middle(Order)
+    if customer is None or product is None or order is None:
+        raise ValueError("The database is empty; run generate_crm_data first.")
+
+    ops = [
+        Operation("query.totals", "{ totalCustomers totalOrders totalRevenue }", {}, False),
+        Operation(
+            "query.reportSnapshots.last_page",
+            "query($last: Int) { reportSnapshots(last: $last) { edges { node "
+            "{ createdAt newOrders newRevenue totalOrders totalRevenue } } } }",
+            {"last": PAGE_SIZE}, False,
+        ),
+    ]
+    for field, selection in NODE_SELECTIONS.items():
+        page = f"edges {{ cursor node {{ {selection} }} }} pageInfo {{ hasNextPage endCursor }}"
+        ops.append(Operation(
+            f"query.{field}.first_page",
+            f"query($first: Int) {{ {field}(first: $first) {{ {page} }} }}",
+            {"first": PAGE_SIZE}, False,
+        ))
+        ops.append(Operation(
+            f"query.{field}.last_page",
+            f"query($last: Int) {{ {field}(last: $last) {{ {page} }} }}",
+            {"last": PAGE_SIZE}, False,
+        ))
+    ordering = {"customers": ("id",), "products": ("id",), "orders": ("order_date", "id")}
+    for field, row in (("customers", customer), ("products", product), ("orders", order)):
+        selection = NODE_SELECTIONS[field]
+        ops.append(Operation(
+            f"query.{field}.middle_page",
+            f"query($first: Int, $after: String) {{ {field}(first: $first, after: $after) "
+            f"{{ edges {{ node {{ {selection} }} }} }} }}",
+            {"first": PAGE_SIZE, "after": row_cursor(row, ordering[field])}, False,
+        ))
+
+    values = filter_values(customer, product, order)
+    unsampled = []
+    for field, selection in NODE_SELECTIONS.items():
+        for name, argument, type_ in _connection_filters(schema, field):
+            if name not in values[field]:
+                unsampled.append(f"filter.{field}.{name}")
+                continue
+            ops.append(Operation(
+                f"filter.{field}.{name}",
+                f"query($value: {type_}, $first: Int) {{ {field}({argument}: $value, first: $first) "
+                f"{{ edges {{ node {{ {selection} }} }} }} }}",
+                {"value": values[field][name], "first": PAGE_SIZE}, False,
+            ))
+
+    product_ids = [str(pk) for pk in Product.objects.order_by("pk").values_list("pk", flat=True)[:3]]
+    new_customers = [
+        {"name": f"Bench {i}", "email": f"bench-suite-{i}@example.com", "phone": "+15550000000"}
+        for i in range(100)
+    ]
+    new_orders = [{"customerId": str(customer.pk), "productIds": product_ids} for _ in range(100)]
+    ops += [
+        Operation(
+            "mutation.createCustomer",
+            "mutation($name: String!, $email: String!, $phone: String) "
+            "{ createCustomer(name: $name, email: $email, phone: $phone) "
+            "{ customer { id } message } }",
+            {"name": "Bench", "email": "bench-suite@example.com", "phone": "+15550000000"}, True,
+        ),
+        Operation(
+            "mutation.bulkCreateCustomers",
+            "mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) "
+            "{ customers { id } errors } }",
+            {"input": new_customers}, True,
+        ),
+        Operation(
+            "mutation.createProduct",
+            "mutation { createProduct(name: \"Bench\", price: 9.99, stock: 5) { product { id } errors } }",
+            {}, True,
+        ),
+        Operation(
+            "mutation.createOrder",
+            "mutation($customerId: ID!, $productIds: [ID]!) { createOrder(customerId: $customerId, "
+            "productIds: $productIds) { order { id totalAmount } errors } }",
+            {"customerId": str(customer.pk), "productIds": product_ids}, True,
+        ),
+        Operation(
+            "mutation.bulkCreateOrders",
+            "mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { orders { id } errors } }",
+            {"input": new_orders}, True,
+        ),
+        Operation(
+            "mutation.updateLowStockProducts",
+            "mutation($first: Int) { updateLowStockProducts(first: $first) "
+            "{ success updatedProducts { id stock } hasNextPage } }",
+            {"first": PAGE_SIZE}, True,
+        ),
+    ]
+    return ops, unsampled
+
+
+# ---------------------------------------------------------
+# Running and comparing
+# ---------------------------------------------------------
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextmanager
+def count_queries(counter):
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+def _timed(operation, counter):
+    with count_queries(counter):
+        started = time.perf_counter()
+        execute_in_process(operation.document, operation.variables)
+        return time.perf_counter() - started
+
+
+def run_operation(operation, iterations, warmup=3):
+    """Time ``operation``; return its result dict for the suite output."""
+    latencies, queries = [], 0
+    for i in range(warmup + iterations):
+        counter = [0]
+        try:
+            if operation.mutation:
+                with transaction.atomic():
+                    elapsed = _timed(operation, counter)
+                    transaction.set_rollback(True)
+            else:
+                elapsed = _timed(operation, counter)
+        except GraphQLExecutionError as e:
+            return {"error": str(e)}
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries += counter[0]
+
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(total / iterations * 1000, 3),
+        "queries": round(queries / iterations, 2),
+        "ops_per_s": round(iterations / total, 1) if total else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(iterations=50, warmup=3, only=None, progress=None):
+    """Run the suite and return the results document."""
+    progress = progress or (lambda name, result: None)
+    schema = import_string(getattr(settings, "CRM_GRAPHQL_SCHEMA", DEFAULT_SCHEMA))
+    ops, unsampled = operations(schema)
+    results = {}
+    with warnings.catch_warnings():
+        # Date filters and createOrder pass naive datetimes; one warning per
+        # iteration would bury the report
+        warnings.filterwarnings("ignore", r"DateTimeField .* received a naive datetime", RuntimeWarning)
+        for operation in ops:
+            if only and not any(pattern in operation.name for pattern in only):
+                continue
+            results[operation.name] = run_operation(operation, iterations, warmup)
+            progress(operation.name, results[operation.name])
+
+    return {
+        "created": timezone.now().isoformat(),
+        "revision": git_revision(),
+        "vendor": connection.vendor,
+        "dataset": {
+            "customers": Customer.objects.count(),
+            "products": Product.objects.count(),
+            "orders": Order.objects.count(),
+            "order_lines": OrderItem.objects.count(),
+        },
+        "iterations": iterations,
+        "unsampled": unsampled,
+        "operations": results,
+    }
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "queries")
+
+
+def compare(old, new, threshold=10.0):
+    """
+    Yield ``(operation, metric, old, new, change %, regression)`` for every
+    metric of the operations present in both runs. Latencies regress when
+    they grow by more than ``threshold`` percent; query counts on any growth.
+    """
+    for name, after in new["operations"].items():
+        before = old["operations"].get(name)
+        if before is None or "error" in before or "error" in after:
+            continue
+        for metric in COMPARED:
+            a, b = before[metric], after[metric]
+            change = (b - a) / a * 100 if a else 0.0
+            regression = b > a if metric == "queries" else change > threshold
+            yield name, metric, a, b, change, regression
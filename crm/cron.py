@@ -1,7 +1,8 @@
 # crm/cron.py
 from datetime import datetime
-from gql.transport.requests import RequestsHTTPTransport
-from gql import gql, Client
+from gql import gql
+
+from crm.graphql_client import execute_query
 
 def log_crm_heartbeat():
     """
@@ -12,22 +13,15 @@ def log_crm_heartbeat():
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     message = f"{timestamp} CRM is alive"
 
-    # Optionally query GraphQL 'hello' field to ensure endpoint is up
+    # Optionally query GraphQL 'hello' field to ensure the schema responds
     try:
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            verify=False,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
         query = gql("""
             query {
                 hello
             }
         """)
 
-        response = client.execute(query)
+        response = execute_query(query)
         hello_message = response.get("hello", "No response from GraphQL.")
         message += f" | GraphQL says: {hello_message}"
 
@@ -49,32 +43,34 @@ def update_low_stock():
     message = f"{timestamp} | Low stock update started."
 
     try:
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            verify=False,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
         mutation = gql("""
-            mutation {
-                updateLowStockProducts {
+            mutation($after: String) {
+                updateLowStockProducts(after: $after) {
                     success
                     updatedProducts {
                         name
                         stock
                     }
+                    endCursor
+                    hasNextPage
                 }
             }
         """)
 
-        response = client.execute(mutation)
-        result = response.get("updateLowStockProducts", {})
-        updated_products = result.get("updatedProducts", [])
+        # The mutation restocks one page of products per call
+        after = None
+        while True:
+            response = execute_query(mutation, {"after": after})
+            result = response.get("updateLowStockProducts", {})
+            updated_products = result.get("updatedProducts", [])
+
+            message += f" | {result.get('success', 'Mutation executed.')}"
+            for p in updated_products:
+                message += f" | {p['name']} -> Stock: {p['stock']}"
 
-        message += f" | {result.get('success', 'Mutation executed.')}"
-        for p in updated_products:
-            message += f" | {p['name']} -> Stock: {p['stock']}"
+            if not result.get("hasNextPage"):
+                break
+            after = result.get("endCursor")
 
     except Exception as e:
         message += f" | ERROR: {e}"
@@ -2,8 +2,22 @@
 
 import datetime
 import logging
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import os
+import sys
+from gql import gql
+
+# Make the project importable when run directly from cron
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# Set before importing crm, whose Celery app would default it otherwise
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
+import django
+
+django.setup()
+
+from crm import reminders
+from crm.graphql_client import execute_query
+from crm.tasks import send_order_reminders
 
 # Configure logging
 LOG_FILE = "/tmp/order_reminders_log.txt"
@@ -13,64 +27,66 @@ logging.basicConfig(
     format="%(asctime)s - %(message)s",
 )
 
-def fetch_recent_orders():
+def recent_order_batches(days, batch_size):
     """
-    Fetch orders placed within the last 7 days via GraphQL query.
+    Yield the ids of the orders placed within the last ``days`` days, one
+    page of ``batch_size`` at a time, following the connection cursor.
     """
-    # GraphQL endpoint
-    endpoint = "http://localhost:8000/graphql"
-
-    # Set up GraphQL transport
-    transport = RequestsHTTPTransport(
-        url=endpoint,
-        verify=False,
-        retries=3,
-    )
+    start_date = datetime.date.today() - datetime.timedelta(days=days)
 
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    # Calculate date range
-    today = datetime.date.today()
-    seven_days_ago = today - datetime.timedelta(days=7)
-
-    # GraphQL query
+    # GraphQL query (orders is a keyset-paginated connection)
     query = gql(
         """
-        query RecentOrders($startDate: Date!) {
-            orders(filter: { orderDate_Gte: $startDate }) {
-                id
-                customer {
-                    email
+        query RecentOrders($startDate: Date!, $first: Int!, $after: String) {
+            orders(orderDate_Gte: $startDate, first: $first, after: $after) {
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+                edges {
+                    node {
+                        id
+                    }
                 }
-                orderDate
             }
         }
         """
     )
 
-    params = {"startDate": seven_days_ago.isoformat()}
+    params = {"startDate": start_date.isoformat(), "first": batch_size, "after": None}
 
-    # Execute query
-    result = client.execute(query, variable_values=params)
-    return result.get("orders", [])
+    # Only the current page is held, however many orders there are
+    while True:
+        result = execute_query(query, params)
+        connection = result.get("orders", {})
+        order_ids = [int(edge["node"]["id"]) for edge in connection.get("edges", [])]
+        if order_ids:
+            yield order_ids
+        page_info = connection.get("pageInfo", {})
+        if not page_info.get("hasNextPage"):
+            return
+        params["after"] = page_info.get("endCursor")
 
 
-def log_order_reminders():
+def dispatch_order_reminders():
     """
-    Logs each order’s ID and customer email.
+    Queue a Celery task per batch of recent orders; the workers send the
+    reminders (see crm/reminders.py).
     """
     try:
-        orders = fetch_recent_orders()
-
-        if not orders:
+        config = reminders.reminder_settings()
+        queued = batches = 0
+        for order_ids in recent_order_batches(config["lookback_days"], config["batch_size"]):
+            send_order_reminders.apply_async(
+                (order_ids,), countdown=reminders.countdown(queued, config),
+            )
+            queued += len(order_ids)
+            batches += 1
+
+        if not queued:
             logging.info("No recent orders found.")
         else:
-            for order in orders:
-                logging.info(
-                    "Order ID: %s | Customer Email: %s",
-                    order.get("id"),
-                    order.get("customer", {}).get("email"),
-                )
+            logging.info("Queued reminders for %s orders in %s batches.", queued, batches)
 
         print("Order reminders processed!")
 
@@ -80,5 +96,4 @@ def log_order_reminders():
 
 
 if __name__ == "__main__":
-    log_order_reminders()
-  
+    dispatch_order_reminders()
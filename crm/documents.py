@@ -0,0 +1,102 @@
+"""
+Bounded LRU cache of parsed and validated GraphQL documents.
+
+Entries are keyed by the SHA-256 of the query text, which is also the hash
+clients send with the automatic persisted query (APQ) protocol, so the
+same cache answers both "have I parsed this text before?" and "which query
+does this hash stand for?".
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+
+
+DEFAULT_CACHE_SIZE = 500
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class CachedDocument:
+    __slots__ = ("query", "document", "errors", "memo")
+
+    def __init__(self, query, document, errors):
+        self.query = query
+        self.document = document
+        self.errors = errors
+        # Per-document values derived by other layers (e.g. response cache keys)
+        self.memo = {}
+
+
+class DocumentCache:
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.parse_seconds = 0.0
+
+    def _max_entries(self):
+        if self.maxsize is not None:
+            return self.maxsize
+        return getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+
+    def lookup(self, schema, digest):
+        """Return the cached entry for a hash, or None."""
+        with self._lock:
+            entry = self._entries.get((id(schema), digest))
+            if entry is not None:
+                self._entries.move_to_end((id(schema), digest))
+                self.hits += 1
+            return entry
+
+    def get(self, schema, query, digest=None):
+        """Return the parsed and validated entry for ``query``, parsing on a miss."""
+        digest = digest or query_hash(query)
+        entry = self.lookup(schema, digest)
+        if entry is not None:
+            return entry
+
+        started = time.perf_counter()
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            document, errors = None, [e]
+        else:
+            errors = validate(schema, document)
+        entry = CachedDocument(query, document, errors)
+
+        with self._lock:
+            self.misses += 1
+            self.parse_seconds += time.perf_counter() - started
+            self._entries[(id(schema), digest)] = entry
+            while len(self._entries) > self._max_entries():
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            average = self.parse_seconds / self.misses if self.misses else 0.0
+            return {
+                "size": len(self._entries),
+                "maxsize": self._max_entries(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "parse_seconds": round(self.parse_seconds, 6),
+                "estimated_seconds_saved": round(average * self.hits, 6),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self.parse_seconds = 0.0
+
+
+document_cache = DocumentCache()
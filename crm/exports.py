@@ -0,0 +1,132 @@
+"""
+Streaming exports of customers, products and orders as NDJSON or CSV.
+
+Rows are read with ``QuerySet.iterator()`` (a server-side cursor where the
+backend has one) and rendered one chunk at a time, so memory stays flat
+however many rows match. The product ids and quantities of each chunk of
+orders are read with one query on the order lines.
+
+Filters are the FilterSets behind the GraphQL connections, keyed by their
+Python names (``order_date__gte``, ``customer_name``, ``low_stock``...).
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .models import Customer, Order, OrderItem, Product
+
+
+DEFAULT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# kind -> (model, filterset, exported columns)
+EXPORTS = {
+    "customers": (Customer, CustomerFilter, ("id", "name", "email", "phone")),
+    "products": (Product, ProductFilter, ("id", "name", "price", "stock")),
+    "orders": (Order, OrderFilter, ("id", "customer_id", "order_date", "total_amount")),
+}
+
+
+class ExportError(ValueError):
+    """Unknown export kind or format, or invalid filters."""
+
+
+def chunk_size():
+    return getattr(settings, "CRM_EXPORT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def export_columns(kind):
+    columns = EXPORTS[kind][2]
+    return columns + ("product_ids", "quantities") if kind == "orders" else columns
+
+
+def export_queryset(kind, filters=None, using="default"):
+    """Validate ``filters`` and return the rows of ``kind`` to export, by pk."""
+    if kind not in EXPORTS:
+        raise ExportError(f"Unknown export {kind!r}; choose from {', '.join(EXPORTS)}.")
+    model, filterset_class, columns = EXPORTS[kind]
+
+    filters = dict(filters or {})
+    unknown = set(filters) - set(filterset_class.base_filters)
+    if unknown:
+        raise ExportError(f"Unknown filters for {kind}: {', '.join(sorted(unknown))}.")
+
+    filterset = filterset_class(data=filters, queryset=model._default_manager.using(using).all())
+    if not filterset.is_valid():
+        raise ExportError(filterset.form.errors.as_text())
+    try:
+        return filterset.qs.order_by("pk").values(*columns)
+    except (FieldError, ValidationError) as e:
+        # A filter the form accepted but the query cannot apply
+        raise ExportError(f"Invalid filters for {kind}: {e}")
+
+
+def export_chunks(kind, queryset, size=None):
+    """Yield lists of row dicts, with ``product_ids`` and matching ``quantities`` added to orders."""
+    size = size or chunk_size()
+    rows = queryset.iterator(chunk_size=size)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        if kind == "orders":
+            for row in chunk:
+                row["product_ids"], row["quantities"] = [], []
+            by_id = {row["id"]: row for row in chunk}
+            lines = (
+                OrderItem.objects.using(queryset.db)
+                .filter(order_id__in=list(by_id))
+                .order_by("order_id", "product_id")
+                .values_list("order_id", "product_id", "quantity")
+            )
+            for order_id, product_id, quantity in lines:
+                by_id[order_id]["product_ids"].append(product_id)
+                by_id[order_id]["quantities"].append(quantity)
+        yield chunk
+
+
+def render(kind, chunks, fmt):
+    """Yield one string per chunk in ``fmt``; CSV starts with a header row."""
+    if fmt == "ndjson":
+        for chunk in chunks:
+            yield "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in chunk)
+    elif fmt == "csv":
+        columns = export_columns(kind)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for chunk in chunks:
+            for row in chunk:
+                writer.writerow([
+                    " ".join(map(str, row[c])) if isinstance(row[c], list) else row[c]
+                    for c in columns
+                ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        raise ExportError(f"Unknown format {fmt!r}; choose from {', '.join(CONTENT_TYPES)}.")
+
+
+def stream_export(kind, filters=None, fmt="ndjson", using="default", size=None):
+    """
+    Validate the request eagerly, then return a generator of output text.
+    Errors in ``kind``, ``fmt`` or ``filters`` raise ExportError here rather
+    than halfway through a response.
+    """
+    if fmt not in CONTENT_TYPES:
+        raise ExportError(f"Unknown format {fmt!r}; choose from {', '.join(CONTENT_TYPES)}.")
+    queryset = export_queryset(kind, filters, using)
+    return render(kind, export_chunks(kind, queryset, size), fmt)
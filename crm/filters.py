@@ -1,6 +1,8 @@
 import django_filters
-from .models import Customer, Product, Order
-from django.db.models import Q
+from .models import Customer, Product, Order, ReportSnapshot
+from django.db.models import Exists, OuterRef, Q
+
+from . import search as text_search
 
 
 
@@ -9,16 +11,19 @@ from django.db.models import Q
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
     email = django_filters.CharFilter(field_name='email', lookup_expr='icontains')
-    created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
-    created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    # Indexed prefix search over name and email, ranked (see crm/search.py)
+    search = django_filters.CharFilter(method='filter_search')
 
     def filter_phone_pattern(self, queryset, name, value):
         return queryset.filter(phone__startswith=value)
 
+    def filter_search(self, queryset, name, value):
+        return text_search.search(queryset, value)
+
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
+        fields = ['name', 'email', 'phone_pattern', 'search']
 
 
 
@@ -32,15 +37,20 @@ class ProductFilter(django_filters.FilterSet):
     stock__lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
 
     low_stock = django_filters.BooleanFilter(method='filter_low_stock', label="Low stock (<10)")
+    # Indexed prefix search over name, ranked (see crm/search.py)
+    search = django_filters.CharFilter(method='filter_search')
 
     def filter_low_stock(self, queryset, name, value):
         if value:
             return queryset.filter(stock__lt=10)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return text_search.search(queryset, value)
+
     class Meta:
         model = Product
-        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'low_stock']
+        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'low_stock', 'search']
 
 
 
@@ -54,18 +64,50 @@ class OrderFilter(django_filters.FilterSet):
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
     product_name = django_filters.CharFilter(method='filter_by_product_name')
     product_id = django_filters.NumberFilter(method='filter_by_product_id')
+    # Indexed prefix search over the customer's name/email and product names
+    search = django_filters.CharFilter(method='filter_search')
+
+    # Product filters are semijoins against the order/product link table, so
+    # an order matching several products is returned once without DISTINCT.
+    # They use IN (subquery), driven from the link table's product index;
+    # product names are matched in a nested subquery, so building the
+    # filter runs no SQL (the async view builds it on the event loop). The
+    # search matches customers or products, so its product side is an EXISTS.
+    def order_lines(self, **lookups):
+        return Exists(Order.products.through.objects.filter(order_id=OuterRef('pk'), **lookups))
+
+    def with_products(self, queryset, product_ids):
+        lines = Order.products.through.objects.filter(product_id__in=product_ids)
+        return queryset.filter(pk__in=lines.values('order_id'))
+
+    def filter_search(self, queryset, name, value):
+        customers = text_search.matching_ids(Customer, value, queryset.db)
+        products = text_search.matching_ids(Product, value, queryset.db)
+        return queryset.filter(Q(customer_id__in=customers) | self.order_lines(product_id__in=products))
 
     def filter_by_product_name(self, queryset, name, value):
-        return queryset.filter(products__name__icontains=value).distinct()
+        products = Product.objects.filter(name__icontains=value)
+        return self.with_products(queryset, products.values('pk'))
 
     def filter_by_product_id(self, queryset, name, value):
-        return queryset.filter(products__id=value).distinct()
+        return self.with_products(queryset, [value])
 
     class Meta:
         model = Order
         fields = [
             'total_amount__gte', 'total_amount__lte',
             'order_date__gte', 'order_date__lte',
-            'customer_name', 'product_name', 'product_id'
+            'customer_name', 'product_name', 'product_id', 'search'
       ]
-      
+
+
+
+# Report Snapshot Filter
+# ------------------------------
+class ReportSnapshotFilter(django_filters.FilterSet):
+    created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
+    created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
+
+    class Meta:
+        model = ReportSnapshot
+        fields = ['created_at__gte', 'created_at__lte']
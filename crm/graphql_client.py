@@ -0,0 +1,105 @@
+"""
+Run GraphQL documents for the cron and Celery jobs.
+
+By default documents are executed in-process against the project schema,
+which skips the HTTP round-trip, the schema introspection that
+``Client(fetch_schema_from_transport=True)`` performs on every run, and
+the JSON encoding of the response. The HTTP endpoint is kept as a
+fallback for processes where Django is not configured (or when
+``CRM_GRAPHQL_EXECUTOR = "http"``).
+
+In-process queries read from a replica when one is configured (see
+crm/routing.py); after a mutation the process reads the primary for a
+while.
+"""
+import os
+from types import SimpleNamespace
+
+from graphql import DocumentNode, OperationType, get_operation_ast, print_ast
+
+
+DEFAULT_SCHEMA = "alx_backend_graphql.schema.schema"
+DEFAULT_URL = "http://localhost:8000/graphql"
+
+
+class GraphQLExecutionError(Exception):
+    """Raised when an operation returns errors, like gql's TransportQueryError."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(str(getattr(e, "message", e)) for e in errors))
+
+
+def _django_ready():
+    from django.conf import settings
+    if settings.configured:
+        return True
+    if os.environ.get("DJANGO_SETTINGS_MODULE"):
+        import django
+        django.setup()
+        return True
+    return False
+
+
+def _setting(name, default):
+    from django.conf import settings
+    return getattr(settings, name, default) if settings.configured else default
+
+
+def execute_in_process(query, variables=None, operation_name=None):
+    from django.utils.module_loading import import_string
+    from graphql import execute
+
+    from . import routing
+    from .documents import document_cache
+
+    schema = import_string(_setting("CRM_GRAPHQL_SCHEMA", DEFAULT_SCHEMA))
+    text = print_ast(query) if isinstance(query, DocumentNode) else query
+    entry = document_cache.get(schema.graphql_schema, text)
+    if entry.errors:
+        raise GraphQLExecutionError(entry.errors)
+
+    operation = get_operation_ast(entry.document, operation_name)
+    is_query = operation is not None and operation.operation == OperationType.QUERY
+    with routing.use_replica(is_query and not routing.process_pinned()):
+        result = execute(
+            schema.graphql_schema,
+            entry.document,
+            variable_values=variables,
+            operation_name=operation_name,
+            context_value=SimpleNamespace(),
+        )
+    if operation is not None and not is_query:
+        routing.pin_process()
+    if result.errors:
+        raise GraphQLExecutionError(result.errors)
+    return result.data
+
+
+_http_clients = {}
+
+
+def execute_over_http(query, variables=None, operation_name=None):
+    from gql import Client, gql
+    from gql.transport.requests import RequestsHTTPTransport
+
+    url = os.environ.get("CRM_GRAPHQL_URL") or _setting("CRM_GRAPHQL_URL", DEFAULT_URL)
+    client = _http_clients.get(url)
+    if client is None:
+        transport = RequestsHTTPTransport(url=url, verify=False, retries=3)
+        client = _http_clients[url] = Client(transport=transport, fetch_schema_from_transport=False)
+
+    document = query if isinstance(query, DocumentNode) else gql(query)
+    return client.execute(document, variable_values=variables, operation_name=operation_name)
+
+
+def execute_query(query, variables=None, operation_name=None):
+    """
+    Execute ``query`` (a string or a ``gql()`` document) and return its data.
+
+    Runs in-process unless Django is not configured or the
+    ``CRM_GRAPHQL_EXECUTOR`` setting is ``"http"``.
+    """
+    if _django_ready() and _setting("CRM_GRAPHQL_EXECUTOR", "inprocess") != "http":
+        return execute_in_process(query, variables, operation_name)
+    return execute_over_http(query, variables, operation_name)
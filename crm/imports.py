@@ -0,0 +1,285 @@
+"""
+Chunked bulk import of customers, products and orders from CSV or NDJSON.
+
+The input is streamed in chunks. Each chunk is validated in a worker
+process with the model field validators (``Model.full_clean`` without the
+database checks), then written by the parent with ``bulk_create`` after
+one query per chunk for what needs the database: existing emails for
+customers, existing customers and product prices for orders. Orders
+take their products off stock like createOrder; an order short of
+stock is rejected on its own line.
+
+Every chunk is committed together with its ``ImportCheckpoint`` row, so
+an interrupted import resumes at the first chunk that was not committed
+and no chunk is ever written twice.
+
+Columns match crm/exports.py, so an export can be imported elsewhere;
+``id`` columns are ignored and new primary keys are assigned. Orders
+take ``quantities`` in step with ``product_ids``; without the column
+each product is ordered once.
+"""
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    CRMSummary, Customer, ImportCheckpoint, InsufficientStock, Order, OrderItem, Product, order_quantities,
+)
+from .response_cache import bump_model_versions
+
+
+FORMATS = ("csv", "ndjson")
+KINDS = ("customers", "products", "orders")
+
+
+class ImportFileError(ValueError):
+    """Unreadable input, or a checkpoint that does not match the input."""
+
+
+# ---------------------------------------------------------
+# Reading
+# ---------------------------------------------------------
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension in ("json", "jsonl"):
+        return "ndjson"
+    if extension in FORMATS:
+        return extension
+    raise ImportFileError(f"Cannot tell the format of {path}; pass --format.")
+
+
+def read_rows(path, fmt):
+    """Yield ``(line_number, row)`` for every record of the file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {"__error__": f"Invalid JSON: {e}"}
+                yield number, row
+
+
+def read_chunks(path, fmt, size, skip=0):
+    """Yield lists of ``size`` rows, after skipping ``skip`` chunks."""
+    rows = read_rows(path, fmt)
+    for _ in range(skip):
+        if not list(islice(rows, size)):
+            return
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ---------------------------------------------------------
+# Validation (runs in worker processes, no database access)
+# ---------------------------------------------------------
+
+def _blank(value):
+    return value is None or value == ""
+
+
+def _clean_customer(row):
+    customer = Customer(name=row.get("name") or "", email=row.get("email") or "", phone=row.get("phone") or "")
+    customer.full_clean(validate_unique=False, validate_constraints=False)
+    return {"name": customer.name, "email": customer.email, "phone": customer.phone}
+
+
+def _clean_product(row):
+    stock = row.get("stock")
+    product = Product(name=row.get("name") or "", price=row.get("price"), stock=0 if _blank(stock) else stock)
+    product.full_clean(validate_unique=False, validate_constraints=False)
+    return {"name": product.name, "price": product.price, "stock": product.stock}
+
+
+def _list(value):
+    if isinstance(value, str):
+        return value.replace(",", " ").split()
+    return value or []
+
+
+def _clean_order(row):
+    product_ids = _list(row.get("product_ids"))
+    # Without a quantities column every product is ordered once
+    quantities = _list(row.get("quantities")) or [1] * len(product_ids)
+    if len(quantities) != len(product_ids):
+        raise ValidationError({"quantities": "Give one quantity per product id."})
+    try:
+        quantities = [int(quantity) for quantity in quantities]
+    except (TypeError, ValueError):
+        raise ValidationError({"quantities": "Quantities must be integers."})
+    try:
+        quantities = order_quantities(list(zip(product_ids, quantities)))
+    except ValueError as e:
+        raise ValidationError({"product_ids": f"{e}."})
+
+    order = Order(customer_id=row.get("customer_id"))
+    order_date = row.get("order_date")
+    if not _blank(order_date):
+        order.order_date = parse_datetime(order_date) if isinstance(order_date, str) else order_date
+        if order.order_date is None:
+            raise ValidationError({"order_date": "Enter a valid date/time."})
+    # Customer and product existence are checked per chunk by the writer
+    order.full_clean(exclude=["customer", "total_amount"], validate_unique=False, validate_constraints=False)
+    try:
+        customer_id = int(order.customer_id)
+    except (TypeError, ValueError):
+        raise ValidationError({"customer_id": "Customer id must be an integer."})
+    return {"customer_id": customer_id, "order_date": order.order_date, "quantities": quantities}
+
+
+CLEANERS = {
+    "customers": _clean_customer,
+    "products": _clean_product,
+    "orders": _clean_order,
+}
+
+
+def validate_chunk(kind, chunk):
+    """Return ``(rows, errors)``: cleaned ``(line, values)`` pairs and ``(line, message)`` pairs."""
+    clean = CLEANERS[kind]
+    rows, errors = [], []
+    for line, row in chunk:
+        if "__error__" in row:
+            errors.append((line, row["__error__"]))
+            continue
+        try:
+            rows.append((line, clean(row)))
+        except ValidationError as e:
+            errors.append((line, "; ".join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items())))
+    return rows, errors
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+# ---------------------------------------------------------
+# Writing (parent process)
+# ---------------------------------------------------------
+
+def _write_customers(rows, errors, batch_size):
+    emails = {values["email"] for _, values in rows}
+    taken = set(Customer.objects.filter(email__in=emails).values_list("email", flat=True))
+    customers = []
+    for line, values in rows:
+        if values["email"] in taken:
+            errors.append((line, f"email: {values['email']} already exists."))
+            continue
+        taken.add(values["email"])
+        customers.append(Customer(**values))
+    Customer.objects.bulk_create(customers, batch_size=batch_size)
+    CRMSummary.adjust(customers=len(customers))
+    bump_model_versions(Customer)
+    return len(customers)
+
+
+def _write_products(rows, errors, batch_size):
+    products = Product.objects.bulk_create([Product(**values) for _, values in rows], batch_size=batch_size)
+    bump_model_versions(Product)
+    return len(products)
+
+
+def _write_orders(rows, errors, batch_size):
+    known_customers = set(
+        Customer.objects.filter(pk__in={values["customer_id"] for _, values in rows}).values_list("pk", flat=True)
+    )
+    prices = dict(
+        Product.objects.filter(pk__in={pid for _, values in rows for pid in values["quantities"]})
+        .values_list("pk", "price")
+    )
+
+    orders, lines = [], []
+    for line, values in rows:
+        if values["customer_id"] not in known_customers:
+            errors.append((line, f"customer_id: customer {values['customer_id']} does not exist."))
+            continue
+        quantities = values["quantities"]
+        missing = [pid for pid in quantities if pid not in prices]
+        if missing:
+            errors.append((line, f"product_ids: unknown products {missing}."))
+            continue
+        # In its own savepoint: a short order is rejected alone
+        try:
+            Product.objects.reserve(quantities)
+        except InsufficientStock as e:
+            errors.append((line, f"product_ids: insufficient stock for product {e.product_id}."))
+            continue
+        order = Order(
+            customer_id=values["customer_id"],
+            total_amount=sum(prices[pid] * quantity for pid, quantity in quantities.items()),
+        )
+        if values["order_date"] is not None:
+            order.order_date = values["order_date"]
+        orders.append(order)
+        lines.append(quantities)
+
+    orders = Order.objects.bulk_create(orders, batch_size=batch_size)
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(order_id=order.pk, product_id=pid, quantity=quantity, unit_price=prices[pid])
+            for order, quantities in zip(orders, lines) for pid, quantity in quantities.items()
+        ],
+        batch_size=batch_size,
+    )
+    CRMSummary.adjust(orders=len(orders), revenue=sum(order.total_amount for order in orders))
+    bump_model_versions(Order)
+    return len(orders)
+
+
+WRITERS = {
+    "customers": _write_customers,
+    "products": _write_products,
+    "orders": _write_orders,
+}
+
+
+def write_chunk(checkpoint, kind, rows, errors, batch_size):
+    """Write one validated chunk and advance its checkpoint in the same transaction."""
+    errors = list(errors)
+    with transaction.atomic():
+        imported = WRITERS[kind](rows, errors, batch_size)
+        checkpoint.chunks_done += 1
+        checkpoint.rows_imported += imported
+        checkpoint.rows_rejected += len(errors)
+        checkpoint.save(update_fields=["chunks_done", "rows_imported", "rows_rejected", "updated_at"])
+    return imported, sorted(errors)
+
+
+def get_checkpoint(kind, path, chunk_size, restart=False):
+    """Return the checkpoint for importing ``path``, creating or resetting it."""
+    stat = os.stat(path)
+    source = os.path.abspath(path)
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        kind=kind, source=source,
+        defaults={"source_size": stat.st_size, "source_mtime": stat.st_mtime, "chunk_size": chunk_size},
+    )
+    if created or restart:
+        if not created:
+            checkpoint.source_size, checkpoint.source_mtime = stat.st_size, stat.st_mtime
+            checkpoint.chunk_size = chunk_size
+            checkpoint.chunks_done = checkpoint.rows_imported = checkpoint.rows_rejected = 0
+            checkpoint.completed = False
+            checkpoint.save()
+        return checkpoint
+
+    if (checkpoint.source_size, checkpoint.source_mtime) != (stat.st_size, stat.st_mtime):
+        raise ImportFileError(
+            f"{source} changed since its import was checkpointed; rerun with --restart to import it again."
+        )
+    return checkpoint
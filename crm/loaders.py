@@ -0,0 +1,201 @@
+"""
+Per-request batch loaders for the CRM GraphQL types.
+
+graphene 3 resolves fields synchronously and depth-first, so a classic
+promise-based DataLoader never sees more than one key at a time. Instead,
+every resolver that hands a list of rows to GraphQL registers those rows
+with the request's loaders (``expect_*``). The first ``load()`` on a loader
+then fetches every pending key in a single query, so the number of SQL
+statements depends on the query shape, not on the number of rows.
+
+Nested connections (CustomerType.orders, ProductType.orders) load the
+pages of every registered parent in one windowed query per field, through
+``page_loader()``.
+
+Under the ASGI view (crm/async_views.py) the loaders run in async mode:
+``load()`` returns an awaitable, and loads issued concurrently by sibling
+resolvers share the batch that is already in flight.
+"""
+import asyncio
+from collections import defaultdict
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+
+from .models import CRMSummary, Customer, Order, OrderItem
+
+
+class BatchLoader:
+    """Caches values by key and loads all pending keys in one batch."""
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self.is_async = False
+        self._cache = {}
+        self._pending = {}
+        self._in_flight = {}
+
+    def expect(self, keys):
+        """Queue keys so they are fetched with the next batch."""
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._pending[key] = None
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+        self._pending.pop(key, None)
+
+    def load(self, key):
+        if self.is_async:
+            return self.aload(key)
+        if key not in self._cache:
+            self._pending[key] = None
+            self._load_keys(self._take_pending())
+        return self._value(key)
+
+    async def aload(self, key):
+        if key not in self._cache:
+            batch = self._in_flight.get(key)
+            if batch is None:
+                self._pending[key] = None
+                keys = self._take_pending()
+                batch = asyncio.ensure_future(sync_to_async(self._load_keys)(keys))
+                for pending_key in keys:
+                    self._in_flight[pending_key] = batch
+            await batch
+            self._in_flight.pop(key, None)
+        return self._value(key)
+
+    def _take_pending(self):
+        # Batch functions run in a worker thread under async execution and
+        # may queue keys meanwhile, so work on a snapshot.
+        keys = list(self._pending)
+        for key in keys:
+            self._pending.pop(key, None)
+        return [key for key in keys if key not in self._in_flight]
+
+    def _load_keys(self, keys):
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key)
+
+    def _value(self, key):
+        value = self._cache.get(key)
+        if value is None and self.default is not None:
+            return self.default()
+        return value
+
+
+class CRMLoaders:
+    """The set of loaders shared by all resolvers of one request."""
+
+    def __init__(self):
+        self.customer_by_id = BatchLoader(self._load_customers)
+        self.products_by_order = BatchLoader(self._load_products_by_order, default=list)
+        self.items_by_order = BatchLoader(self._load_items_by_order, default=list)
+        self.summary = BatchLoader(lambda keys: {key: CRMSummary.current() for key in keys})
+        self.is_async = False
+        # Nested connection pages, per field and arguments (see page_loader)
+        self._page_loaders = {}
+        self._parents = defaultdict(list)
+        self._parents_queued = {}
+
+    def use_async(self):
+        """Make every load() return an awaitable, for async execution."""
+        self.is_async = True
+        for loader in [*vars(self).values(), *self._page_loaders.values()]:
+            if isinstance(loader, BatchLoader):
+                loader.is_async = True
+
+    def summary_field(self, name):
+        """A CRMSummary column, with the row read once per request."""
+        summary = self.summary.load(CRMSummary.SINGLETON_PK)
+        if isawaitable(summary):
+            return self._await_field(summary, name)
+        return getattr(summary, name)
+
+    @staticmethod
+    async def _await_field(awaitable, name):
+        return getattr(await awaitable, name)
+
+    def page_loader(self, key, parent, batch_load_fn):
+        """
+        The loader of one nested connection field, keyed by parent pk.
+        ``key`` identifies the field and its arguments, so every parent
+        shares one page query; ``parent`` names the rows registered with
+        ``expect_*`` that are batched with each load.
+        """
+        loader = self._page_loaders.get(key)
+        if loader is None:
+            loader = self._page_loaders[key] = BatchLoader(batch_load_fn, default=list)
+            loader.is_async = self.is_async
+        # Only parents registered since the last load need queueing
+        parents = self._parents[parent]
+        loader.expect(parents[self._parents_queued.get(key, 0):])
+        self._parents_queued[key] = len(parents)
+        return loader
+
+    # ---------------------------------------------------------
+    # Registration of rows handed to GraphQL
+    # ---------------------------------------------------------
+
+    def expect_customers(self, customers):
+        self._parents["customer"].extend(c.pk for c in customers)
+
+    def expect_products(self, products):
+        self._parents["product"].extend(p.pk for p in products)
+
+    def expect_orders(self, orders):
+        for order in orders:
+            # Reuse customers already fetched with select_related()
+            if "customer" in order._state.fields_cache:
+                self.customer_by_id.prime(order.customer_id, order.customer)
+            else:
+                self.customer_by_id.expect([order.customer_id])
+            self.products_by_order.expect([order.pk])
+            self.items_by_order.expect([order.pk])
+
+    # ---------------------------------------------------------
+    # Batch load functions (one query each)
+    # ---------------------------------------------------------
+
+    def _load_customers(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.expect_customers(customers.values())
+        return customers
+
+    def _load_products_by_order(self, keys):
+        through = Order.products.through
+        rows = through.objects.filter(order_id__in=keys).select_related("product").order_by("pk")
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row.order_id].append(row.product)
+        self.expect_products(row.product for row in rows)
+        return grouped
+
+    def _load_items_by_order(self, keys):
+        rows = OrderItem.objects.filter(order_id__in=keys).select_related("product").order_by("pk")
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row.order_id].append(row)
+        self.expect_products(row.product for row in rows)
+        return grouped
+
+
+def context_loaders(context):
+    """Return the loaders bound to a request (or other context), creating them once."""
+    if context is None:
+        return CRMLoaders()
+    if isinstance(context, dict):
+        return context.setdefault("crm_loaders", CRMLoaders())
+    loaders = getattr(context, "crm_loaders", None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        setattr(context, "crm_loaders", loaders)
+    return loaders
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request."""
+    return context_loaders(info.context)
@@ -0,0 +1,69 @@
+import json
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every root query, filter and mutation of the CRM schema against "
+        "the current database and report p50/p95/p99 latency, SQL statements "
+        "per operation and throughput. Results are written as JSON so runs "
+        "can be diffed with compare_benchmarks (or --compare). Generate the "
+        "data first with generate_crm_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--only", action="append",
+            help="Run only operations whose name contains this text; repeatable.",
+        )
+        parser.add_argument(
+            "--output", "-o",
+            help="Results file; defaults to benchmark-results/<timestamp>.json.",
+        )
+        parser.add_argument("--compare", help="Diff the results against an earlier results file.")
+        parser.add_argument("--threshold", type=float, default=10.0, help="Latency regression threshold, in %%.")
+
+    def handle(self, *args, iterations, warmup, only, output, compare, threshold, **options):
+        if compare and not os.path.exists(compare):
+            raise CommandError(f"No results file at {compare}")
+
+        header = f"{'operation':<45} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'ops/s':>9}"
+        self.stdout.write(header)
+        try:
+            results = benchmarks.run_suite(
+                iterations=iterations, warmup=warmup, only=only, progress=self.report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for name in results["unsampled"]:
+            self.stdout.write(self.style.WARNING(f"{name:<45} skipped (no sample value in filter_values)"))
+
+        output = output or os.path.join(
+            "benchmark-results", timezone.now().strftime("%Y%m%d-%H%M%S") + ".json"
+        )
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results written to {output}")
+
+        if compare:
+            call_command("compare_benchmarks", compare, output, threshold=threshold, stdout=self.stdout)
+
+    def report(self, name, result):
+        if "error" in result:
+            self.stdout.write(self.style.ERROR(f"{name:<45} ERROR {result['error']}"))
+            return
+        self.stdout.write(
+            f"{name:<45} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['queries']:>8g} {result['ops_per_s']:>9.1f}"
+        )
+
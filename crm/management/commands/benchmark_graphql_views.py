@@ -0,0 +1,82 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from crm.benchmarks import percentile
+
+
+DEFAULT_QUERY = """
+{
+    totalCustomers
+    customers(first: 20) { edges { node { name email } } }
+    products(first: 20) { edges { node { name price stock } } }
+    orders(first: 20) { edges { node { id totalAmount customer { name } products { name } } } }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the WSGI GraphQL view (/graphql, "
+        "concurrent threads) with the ASGI view (/graphql/async, concurrent "
+        "tasks on one event loop). Requests go through Django's test clients, "
+        "so this measures the view and resolver stack, not a network server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--query", default=DEFAULT_QUERY)
+        parser.add_argument("--wsgi-path", default="/graphql")
+        parser.add_argument("--asgi-path", default="/graphql/async")
+
+    def handle(self, *args, requests, concurrency, query, wsgi_path, asgi_path, **options):
+        body = json.dumps({"query": query})
+
+        wsgi = self.run_wsgi(wsgi_path, body, requests, concurrency)
+        asgi = asyncio.run(self.run_asgi(asgi_path, body, requests, concurrency))
+
+        self.stdout.write(f"{requests} requests, concurrency {concurrency}")
+        self.stdout.write(f"{'view':<6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, (elapsed, latencies, errors) in (("wsgi", wsgi), ("asgi", asgi)):
+            self.stdout.write(
+                f"{name:<6} {requests / elapsed:>9.1f} "
+                f"{percentile(latencies, 50) * 1000:>9.2f} "
+                f"{percentile(latencies, 99) * 1000:>9.2f} {errors:>7}"
+            )
+
+    def run_wsgi(self, path, body, requests, concurrency):
+        def one(_):
+            client = Client()
+            started = time.perf_counter()
+            response = client.post(path, body, content_type="application/json")
+            latency = time.perf_counter() - started
+            connections.close_all()
+            return latency, response.status_code != 200 or b'"errors"' in response.content
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+        return elapsed, [r[0] for r in results], sum(r[1] for r in results)
+
+    async def run_asgi(self, path, body, requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, body, content_type="application/json")
+                latency = time.perf_counter() - started
+                return latency, response.status_code != 200 or b'"errors"' in response.content
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        return elapsed, [r[0] for r in results], sum(r[1] for r in results)
@@ -0,0 +1,101 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from crm import benchmarks
+from crm.filters import OrderFilter
+from crm.models import Order, Product
+from crm.pagination import max_page_size
+
+
+OrderProduct = Order.products.through
+
+
+def distinct_join(queryset, **lookups):
+    """The previous implementation: join the link table, then DISTINCT."""
+    return queryset.filter(**{f"products__{k}": v for k, v in lookups.items()}).distinct()
+
+
+def exists_semijoin(queryset, **lookups):
+    lines = OrderProduct.objects.filter(order_id=OuterRef("pk"), **{f"product__{k}": v for k, v in lookups.items()})
+    return queryset.filter(Exists(lines))
+
+
+def in_semijoin(queryset, **lookups):
+    lines = OrderProduct.objects.filter(**{f"product__{k}": v for k, v in lookups.items()})
+    return queryset.filter(pk__in=lines.values("order_id"))
+
+
+def current_filter(name, value):
+    return lambda queryset, **lookups: OrderFilter({name: value}, queryset).qs
+
+
+class Command(BaseCommand):
+    help = (
+        "Time OrderFilter's product filters as DISTINCT joins, EXISTS and IN "
+        "semijoins, and as OrderFilter runs them (count and first keyset "
+        "page). --generate first fills the database up to the requested "
+        "sizes with generate_crm_data's deterministic rows; use a scratch "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--generate", action="store_true", help="Insert data up to the sizes below.")
+        parser.add_argument("--orders", type=int, default=1_000_000)
+        parser.add_argument("--lines-per-order", type=int, default=5)
+        parser.add_argument("--customers", type=int, default=100_000)
+        parser.add_argument("--products", type=int, default=2_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            benchmarks.generate(
+                options["customers"], options["products"], options["orders"],
+                lines_per_order=options["lines_per_order"], seed=options["seed"],
+                batch_size=options["batch_size"],
+                progress=lambda message: self.stdout.write(message, ending="\r"),
+            )
+            self.stdout.write("")
+
+        orders = Order.objects.count()
+        lines = OrderProduct.objects.count()
+        self.stdout.write(f"{orders} orders, {lines} order/product rows")
+        product = Product.objects.order_by("-id").first()
+        if product is None:
+            self.stdout.write("No products; run with --generate.")
+            return
+
+        # One product by id, one by its full name, and a word most names share
+        word = product.name.split()[0]
+        cases = [
+            ("product_id", {"id": product.pk}, product.pk),
+            ("product_name", {"name__icontains": product.name}, product.name),
+            ("product_name", {"name__icontains": word}, word),
+        ]
+        page = max_page_size() + 1
+        columns = ("distinct ms", "exists ms", "in ms", "OrderFilter ms")
+        self.stdout.write(f"{'filter':<30} {'query':<6} " + " ".join(f"{c:>14}" for c in columns))
+        for name, lookups, value in cases:
+            variants = [distinct_join, exists_semijoin, in_semijoin, current_filter(name, value)]
+            for label, run in (
+                ("count", lambda qs: qs.count()),
+                ("page", lambda qs: list(qs.order_by("order_date", "id")[:page])),
+            ):
+                timings = [
+                    self.best_of(options["repeat"], lambda: run(variant(Order.objects.all(), **lookups)))
+                    for variant in variants
+                ]
+                case = f"{name}={value}"
+                self.stdout.write(f"{case:<30} {label:<6} " + " ".join(f"{ms:>14.1f}" for ms in timings))
+
+    def best_of(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,102 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from crm.benchmarks import percentile
+from crm.graphql_client import execute_in_process
+from crm.models import Customer, Order, OrderItem, Product
+
+
+CREATE_ORDER = """
+mutation StockBenchmark($customerId: ID!, $productIds: [ID]!) {
+    createOrder(customerId: $customerId, productIds: $productIds) {
+        order { id }
+        errors
+    }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Place concurrent createOrder mutations for the same few products "
+        "from many threads and report throughput, latency and oversell: "
+        "every product must end with its initial stock minus the units in "
+        "created orders, never below zero. Creates its own customer and "
+        "products and deletes them and their orders afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=3, help="Products in every order.")
+        parser.add_argument(
+            "--stock", type=int, default=500,
+            help="Initial stock of each product; below --orders so the products sell out.",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows.")
+
+    def handle(self, *args, threads, orders, products, stock, keep, **options):
+        tag = uuid.uuid4().hex[:8]
+        customer = Customer.objects.create(name="Stock benchmark", email=f"stock-benchmark-{tag}@example.com")
+        hot = [
+            Product.objects.create(name=f"Stock benchmark {tag} #{n}", price="1.00", stock=stock)
+            for n in range(products)
+        ]
+        variables = {"customerId": str(customer.pk), "productIds": [str(p.pk) for p in hot]}
+
+        def one(_):
+            started = time.perf_counter()
+            try:
+                result = execute_in_process(CREATE_ORDER, variables)["createOrder"]
+                outcome = "created" if result["order"] else "sold out"
+            except Exception:
+                outcome = "error"
+            latency = time.perf_counter() - started
+            connections.close_all()
+            return latency, outcome
+
+        # Threads open their own connections
+        connections.close_all()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(one, range(orders)))
+        elapsed = time.perf_counter() - started
+
+        outcomes = [outcome for _, outcome in results]
+        created = outcomes.count("created")
+        latencies = [latency for latency, _ in results]
+        self.stdout.write(f"{orders} orders of {products} products from {threads} threads, stock {stock}")
+        self.stdout.write(
+            f"{orders / elapsed:.1f} orders/s, p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+            f"p99 {percentile(latencies, 99) * 1000:.2f} ms"
+        )
+        self.stdout.write(
+            f"created {created}, sold out {outcomes.count('sold out')}, errors {outcomes.count('error')}"
+        )
+
+        oversold = False
+        sales = {
+            row["product_id"]: row["units"]
+            for row in OrderItem.objects.filter(product__in=hot).sales_by_product()
+        }
+        for product in Product.objects.filter(pk__in=[p.pk for p in hot]).order_by("pk"):
+            sold = sales.get(product.pk, 0)
+            consistent = product.stock >= 0 and stock - product.stock == sold
+            oversold |= not consistent
+            self.stdout.write(
+                f"product {product.pk}: stock {stock} -> {product.stock}, {sold} sold"
+                f"{'' if consistent else '  MISMATCH'}"
+            )
+        if oversold or created > stock:
+            self.stdout.write(self.style.ERROR("Oversold."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No oversell."))
+
+        if not keep:
+            Order.objects.filter(customer=customer).delete()
+            Product.objects.filter(pk__in=[p.pk for p in hot]).delete()
+            customer.delete()
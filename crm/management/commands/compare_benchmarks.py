@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Diff two benchmark_crm results files, operation by operation. "
+        "Latencies that grew by more than --threshold percent and any growth "
+        "in SQL statements are reported as regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("old")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=10.0, help="Latency regression threshold, in %%.")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, old, new, threshold, fail_on_regression, **options):
+        try:
+            old_results, new_results = benchmarks.load_results(old), benchmarks.load_results(new)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read benchmark results: {e}")
+        regressions = self.report(old_results, new_results, threshold)
+        if regressions and fail_on_regression:
+            raise CommandError(f"{len(regressions)} operation(s) regressed: {', '.join(regressions)}")
+
+    def report(self, old, new, threshold):
+        for label, run in (("old", old), ("new", new)):
+            dataset = ", ".join(f"{v} {k}" for k, v in run["dataset"].items())
+            self.stdout.write(f"{label}: {run.get('revision') or '?'} on {run['vendor']} ({dataset})")
+        if old["dataset"] != new["dataset"]:
+            self.stdout.write(self.style.WARNING("The runs used different datasets."))
+
+        self.stdout.write(f"{'operation':<45} {'metric':<8} {'old':>10} {'new':>10} {'change':>8}")
+        regressions = []
+        for name, metric, a, b, change, regression in benchmarks.compare(old, new, threshold):
+            line = f"{name:<45} {metric:<8} {a:>10g} {b:>10g} {change:>+7.1f}%"
+            if regression:
+                self.stdout.write(self.style.ERROR(line))
+                if name not in regressions:
+                    regressions.append(name)
+            elif change < -threshold:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(line)
+
+        for name in sorted(set(new["operations"]) ^ set(old["operations"])):
+            side = "new" if name in new["operations"] else "old"
+            self.stdout.write(f"{name:<45} only in the {side} run")
+        return regressions
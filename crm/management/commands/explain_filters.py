@@ -0,0 +1,165 @@
+import re
+from datetime import date
+
+import django_filters
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import FieldError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from crm import filters as crm_filters
+from crm.pagination import max_page_size
+from crm.schema import Query
+
+
+# Sample values per filter class, in the form they arrive from GraphQL
+SAMPLE_VALUES = [
+    (django_filters.BooleanFilter, "true"),
+    (django_filters.DateFilter, date.today().isoformat()),
+    (django_filters.NumberFilter, "10"),
+    (django_filters.CharFilter, "a"),
+]
+
+# (regex, is_full_scan) over one line of EXPLAIN output; the first group is
+# the table, the second (if any) the index. Only named indexes are reported:
+# the table group may be a subquery alias (U0) or the full-text table.
+PLAN_PATTERNS = {
+    "sqlite": [
+        (re.compile(r"\bSCAN (\w+) VIRTUAL TABLE INDEX"), False),
+        (re.compile(r"\b(?:SCAN|SEARCH) (\w+) USING (?:COVERING )?INDEX (\w+)"), False),
+        (re.compile(r"\bSEARCH (\w+) USING INTEGER PRIMARY KEY"), False),
+        (re.compile(r"\bSCAN (\w+)\s*$"), True),
+    ],
+    "postgresql": [
+        (re.compile(r"Index (?:Only )?Scan (?:Backward )?using (\w+) on (\w+)"), False),
+        (re.compile(r"Bitmap Index Scan on (\w+)"), False),
+        (re.compile(r"Seq Scan on (\w+)"), True),
+    ],
+}
+
+
+def sample_value(filter_):
+    for filter_class, value in SAMPLE_VALUES:
+        if isinstance(filter_, filter_class):
+            return value
+    return None
+
+
+def parse_plan(vendor, plan):
+    """Return (full-scanned tables, indexes used) for an EXPLAIN output."""
+    scans, indexes = set(), set()
+    for line in plan.splitlines():
+        for pattern, full_scan in PLAN_PATTERNS.get(vendor, []):
+            match = pattern.search(line)
+            if match is None:
+                continue
+            if full_scan:
+                scans.add(match.group(1))
+            elif vendor == "postgresql":
+                indexes.add(match.group(1))
+            elif pattern.groups > 1:
+                indexes.add(match.group(2))
+            break
+    return scans, indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the query behind every filter declared in crm/filters.py, "
+        "as the keyset connections run it (filter, ORDER BY, LIMIT), and "
+        "report full table scans and indexes no filter uses. Run it against "
+        "a production-sized database: planners pick scans on small tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--plans", action="store_true", help="Print the full plan of every query.")
+        parser.add_argument("--analyze", action="store_true", help="Refresh planner statistics (ANALYZE) first.")
+        parser.add_argument(
+            "--fail-on-scan", action="store_true",
+            help="Exit with an error if any filter causes a full table scan.",
+        )
+
+    def connection_orderings(self):
+        """FilterSet class -> ordering of the connection that uses it."""
+        return {
+            field.filterset_class: field.ordering
+            for field in Query._meta.fields.values()
+            if hasattr(field, "filterset_class")
+        }
+
+    def filtersets(self):
+        for value in vars(crm_filters).values():
+            if (
+                isinstance(value, type)
+                and issubclass(value, django_filters.FilterSet)
+                and value.__module__ == crm_filters.__name__
+            ):
+                yield value
+
+    def handle(self, *args, database, plans, analyze, fail_on_scan, **options):
+        connection = connections[database]
+        vendor = connection.vendor
+        if analyze:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        if vendor not in PLAN_PATTERNS:
+            self.stdout.write(self.style.WARNING(f"Plans from {vendor} are printed but not classified."))
+            plans = True
+
+        orderings = self.connection_orderings()
+        used_indexes, tables, scanned = set(), set(), []
+
+        for filterset_class in self.filtersets():
+            model = filterset_class._meta.model
+            ordering = orderings.get(filterset_class, ("id",))
+            base = model._default_manager.using(database).all()
+            tables.add(model._meta.db_table)
+
+            for name, filter_ in filterset_class.base_filters.items():
+                label = f"{filterset_class.__name__}.{name}"
+                value = sample_value(filter_)
+                if value is None:
+                    self.stdout.write(self.style.WARNING(f"{label:<45} skipped (no sample value)"))
+                    continue
+
+                filterset = filterset_class(data={name: value}, queryset=base)
+                try:
+                    if not filterset.is_valid():
+                        raise CommandError(filterset.form.errors.as_text())
+                    queryset = filterset.qs.order_by(*ordering)[:max_page_size() + 1]
+                    plan = queryset.explain()
+                except (CommandError, DatabaseError, FieldError) as e:
+                    self.stdout.write(self.style.ERROR(f"{label:<45} ERROR {e}"))
+                    continue
+                scans, indexes = parse_plan(vendor, plan)
+                used_indexes |= indexes
+
+                if scans:
+                    scanned.append(label)
+                    status = self.style.ERROR(f"FULL SCAN {', '.join(sorted(scans))}")
+                else:
+                    status = self.style.SUCCESS("ok")
+                uses = ", ".join(sorted(indexes)) or "-"
+                self.stdout.write(f"{label:<45} {status}  indexes: {uses}")
+                if plans:
+                    self.stdout.write("    " + plan.replace("\n", "\n    "))
+
+        if vendor in PLAN_PATTERNS:
+            self.report_unused_indexes(connection, tables, used_indexes)
+
+        if scanned and fail_on_scan:
+            raise CommandError(f"{len(scanned)} filter(s) scan a whole table: {', '.join(scanned)}")
+
+    def report_unused_indexes(self, connection, tables, used_indexes):
+        unused = []
+        with connection.cursor() as cursor:
+            for table in sorted(tables):
+                constraints = connection.introspection.get_constraints(cursor, table)
+                for name, info in constraints.items():
+                    if info["index"] and not info["primary_key"] and name not in used_indexes:
+                        unused.append(f"{table}.{name} ({', '.join(info['columns'])})")
+
+        if unused:
+            self.stdout.write("\nIndexes no filter used (they may still serve joins, uniqueness or other queries):")
+            for line in unused:
+                self.stdout.write(f"  {line}")
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.exceptions import FieldError, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import routing
+from crm.exports import CONTENT_TYPES, EXPORTS, ExportError, stream_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream customers, products or orders as NDJSON or CSV with constant "
+        "memory. Filters use the FilterSet names, e.g. "
+        "--filter order_date__gte=2024-01-01 --filter product_id=3."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", default="ndjson", choices=sorted(CONTENT_TYPES))
+        parser.add_argument("--output", "-o", help="File to write; defaults to stdout.")
+        parser.add_argument("--filter", action="append", default=[], metavar="NAME=VALUE")
+        parser.add_argument("--chunk-size", type=int)
+        parser.add_argument("--database", help="Defaults to a read replica, or the primary without one.")
+
+    def handle(self, *args, kind, format, output, filter, chunk_size, database, **options):
+        filters = {}
+        for item in filter:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"Filters must look like NAME=VALUE, got {item!r}.")
+            filters[name] = value
+
+        try:
+            content = stream_export(kind, filters, format, using=database or routing.pick_replica(), size=chunk_size)
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        try:
+            for text in content:
+                out.write(text)
+        except (FieldError, ValidationError) as e:
+            # Raised by the database query, after validation
+            raise CommandError(f"Export failed: {e}")
+        finally:
+            if output:
+                out.close()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with deterministic customers, products and orders "
+        "for benchmarking: the same seed and sizes give the same rows on any "
+        "database. Existing rows count towards the sizes, so an interrupted "
+        "run can be repeated to finish. Use a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=benchmarks.SCALES, default="small")
+        parser.add_argument("--customers", type=int, help="Overrides the scale.")
+        parser.add_argument("--products", type=int, help="Overrides the scale.")
+        parser.add_argument("--orders", type=int, help="Overrides the scale.")
+        parser.add_argument("--lines-per-order", type=int, help="Overrides the scale.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=benchmarks.BLOCK, help="Rows per INSERT.")
+
+    def handle(self, *args, scale, seed, batch_size, **options):
+        sizes = dict(benchmarks.SCALES[scale])
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+
+        self.stdout.write(
+            f"Generating up to {sizes['customers']} customers, {sizes['products']} products and "
+            f"{sizes['orders']} orders of {sizes['lines_per_order']} products (seed {seed})"
+        )
+        benchmarks.generate(
+            **sizes, seed=seed, batch_size=batch_size,
+            progress=lambda message: self.stdout.write(message, ending="\r"),
+        )
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from crm import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Create any missing full-text search tables and triggers and rebuild "
+        "the customer/product search index from the base tables. Use "
+        "--optimize afterwards to merge the index segments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--optimize", action="store_true", help="Merge index segments after rebuilding.")
+
+    def handle(self, *args, database, optimize, **options):
+        connection = connections[database]
+        if not search.fts5_supported(connection):
+            self.stdout.write(
+                f"{connection.vendor} has no FTS5 support; `search` uses the icontains fallback."
+            )
+            return
+
+        started = time.perf_counter()
+        with transaction.atomic(using=database):
+            rebuilt = search.install(connection, rebuild=True)
+            if optimize:
+                for table in rebuilt:
+                    search.optimize(connection, table)
+
+        for table in rebuilt:
+            self.stdout.write(f"Rebuilt {search.fts_table(table)}")
+        self.stdout.write(self.style.SUCCESS(f"Search index ready in {time.perf_counter() - started:.2f}s"))
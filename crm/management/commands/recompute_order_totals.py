@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Order.total_amount as the sum of its lines' unit_price x quantity, "
+        "in primary-key batches. "
+        "Progress is checkpointed after every batch so an interrupted run resumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--checkpoint",
+            default="/tmp/crm_recompute_order_totals.checkpoint",
+            help="File holding the last order id processed.",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore an existing checkpoint and start from the first order.",
+        )
+
+    def handle(self, *args, batch_size, checkpoint, restart, **options):
+        checkpoint = Path(checkpoint)
+        last_id = 0
+        if checkpoint.exists() and not restart:
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after order #{last_id}")
+
+        updated = 0
+        while True:
+            ids = list(
+                Order.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += Order.objects.filter(pk__gt=last_id, pk__lte=ids[-1]).recompute_totals()
+            last_id = ids[-1]
+            checkpoint.write_text(str(last_id))
+            self.stdout.write(f"Recomputed up to order #{last_id} ({updated} orders)")
+
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {updated} orders."))
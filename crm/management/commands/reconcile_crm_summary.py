@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from crm.models import CRMSummary, Customer, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CRMSummary row with a full recount of customers, orders "
+        "and revenue. Use --fix to overwrite the summary with the recount."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Write the recounted totals.")
+
+    def handle(self, *args, fix, **options):
+        with transaction.atomic():
+            summary = CRMSummary.objects.select_for_update().filter(pk=CRMSummary.SINGLETON_PK).first()
+            summary = summary or CRMSummary.current()
+            actual = {
+                "total_customers": Customer.objects.count(),
+                "total_orders": Order.objects.count(),
+                "total_revenue": Order.objects.aggregate(total=Sum("total_amount"))["total"] or Decimal("0.00"),
+            }
+
+            drift = {
+                field: (getattr(summary, field), value)
+                for field, value in actual.items()
+                if getattr(summary, field) != value
+            }
+            if not drift:
+                self.stdout.write(self.style.SUCCESS(f"Summary is consistent: {summary}"))
+                return
+
+            for field, (stored, value) in drift.items():
+                self.stdout.write(self.style.WARNING(f"{field}: summary={stored} recount={value}"))
+
+            if fix:
+                CRMSummary.objects.filter(pk=summary.pk).update(**actual)
+                self.stdout.write(self.style.SUCCESS("Summary updated from recount."))
+            else:
+                self.stdout.write("Run with --fix to correct the summary.")
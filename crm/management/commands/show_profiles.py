@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "List the slowest GraphQL operations captured by the sampled "
+        "profiler (CRM_PROFILER) with their hottest frames, or show one "
+        "capture in detail: frames, document and slowest SQL statements."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("capture", nargs="?", help="Capture id to show in detail.")
+        parser.add_argument("--directory", help="Defaults to CRM_PROFILER['directory'].")
+        parser.add_argument("--limit", type=int, default=10, help="Captures to list.")
+        parser.add_argument("--frames", type=int, default=5, help="Hot frames per capture.")
+        parser.add_argument("--sort", choices=("tottime", "cumulative"), default="tottime")
+
+    def handle(self, *args, capture, directory, limit, frames, sort, **options):
+        directory = directory or profiling.profiler_settings()["directory"]
+        captures = profiling.list_captures(directory)
+        if capture:
+            meta = next((c for c in captures if c["id"] == capture), None)
+            if meta is None:
+                raise CommandError(f"No capture {capture} in {directory}")
+            self.show(directory, meta, max(frames, 25), sort)
+            return
+
+        if not captures:
+            self.stdout.write(f"No captures in {directory}")
+            return
+        self.stdout.write(f"{len(captures)} captures in {directory}; the {min(limit, len(captures))} slowest:")
+        for meta in captures[:limit]:
+            self.stdout.write("")
+            self.summary(meta)
+            self.write_frames(profiling.hot_frames(directory, meta["id"], sort, frames))
+
+    def summary(self, meta):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{meta['id']}  {meta['type']} {meta['operation']}  {meta['duration_ms']:.1f} ms, "
+            f"SQL {meta['sql_ms']:.1f} ms in {len(meta['statements'])} statements"
+        ))
+
+    def write_frames(self, rows):
+        self.stdout.write(f"    {'tottime s':>10} {'cumtime s':>10} {'calls':>8}  function")
+        for function, calls, tottime, cumtime in rows:
+            self.stdout.write(f"    {tottime:>10.4f} {cumtime:>10.4f} {calls:>8}  {function}")
+
+    def show(self, directory, meta, frames, sort):
+        self.summary(meta)
+        self.stdout.write(f"captured {meta['captured_at']}, variables: {', '.join(meta['variables']) or '-'}")
+        self.stdout.write("")
+        self.stdout.write(meta["document"])
+        self.stdout.write("")
+        self.write_frames(profiling.hot_frames(directory, meta["id"], sort, frames))
+
+        statements = meta["statements"]
+        if not statements:
+            return
+        self.stdout.write("\nSlowest SQL statements:")
+        for statement in sorted(statements, key=lambda s: s["ms"], reverse=True)[:10]:
+            self.stdout.write(f"    {statement['ms']:>9.2f} ms  {statement['sql'][:300]}")
+        repeated = [(sql, n) for sql, n in Counter(s["sql"] for s in statements).most_common(5) if n > 1]
+        if repeated:
+            self.stdout.write("\nRepeated SQL statements:")
+            for sql, n in repeated:
+                self.stdout.write(f"    {n:>5}x  {sql[:300]}")
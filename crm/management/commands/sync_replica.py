@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from crm import routing
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the SQLite read replicas, for "
+        "trying the replica routing locally (see crm/routing.py). With "
+        "--interval the copy repeats, so the replicas lag like real ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "replica", nargs="*",
+            help="Replica aliases; defaults to every configured replica.",
+        )
+        parser.add_argument("--interval", type=float, help="Seconds between copies; copy once without it.")
+
+    def handle(self, *args, replica, interval, **options):
+        aliases = replica or routing.replicas()
+        if not aliases:
+            raise CommandError("No read replica is configured; set CRM_REPLICA_DB to a SQLite file.")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if alias not in connections.databases:
+                raise CommandError(f"Unknown database {alias!r}.")
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} is not SQLite; real replicas are kept in sync by the database.")
+
+        while True:
+            started = time.perf_counter()
+            for alias in aliases:
+                self.copy(alias)
+            self.stdout.write(f"Copied {DEFAULT_DB_ALIAS} to {', '.join(aliases)} in {time.perf_counter() - started:.2f}s")
+            if interval is None:
+                return
+            time.sleep(interval)
+
+    def copy(self, alias):
+        # The online backup API copies a consistent snapshot while the primary is in use
+        source = sqlite3.connect(connections.databases[DEFAULT_DB_ALIAS]["NAME"])
+        target = sqlite3.connect(connections.databases[alias]["NAME"])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,285 @@
+"""
+Always-on GraphQL timing and SQL metrics, exposed in the Prometheus text
+format at /metrics.
+
+``record_operation()`` wraps the execution of one operation (the views do
+this). While it is active:
+
+- ``MetricsMiddleware`` (a graphene middleware) times the resolvers of
+  root fields and of object or list fields with a resolver of their own,
+  keyed by their path without list indices (``orders.edges.node.customer``).
+  Scalars and plain attribute reads (``edges``, ``node``) are passed
+  straight through: they issue no SQL and timing them would cost more
+  than they do.
+- A database execute wrapper, installed on every connection as it is
+  created, counts and times the SQL statements of the operation and
+  charges them to the field whose resolver issued them.
+
+Observations are summed per operation and per field path, then added to
+fixed-bucket histograms under one lock acquisition when the operation
+ends, so the hot path never touches shared state. Label sets are capped
+at ``max_series`` per metric; later ones are counted under an
+``__overflow__`` series. Nothing is kept per statement, unlike
+graphene_django's DjangoDebugMiddleware.
+
+The histograms are per process: with several worker processes, scrape
+each of them.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from inspect import isawaitable
+
+from django.conf import settings
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphql import get_named_type, is_leaf_type
+
+
+DEFAULT_METRICS = {
+    "enabled": True,
+    "max_series": 1000,
+}
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+
+OVERFLOW = "__overflow__"
+
+# graphene's attribute/key resolvers: no SQL, not worth timing
+DEFAULT_RESOLVERS = (attr_resolver, dict_or_attr_resolver, dict_resolver)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_settings():
+    return {**DEFAULT_METRICS, **getattr(settings, "CRM_METRICS", {})}
+
+
+# ---------------------------------------------------------
+# Histograms
+# ---------------------------------------------------------
+
+class Histogram:
+    """Prometheus histogram with fixed buckets and a bounded number of label sets."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label_values, value, max_series):
+        series = self.series.get(label_values)
+        if series is None:
+            if len(self.series) >= max_series:
+                label_values = (OVERFLOW,) * len(self.labels)
+                series = self.series.get(label_values)
+            if series is None:
+                # One counter per bucket (not cumulative), then the sum
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        operation = ("operation", "type")
+        field = ("operation", "path")
+        self.operation_seconds = Histogram(
+            "crm_graphql_operation_seconds", "GraphQL operation execution time.", operation, SECONDS_BUCKETS)
+        self.operation_queries = Histogram(
+            "crm_graphql_operation_sql_queries", "SQL statements per GraphQL operation.", operation,
+            QUERY_COUNT_BUCKETS)
+        self.operation_sql_seconds = Histogram(
+            "crm_graphql_operation_sql_seconds", "SQL time per GraphQL operation.", operation, SECONDS_BUCKETS)
+        self.field_seconds = Histogram(
+            "crm_graphql_field_seconds", "Resolver time per field path and operation.", field, SECONDS_BUCKETS)
+        self.field_queries = Histogram(
+            "crm_graphql_field_sql_queries", "SQL statements per field path and operation.", field,
+            QUERY_COUNT_BUCKETS)
+        self.field_sql_seconds = Histogram(
+            "crm_graphql_field_sql_seconds", "SQL time per field path and operation.", field, SECONDS_BUCKETS)
+
+    def histograms(self):
+        return (
+            self.operation_seconds, self.operation_queries, self.operation_sql_seconds,
+            self.field_seconds, self.field_queries, self.field_sql_seconds,
+        )
+
+    def add(self, recording, max_series):
+        labels = (recording.name, recording.type)
+        with self.lock:
+            self.operation_seconds.observe(labels, recording.seconds, max_series)
+            self.operation_queries.observe(labels, recording.queries, max_series)
+            self.operation_sql_seconds.observe(labels, recording.sql_seconds, max_series)
+            for path, (seconds, queries, sql_seconds) in recording.fields.items():
+                labels = (recording.name, path)
+                self.field_seconds.observe(labels, seconds, max_series)
+                self.field_queries.observe(labels, queries, max_series)
+                self.field_sql_seconds.observe(labels, sql_seconds, max_series)
+
+    def render(self):
+        with self.lock:
+            return "\n".join(h.render() for h in self.histograms()) + "\n"
+
+    def clear(self):
+        with self.lock:
+            for histogram in self.histograms():
+                histogram.series.clear()
+
+
+registry = Registry()
+
+
+# ---------------------------------------------------------
+# Recording
+# ---------------------------------------------------------
+
+class Recording:
+    """Totals of one operation, and of each field path within it."""
+
+    __slots__ = ("name", "type", "seconds", "queries", "sql_seconds", "fields")
+
+    def __init__(self, name, type_):
+        self.name = name
+        self.type = type_
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        # path -> [resolver seconds, SQL statements, SQL seconds]
+        self.fields = {}
+
+    def field(self, path):
+        totals = self.fields.get(path)
+        if totals is None:
+            totals = self.fields[path] = [0.0, 0, 0.0]
+        return totals
+
+
+_recording = ContextVar("crm_metrics_recording", default=None)
+_field = ContextVar("crm_metrics_field", default=None)
+
+
+@contextmanager
+def record_operation(operation):
+    """Collect the metrics of executing ``operation`` (an OperationDefinitionNode) inside the block."""
+    config = metrics_settings()
+    if not config["enabled"]:
+        yield None
+        return
+    name = operation.name.value if operation.name else "anonymous"
+    recording = Recording(name, operation.operation.value)
+    token = _recording.set(recording)
+    started = time.perf_counter()
+    try:
+        yield recording
+    finally:
+        recording.seconds = time.perf_counter() - started
+        _recording.reset(token)
+        registry.add(recording, config["max_series"])
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    recording = _recording.get()
+    if recording is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        recording.queries += 1
+        recording.sql_seconds += elapsed
+        path = _field.get()
+        if path is not None:
+            totals = recording.field(path)
+            totals[1] += 1
+            totals[2] += elapsed
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def field_path(path):
+    keys = []
+    while path is not None:
+        if isinstance(path.key, str):
+            keys.append(path.key)
+        path = path.prev
+    return ".".join(reversed(keys))
+
+
+def is_timed(info):
+    """Root fields, and object or list fields with a resolver of their own."""
+    if info.path.prev is None:
+        return True
+    if is_leaf_type(get_named_type(info.return_type)):
+        return False
+    resolve = info.parent_type.fields[info.field_name].resolve
+    return getattr(resolve, "func", None) not in DEFAULT_RESOLVERS
+
+
+class MetricsMiddleware:
+    """Graphene middleware timing resolvers; see the module docstring."""
+
+    def __init__(self):
+        # (parent type, field name) -> whether to time it
+        self._timed = {}
+
+    def resolve(self, next, root, info, **args):
+        # Most fields are scalars: decide on them before anything else
+        key = (info.parent_type, info.field_name)
+        timed = self._timed.get(key)
+        if timed is None:
+            timed = self._timed[key] = is_timed(info)
+        if not timed:
+            return next(root, info, **args)
+        recording = _recording.get()
+        if recording is None:
+            return next(root, info, **args)
+
+        path = field_path(info.path)
+        token = _field.set(path)
+        started = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+        finally:
+            _field.reset(token)
+            elapsed = time.perf_counter() - started
+            recording.field(path)[0] += elapsed
+        if isawaitable(result):
+            return self._await(result, recording, path)
+        return result
+
+    async def _await(self, awaitable, recording, path):
+        token = _field.set(path)
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            _field.reset(token)
+            recording.field(path)[0] += time.perf_counter() - started
+
@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.utils.timezone
+
+
+def populate_summary(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    CRMSummary = apps.get_model('crm', 'CRMSummary')
+    CRMSummary.objects.update_or_create(
+        pk=1,
+        defaults={
+            'total_customers': Customer.objects.count(),
+            'total_orders': Order.objects.count(),
+            'total_revenue': Order.objects.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00'),
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_order_date_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CRMSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_customers', models.BigIntegerField(default=0)),
+                ('total_orders', models.BigIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+import crm.search
+
+
+def install_search_index(apps, schema_editor):
+    crm.search.install(schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    crm.search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_crmsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSearchDocument',
+            fields=[
+                ('customer', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='crm.customer')),
+                ('document', crm.search.SearchDocumentField(db_column='crm_customer_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'crm_customer_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='crm.product')),
+                ('document', crm.search.SearchDocumentField(db_column='crm_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'crm_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('source', models.CharField(max_length=500)),
+                ('source_size', models.BigIntegerField()),
+                ('source_mtime', models.FloatField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('chunks_done', models.PositiveIntegerField(default=0)),
+                ('rows_imported', models.BigIntegerField(default=0)),
+                ('rows_rejected', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'source'), name='crm_import_checkpoint_source_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='next', to='crm.reportsnapshot')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_customer_id', models.BigIntegerField(default=0)),
+                ('last_order_id', models.BigIntegerField(default=0)),
+                ('new_customers', models.BigIntegerField(default=0)),
+                ('new_orders', models.BigIntegerField(default=0)),
+                ('new_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('total_customers', models.BigIntegerField(default=0)),
+                ('total_orders', models.BigIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+        ),
+    ]
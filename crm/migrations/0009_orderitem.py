@@ -0,0 +1,70 @@
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_tables(apps, schema_editor):
+    quote = schema_editor.connection.ops.quote_name
+    Order = apps.get_model('crm', 'Order')
+    return (
+        quote(Order._meta.get_field('products').remote_field.through._meta.db_table),
+        quote(apps.get_model('crm', 'OrderItem')._meta.db_table),
+        quote(apps.get_model('crm', 'Product')._meta.db_table),
+    )
+
+
+def copy_to_items(apps, schema_editor):
+    # One INSERT ... SELECT: every old line is one unit at the current price
+    through, items, product = link_tables(apps, schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {items} (order_id, product_id, quantity, unit_price) '
+            f'SELECT l.order_id, l.product_id, 1, p.price FROM {through} l '
+            f'JOIN {product} p ON p.id = l.product_id ORDER BY l.id'
+        )
+
+
+def copy_to_through(apps, schema_editor):
+    through, items, product = link_tables(apps, schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {through} (order_id, product_id) SELECT order_id, product_id FROM {items} ORDER BY id'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_orderreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='crm_orderitem_order_product_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_to_items, copy_to_through),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+        ),
+        # Built after the copy rather than maintained during it
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product', 'order'], name='crm_orderitem_prod_order_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_order_customer_no_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='crm_order_total_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='crm_product_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='crm_product_stock_idx',
+        ),
+    ]
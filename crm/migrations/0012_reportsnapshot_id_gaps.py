@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_drop_filter_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportsnapshot',
+            name='customer_id_gaps',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='reportsnapshot',
+            name='order_id_gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
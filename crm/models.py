@@ -1,7 +1,15 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connections, models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.sql import UpdateQuery
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, RegexValidator
 from django.utils import timezone
 
+from .response_cache import bump_model_versions
+from .search import SearchDocumentField
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
@@ -20,28 +28,439 @@ class Customer(models.Model):
         return self.name
 
 
+def supports_update_returning(connection):
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+class InsufficientStock(Exception):
+    """A reservation asked for more of a product than is in stock."""
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f"Insufficient stock for product {product_id}.")
+
+
+class ProductQuerySet(models.QuerySet):
+    def reserve(self, quantities):
+        """
+        Take ``quantities`` ({product pk: quantity}) off stock, all or
+        nothing. Each line is one conditional
+        ``UPDATE ... SET stock = stock - q WHERE id = pk AND stock >= q``,
+        which checks and takes the stock in the same statement: there is no
+        read-modify-write for concurrent orders to serialize on. Lines run
+        in pk order, so two orders cannot deadlock, in one transaction:
+        when a line cannot be met the earlier ones are rolled back and
+        InsufficientStock is raised for it.
+        """
+        with transaction.atomic(using=self.db):
+            for pk, quantity in sorted(quantities.items()):
+                if not self.filter(pk=pk, stock__gte=quantity).update(stock=F("stock") - quantity):
+                    raise InsufficientStock(pk)
+        if quantities:
+            bump_model_versions(self.model)
+
+    def restock(self, amount):
+        """
+        Add ``amount`` to the stock of every product in the queryset with one
+        ``UPDATE ... SET stock = stock + amount`` and return the primary keys
+        of the updated rows, read back with RETURNING where supported.
+        """
+        connection = connections[self.db]
+        if supports_update_returning(connection):
+            query = self.query.chain(UpdateQuery)
+            query.add_update_values({"stock": F("stock") + amount})
+            sql, params = query.get_compiler(self.db).as_sql()
+            pk = connection.ops.quote_name(self.model._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f"{sql} RETURNING {pk}", params)
+                ids = [row[0] for row in cursor.fetchall()]
+        else:
+            with transaction.atomic(using=self.db):
+                ids = list(self.select_for_update().values_list("pk", flat=True))
+                self.model._default_manager.filter(pk__in=ids).update(stock=F("stock") + amount)
+
+        if ids:
+            bump_model_versions(self.model)
+        return sorted(ids)
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     stock = models.PositiveIntegerField(default=0)
 
+    # price and stock are not indexed: ProductFilter pages are read in id
+    # order, so the planner walks the primary key and stops after a page
+    # rather than sorting an index range
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
 
+# quantity * unit_price of an OrderItem
+LINE_TOTAL = ExpressionWrapper(
+    F("quantity") * F("unit_price"), output_field=models.DecimalField(max_digits=20, decimal_places=2),
+)
+
+
+class OrderQuerySet(models.QuerySet):
+    def recompute_totals(self):
+        """Set total_amount from the order lines in one UPDATE."""
+        line_totals = (
+            self.model.products.through.objects
+            .filter(order_id=OuterRef("pk"))
+            .order_by()
+            .values("order_id")
+            .annotate(total=Sum(LINE_TOTAL))
+            .values("total")
+        )
+        before = self.revenue()
+        updated = self.update(
+            total_amount=Coalesce(
+                Subquery(line_totals), Value(Decimal("0.00")),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+        CRMSummary.adjust(revenue=self.revenue() - before)
+        bump_model_versions(Order)
+        return updated
+
+    def add_to_totals(self, amount):
+        updated = self.update(total_amount=F("total_amount") + amount)
+        CRMSummary.adjust(revenue=amount * updated)
+        bump_model_versions(Order)
+        return updated
+
+    def revenue(self):
+        return self.aggregate(total=Sum("total_amount"))["total"] or Decimal("0.00")
+
+
 class Order(models.Model):
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
-    products = models.ManyToManyField(Product, related_name="orders")
+    # Indexed by crm_order_cust_date_idx, which starts with customer
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders", db_index=False)
+    products = models.ManyToManyField(Product, through="OrderItem", related_name="orders")
     order_date = models.DateTimeField(default=timezone.now)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
-    def save(self, *args, **kwargs):
-        # Calculate total price automatically
-        if self.pk:
-            total = sum(p.price for p in self.products.all())
-            self.total_amount = total
-        super().save(*args, **kwargs)
+    # total_amount is kept in step with the order's lines by crm.signals
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of Query.orders seeks on (order_date, id)
+            models.Index(fields=["order_date", "id"], name="crm_order_date_id_idx"),
+            # A customer's orders by date
+            models.Index(fields=["customer", "order_date"], name="crm_order_cust_date_idx"),
+            # total_amount ranges are filtered along the (order_date, id) index
+        ]
 
     def __str__(self):
         return f"Order #{self.pk} - {self.customer.name}"
 
+
+class OrderItemQuerySet(models.QuerySet):
+    def revenue(self):
+        return self.aggregate(total=Sum(LINE_TOTAL))["total"] or Decimal("0.00")
+
+    def sales_by_product(self):
+        """Units sold and revenue per ``product_id``, from this table alone."""
+        return (
+            self.order_by()
+            .values("product_id")
+            .annotate(units=Sum("quantity"), revenue=Sum(LINE_TOTAL))
+        )
+
+
+class OrderItem(models.Model):
+    """
+    One line of an order: a quantity of a product at its price when it
+    was ordered. Later price changes do not touch existing orders, and
+    totals are summed from this table without joining Product.
+    """
+    # Both columns are indexed by the composite indexes below
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items", db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="order_items", db_index=False)
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = OrderItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["order", "product"], name="crm_orderitem_order_product_uniq"),
+        ]
+        indexes = [
+            # A product's orders, and the product filters of OrderFilter
+            models.Index(fields=["product", "order"], name="crm_orderitem_prod_order_idx"),
+        ]
+
+    @property
+    def total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} @ {self.unit_price} (order #{self.order_id})"
+
+
+def order_quantities(lines):
+    """
+    Normalize ``(product id, quantity)`` lines, as clients send them, into
+    {product pk: quantity}. A product listed more than once is ordered
+    that many times. Raises ValueError when there are no lines, a
+    quantity is below 1 or an id is not an integer.
+    """
+    if not lines:
+        raise ValueError("At least one product must be selected")
+    quantities = {}
+    for product_id, quantity in lines:
+        if quantity is None or quantity < 1:
+            raise ValueError("Quantities must be at least 1")
+        try:
+            pk = int(product_id)
+        except (TypeError, ValueError):
+            raise ValueError("One or more product IDs are invalid")
+        quantities[pk] = quantities.get(pk, 0) + quantity
+    return quantities
+
+
+
+class CRMSummary(models.Model):
+    """
+    Single-row running totals behind Query.totalCustomers/totalOrders/
+    totalRevenue, adjusted in the same transaction as the rows they count
+    (see crm.signals) so reading them never scans the big tables.
+    """
+    total_customers = models.BigIntegerField(default=0)
+    total_orders = models.BigIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_PK = 1
+
+    @classmethod
+    def current(cls):
+        # A plain read first, so it can be served by a replica
+        summary = cls.objects.filter(pk=cls.SINGLETON_PK).first()
+        if summary is None:
+            summary, _ = cls.objects.get_or_create(pk=cls.SINGLETON_PK)
+        return summary
+
+    @classmethod
+    def adjust(cls, customers=0, orders=0, revenue=0):
+        if not (customers or orders or revenue):
+            return
+        changes = dict(
+            total_customers=F("total_customers") + customers,
+            total_orders=F("total_orders") + orders,
+            total_revenue=F("total_revenue") + revenue,
+            updated_at=timezone.now(),
+        )
+        if not cls.objects.filter(pk=cls.SINGLETON_PK).update(**changes):
+            cls.current()
+            cls.objects.filter(pk=cls.SINGLETON_PK).update(**changes)
+
+    def __str__(self):
+        return f"{self.total_customers} customers, {self.total_orders} orders, {self.total_revenue} revenue"
+
+
+# Gap ranges checked per query, well under SQLite's expression depth limit
+GAP_RANGES_PER_QUERY = 100
+
+
+def _id_gaps(queryset, since, last):
+    """[first, last] ranges of primary keys in (since, last] with no visible row."""
+    gaps, expected = [], since + 1
+    rows = queryset.filter(pk__gt=since, pk__lte=last).order_by("pk").values_list("pk", flat=True)
+    for pk in rows.iterator():
+        if pk > expected:
+            gaps.append([expected, pk - 1])
+        expected = pk + 1
+    return gaps
+
+
+def _aggregate_in_ranges(queryset, ranges, **aggregates):
+    """Sum ``aggregates`` over the rows whose primary key falls in ``ranges``."""
+    totals = dict.fromkeys(aggregates, 0)
+    for start in range(0, len(ranges), GAP_RANGES_PER_QUERY):
+        condition = Q()
+        for first, last in ranges[start:start + GAP_RANGES_PER_QUERY]:
+            condition |= Q(pk__range=(first, last))
+        for name, value in queryset.filter(condition).aggregate(**aggregates).items():
+            totals[name] += value or 0
+    return totals
+
+
+class ReportSnapshot(models.Model):
+    """
+    One run of the weekly CRM report: the customers and orders created
+    since the previous snapshot, and running totals carried forward from
+    it. The watermarks are the highest primary keys included, so each run
+    reads only the new rows by an index range and costs the same however
+    long the history is.
+
+    Keys are allocated when a row is inserted but the row is only visible
+    once its transaction commits, so a run can see a key while a lower
+    one is still in flight. The key ranges under the watermarks that had
+    no visible row are stored with the snapshot (a count equal to the
+    range size means there are none), and the next run also counts the
+    rows that have appeared in them since. This assumes no transaction
+    inserting customers or orders stays open across two runs; gaps still
+    empty then (rollbacks, deleted rows) are dropped.
+
+    Totals count rows as they were when first reported; later changes to
+    old orders and deletions are not replayed (CRMSummary has live totals).
+    """
+    # Unique, so two concurrent runs cannot both extend the same snapshot
+    previous = models.OneToOneField(
+        "self", null=True, blank=True, on_delete=models.PROTECT, related_name="next",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    last_customer_id = models.BigIntegerField(default=0)
+    last_order_id = models.BigIntegerField(default=0)
+    # [first, last] key ranges under the watermarks with no visible row
+    customer_id_gaps = models.JSONField(default=list)
+    order_id_gaps = models.JSONField(default=list)
+    new_customers = models.BigIntegerField(default=0)
+    new_orders = models.BigIntegerField(default=0)
+    new_revenue = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    total_customers = models.BigIntegerField(default=0)
+    total_orders = models.BigIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    @classmethod
+    def take(cls):
+        """Record a snapshot of everything created since the latest one."""
+        with transaction.atomic():
+            previous = cls.objects.select_for_update().order_by("-pk").first()
+            since_customer = previous.last_customer_id if previous else 0
+            since_order = previous.last_order_id if previous else 0
+
+            # MAX(pk) is one index lookup; the counts scan only the new range
+            last_customer = max(Customer.objects.aggregate(last=Max("pk"))["last"] or 0, since_customer)
+            last_order = max(Order.objects.aggregate(last=Max("pk"))["last"] or 0, since_order)
+            new_customers = Customer.objects.filter(pk__gt=since_customer, pk__lte=last_customer).count()
+            orders = Order.objects.filter(pk__gt=since_order, pk__lte=last_order).aggregate(
+                count=Count("pk"), revenue=Sum("total_amount"),
+            )
+            customer_gaps = (
+                _id_gaps(Customer.objects.all(), since_customer, last_customer)
+                if new_customers < last_customer - since_customer else []
+            )
+            order_gaps = (
+                _id_gaps(Order.objects.all(), since_order, last_order)
+                if orders["count"] < last_order - since_order else []
+            )
+
+            # Rows committed since the previous run under its watermarks
+            if previous:
+                new_customers += _aggregate_in_ranges(
+                    Customer.objects.all(), previous.customer_id_gaps, count=Count("pk"),
+                )["count"]
+                late = _aggregate_in_ranges(
+                    Order.objects.all(), previous.order_id_gaps, count=Count("pk"), revenue=Sum("total_amount"),
+                )
+                orders["count"] += late["count"]
+                orders["revenue"] = (orders["revenue"] or 0) + late["revenue"]
+            new_revenue = (orders["revenue"] or Decimal("0")).quantize(Decimal("0.01"))
+
+            snapshot = cls.objects.create(
+                previous=previous,
+                last_customer_id=last_customer,
+                last_order_id=last_order,
+                customer_id_gaps=customer_gaps,
+                order_id_gaps=order_gaps,
+                new_customers=new_customers,
+                new_orders=orders["count"],
+                new_revenue=new_revenue,
+                total_customers=(previous.total_customers if previous else 0) + new_customers,
+                total_orders=(previous.total_orders if previous else 0) + orders["count"],
+                total_revenue=(previous.total_revenue if previous else Decimal("0")) + new_revenue,
+            )
+            bump_model_versions(cls)
+        return snapshot
+
+    def __str__(self):
+        return (
+            f"{self.total_customers} customers (+{self.new_customers}), "
+            f"{self.total_orders} orders (+{self.new_orders}), "
+            f"{self.total_revenue} revenue (+{self.new_revenue})"
+        )
+
+
+class OrderReminder(models.Model):
+    """
+    Idempotency record of the reminder for one order (crm/reminders.py).
+    A worker claims the row before sending and stamps ``sent_at`` after,
+    so an order is reminded once however often its batch is delivered.
+    """
+    order = models.OneToOneField(Order, primary_key=True, on_delete=models.CASCADE, related_name="reminder")
+    claim = models.CharField(max_length=32)
+    claimed_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        state = f"sent {self.sent_at:%Y-%m-%d %H:%M}" if self.sent_at else "pending"
+        return f"Reminder for order #{self.order_id}: {state}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of one bulk import (crm/imports.py), saved in the same
+    transaction as each chunk it counts so a rerun resumes exactly after
+    the last committed chunk.
+    """
+    kind = models.CharField(max_length=20)
+    source = models.CharField(max_length=500)
+    source_size = models.BigIntegerField()
+    source_mtime = models.FloatField()
+    chunk_size = models.PositiveIntegerField()
+    chunks_done = models.PositiveIntegerField(default=0)
+    rows_imported = models.BigIntegerField(default=0)
+    rows_rejected = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "source"], name="crm_import_checkpoint_source_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} from {self.source}: {self.chunks_done} chunks, {self.rows_imported} rows"
+
+
+# ---------------------------------------------------------
+# Full-text search documents (SQLite FTS5 tables, see crm/search.py)
+# ---------------------------------------------------------
+
+class CustomerSearchDocument(models.Model):
+    """Read-only row of the customer search index, joined on rowid."""
+    customer = models.OneToOneField(
+        Customer, primary_key=True, db_column="rowid", db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name="search_document",
+    )
+    document = SearchDocumentField(db_column="crm_customer_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "crm_customer_fts"
+
+
+class ProductSearchDocument(models.Model):
+    """Read-only row of the product search index, joined on rowid."""
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column="rowid", db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name="search_document",
+    )
+    document = SearchDocumentField(db_column="crm_product_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "crm_product_fts"
@@ -0,0 +1,248 @@
+"""
+Keyset (seek) pagination for the CRM Relay connections.
+
+Cursors encode the values of the ordering columns of the last row seen,
+so each page is a ``WHERE (k1, k2) > (v1, v2) ORDER BY k1, k2 LIMIT n``
+query that stays as cheap on page 10,000 as on page 1, unlike OFFSET.
+"""
+import base64
+import json
+from collections import defaultdict
+from functools import partial
+from inspect import isawaitable
+
+from graphene import relay
+from graphene.types.argument import to_arguments
+from graphql import GraphQLError
+from graphene_django.filter.utils import get_filtering_args_from_filterset
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils.dateparse import parse_datetime
+
+from .loaders import get_loaders
+from .search import RANK
+
+
+DEFAULT_MAX_PAGE_SIZE = 100
+
+
+def max_page_size():
+    return getattr(settings, "CRM_MAX_PAGE_SIZE", DEFAULT_MAX_PAGE_SIZE)
+
+
+def page_size(first, last=None):
+    """The requested page size, or the maximum when none is given."""
+    limit = max_page_size()
+    size = first if first is not None else last
+    if size is None:
+        return limit
+    if size < 0:
+        raise GraphQLError("Page size must be a non-negative integer.")
+    if size > limit:
+        raise GraphQLError(
+            f"Requesting {size} records on the connection exceeds the limit of {limit} records."
+        )
+    return size
+
+
+# ---------------------------------------------------------
+# Cursor encoding
+# ---------------------------------------------------------
+
+def encode_cursor(values):
+    payload = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, ordering, model):
+    """The ordering values in ``cursor``, checked against the fields of ``model``."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    decoded = [cursor_value(model, field, value) for field, value in zip(ordering, values)]
+    if any(value is None for value in decoded):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    return decoded
+
+
+def cursor_value(model, name, value):
+    """``value`` as a query value for ``name``, or None when its type does not fit."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = None  # an annotation: the search rank
+    if isinstance(field, models.DateTimeField):
+        try:
+            return parse_datetime(value) if isinstance(value, str) else None
+        except ValueError:
+            return None
+    if isinstance(field, models.IntegerField):
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if field is None or isinstance(field, (models.FloatField, models.DecimalField)):
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return value if isinstance(value, str) else None
+
+
+def keyset_filter(ordering, values, forward=True):
+    """Build the lexicographic ``(k1, k2, ...) > (v1, v2, ...)`` predicate."""
+    op = "gt" if forward else "lt"
+    condition = Q()
+    for i, field in enumerate(ordering):
+        equal = {ordering[j]: values[j] for j in range(i)}
+        condition |= Q(**equal, **{f"{field}__{op}": values[i]})
+    return condition
+
+
+def row_cursor(row, ordering):
+    return encode_cursor([getattr(row, field) for field in ordering])
+
+
+# ---------------------------------------------------------
+# Connection field
+# ---------------------------------------------------------
+
+class KeysetConnectionField(relay.ConnectionField):
+    """
+    Relay connection over a queryset, filtered by a django-filter FilterSet
+    and paged with keyset cursors on ``ordering``.
+
+    The parent resolver returns the base queryset; ``expect`` names the
+    loader registration hook used for the rows of each page.
+
+    A connection nested in another type sets ``batch_by`` to the lookup
+    from its rows to the parent (``customer_id``). Its resolver then
+    returns the queryset for all parents, and the pages of every parent
+    registered with the loaders are fetched in one query, numbering rows
+    per parent with ROW_NUMBER() instead of one LIMIT query per parent.
+    """
+
+    def __init__(self, type_, filterset_class, ordering=("id",), expect=None, batch_by=None, **kwargs):
+        self.filterset_class = filterset_class
+        self.ordering = tuple(ordering)
+        self.expect = expect
+        self.batch_by = batch_by
+        self._filtering_args = None
+        super().__init__(type_, **kwargs)
+
+    # Resolved lazily, so ``type_`` may be a lambda for connections nested
+    # in the types they page (CustomerType.orders -> OrderConnection)
+    @property
+    def filtering_args(self):
+        if self._filtering_args is None:
+            self._filtering_args = get_filtering_args_from_filterset(self.filterset_class, self.type._meta.node)
+        return self._filtering_args
+
+    @property
+    def args(self):
+        return to_arguments(self._base_args or {}, self.filtering_args)
+
+    @args.setter
+    def args(self, args):
+        self._base_args = args
+
+    def get_page_size(self, first, last):
+        return page_size(first, last)
+
+    def filter_queryset(self, queryset, info, args):
+        data = {k: v for k, v in args.items() if k in self.filtering_args}
+        filterset = self.filterset_class(data=data, queryset=queryset, request=info.context)
+        if not filterset.is_valid():
+            raise GraphQLError(filterset.form.errors.as_json())
+        return filterset.qs
+
+    def keyset_resolver(self, resolver, root, info, **args):
+        first, last = args.get("first"), args.get("last")
+        after, before = args.get("after"), args.get("before")
+        if first is not None and last is not None:
+            raise GraphQLError("Pass either `first` or `last`, not both.")
+        page_size = self.get_page_size(first, last)
+        forward = last is None
+
+        queryset = self.filter_queryset(resolver(root, info, **args), info, args)
+        keys = self.ordering
+        if RANK in queryset.query.annotations:
+            # A `search` filter was applied: best matches first, ties by the usual keys
+            keys = (RANK,) + keys
+        if after:
+            queryset = queryset.filter(keyset_filter(keys, decode_cursor(after, keys, queryset.model)))
+        if before:
+            queryset = queryset.filter(
+                keyset_filter(keys, decode_cursor(before, keys, queryset.model), forward=False)
+            )
+
+        ordering = keys if forward else tuple(f"-{field}" for field in keys)
+        build = partial(self.build_connection, info, keys, page_size, forward, after, before)
+        if self.batch_by is not None:
+            return self.batched_page(root, info, args, queryset, ordering, page_size, build)
+        page = queryset.order_by(*ordering)[:page_size + 1]
+        if get_loaders(info).is_async:
+            return self.fetch_async(page, build)
+        return build(list(page))
+
+    @staticmethod
+    async def fetch_async(page, build):
+        return build([row async for row in page])
+
+    def batched_page(self, root, info, args, queryset, ordering, page_size, build):
+        loaders = get_loaders(info)
+
+        def load_pages(parent_ids):
+            rows = (
+                queryset.filter(**{f"{self.batch_by}__in": parent_ids})
+                .annotate(
+                    _parent_id=F(self.batch_by),
+                    _row_number=Window(RowNumber(), partition_by=F(self.batch_by), order_by=ordering),
+                )
+                .filter(_row_number__lte=page_size + 1)
+                .order_by(*ordering)
+            )
+            pages = defaultdict(list)
+            for row in rows:
+                pages[row._parent_id].append(row)
+            if self.expect is not None:
+                # Register every page at once, so the rows' own loaders batch across parents
+                getattr(loaders, self.expect)([row for page in pages.values() for row in page])
+            return pages
+
+        key = (id(self), repr(sorted(args.items())))
+        page = loaders.page_loader(key, type(root)._meta.model_name, load_pages).load(root.pk)
+        if isawaitable(page):
+            return self.build_async(page, build)
+        return build(page)
+
+    @staticmethod
+    async def build_async(page, build):
+        return build(await page)
+
+    def build_connection(self, info, keys, page_size, forward, after, before, rows):
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not forward:
+            rows.reverse()
+
+        if self.expect is not None:
+            getattr(get_loaders(info), self.expect)(rows)
+
+        connection_type = self.type
+        edges = [
+            connection_type.Edge(node=row, cursor=row_cursor(row, keys))
+            for row in rows
+        ]
+        page_info = relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_next_page=has_more if forward else bool(before),
+            has_previous_page=has_more if not forward else bool(after),
+        )
+        return connection_type(edges=edges, page_info=page_info)
+
+    def wrap_resolve(self, parent_resolver):
+        resolver = super(relay.ConnectionField, self).wrap_resolve(parent_resolver)
+        return partial(self.keyset_resolver, resolver)
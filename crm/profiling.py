@@ -0,0 +1,196 @@
+"""
+Sampled profiling of slow GraphQL operations.
+
+When ``CRM_PROFILER['enabled']`` is set, the GraphQL view profiles a
+random ``sample_rate`` fraction of executed operations with cProfile and
+records their SQL statements. Only operations slower than
+``threshold_ms`` are kept. Each one is written to ``directory`` as a
+pstats file (``.prof``, readable by pstats or snakeviz) and a JSON
+sidecar with the operation, its timing and the SQL statements. The
+directory is pruned oldest-first to ``max_files`` and ``max_bytes``.
+
+cProfile follows the executing thread only. The ASGI view runs queries
+on the event loop, where a profile would mix in other requests, so only
+the WSGI view and mutations (run in a worker thread by both views) are
+profiled.
+
+``show_profiles`` lists the slowest captures and their hot frames.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils import timezone
+from graphql import print_ast
+
+
+DEFAULT_PROFILER = {
+    "enabled": False,
+    "sample_rate": 0.01,
+    "threshold_ms": 500,
+    "directory": os.path.join(tempfile.gettempdir(), "crm-profiles"),
+    "max_files": 200,
+    "max_bytes": 100 * 1024 * 1024,
+}
+
+# Per capture, to keep one pathological operation from filling the directory
+MAX_STATEMENTS = 1000
+MAX_SQL_LENGTH = 2000
+
+
+def profiler_settings():
+    return {**DEFAULT_PROFILER, **getattr(settings, "CRM_PROFILER", {})}
+
+
+# ---------------------------------------------------------
+# Capture
+# ---------------------------------------------------------
+
+_statements = ContextVar("crm_profiler_statements", default=None)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    statements = _statements.get()
+    if statements is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if len(statements) < MAX_STATEMENTS:
+            statements.append({
+                "sql": sql[:MAX_SQL_LENGTH],
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+                "many": many,
+            })
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+@contextmanager
+def profile_operation(document, operation, variables=None):
+    """Profile the block if this operation is sampled, and keep it if slow."""
+    config = profiler_settings()
+    if not config["enabled"] or random.random() >= config["sample_rate"]:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (a debugger, a profiling server) owns this thread
+        yield
+        return
+
+    statements = []
+    token = _statements.set(statements)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _statements.reset(token)
+        if elapsed_ms >= config["threshold_ms"]:
+            save_capture(config, profiler, {
+                "operation": operation.name.value if operation.name else "anonymous",
+                "type": operation.operation.value,
+                "duration_ms": round(elapsed_ms, 3),
+                "sql_ms": round(sum(s["ms"] for s in statements), 3),
+                "captured_at": timezone.now().isoformat(),
+                "document": print_ast(document),
+                # Names only: values may be personal data
+                "variables": sorted(variables or {}),
+                "statements": statements,
+            })
+
+
+# ---------------------------------------------------------
+# Storage
+# ---------------------------------------------------------
+
+def save_capture(config, profiler, meta):
+    directory = config["directory"]
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    name = f"{stamp}-{int(meta['duration_ms'])}ms-{meta['operation'][:40]}"
+    name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    base = os.path.join(directory, name)
+
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    prune(directory, config["max_files"], config["max_bytes"])
+    return name
+
+
+def prune(directory, max_files, max_bytes):
+    """Delete the oldest captures until both limits hold."""
+    captures = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            base = entry.path[:-len(".json")]
+            size = entry.stat().st_size
+            if os.path.exists(base + ".prof"):
+                size += os.path.getsize(base + ".prof")
+            captures.append((entry.stat().st_mtime, base, size))
+
+    captures.sort()
+    total = sum(size for _, _, size in captures)
+    while captures and (len(captures) > max_files or total > max_bytes):
+        _, base, size = captures.pop(0)
+        for suffix in (".prof", ".json"):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def list_captures(directory):
+    """Metadata of every capture in ``directory``, slowest first, with its ``id``."""
+    captures = []
+    if not os.path.isdir(directory):
+        return captures
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta["id"] = entry.name[:-len(".json")]
+        captures.append(meta)
+    captures.sort(key=lambda meta: meta["duration_ms"], reverse=True)
+    return captures
+
+
+def hot_frames(directory, capture_id, sort="tottime", limit=10):
+    """
+    ``(function, calls, tottime s, cumtime s)`` of the ``limit`` most
+    expensive frames of a capture, ``function`` as ``file:line(name)``.
+    """
+    stats = pstats.Stats(os.path.join(directory, capture_id + ".prof"))
+    index = {"tottime": 2, "cumulative": 3}[sort]
+    rows = [
+        (func, nc, tt, ct)
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items()
+    ]
+    rows.sort(key=lambda row: row[index], reverse=True)
+    return [
+        (f"{os.path.join(*file.split(os.sep)[-2:])}:{line}({name})" if line else name, calls, tt, ct)
+        for (file, line, name), calls, tt, ct in rows[:limit]
+    ]
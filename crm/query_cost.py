@@ -0,0 +1,155 @@
+"""
+Static cost analysis of GraphQL operations.
+
+Runs on the parsed document before any resolver, so an operation that
+would fan out through nested lists is rejected instead of pinning a
+worker. The cost of a field is its weight plus the cost of its selection
+multiplied by the number of items it can return:
+
+* connections and lists with ``first``/``last`` use that page size;
+* connections without one use the maximum page size;
+* other list fields use ``default_list_size``.
+
+Budgets and weights come from ``settings.CRM_QUERY_COST``.
+"""
+from django.conf import settings
+from graphql import (
+    FieldNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode,
+    get_named_type, get_nullable_type, is_list_type, value_from_ast,
+)
+
+from .pagination import max_page_size
+
+
+DEFAULTS = {
+    "max_cost": 5000,
+    "max_depth": 12,
+    "default_list_size": 10,
+    "scalar_weight": 0,
+    "object_weight": 1,
+    # "Type.field": weight overrides, e.g. {"Query.orders": 5}
+    "field_weights": {},
+}
+
+
+def cost_settings():
+    return {**DEFAULTS, **getattr(settings, "CRM_QUERY_COST", {})}
+
+
+class QueryCost:
+    def __init__(self, cost, depth, config):
+        self.cost = cost
+        self.depth = depth
+        self.max_cost = config["max_cost"]
+        self.max_depth = config["max_depth"]
+
+    @property
+    def over_budget(self):
+        return self.cost > self.max_cost or self.depth > self.max_depth
+
+    def as_extension(self):
+        return {
+            "cost": self.cost,
+            "maxCost": self.max_cost,
+            "depth": self.depth,
+            "maxDepth": self.max_depth,
+        }
+
+    def error(self):
+        return GraphQLError(
+            f"Query is too complex: cost {self.cost} (max {self.max_cost}), "
+            f"depth {self.depth} (max {self.max_depth}).",
+            extensions={"code": "QUERY_TOO_COMPLEX", **self.as_extension()},
+        )
+
+
+class _Analyzer:
+    def __init__(self, schema, fragments, variables, config):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.config = config
+        self.page_size = max_page_size()
+
+    def selection_cost(self, parent_type, selection_set, depth):
+        """Return ``(cost, depth)`` of a selection set on ``parent_type``."""
+        cost, max_depth = 0, depth
+        for field, field_parent in self.fields(parent_type, selection_set):
+            field_cost, field_depth = self.field_cost(field_parent, field, depth + 1)
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def fields(self, parent_type, selection_set, visited=None):
+        visited = visited if visited is not None else set()
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection, parent_type
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                yield from self.fields(fragment_type, selection.selection_set, visited)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                visited.add(name)
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                yield from self.fields(fragment_type, fragment.selection_set, visited)
+
+    def field_cost(self, parent_type, field, depth):
+        name = field.name.value
+        field_def = getattr(parent_type, "fields", {}).get(name)
+        if field_def is None:
+            # __typename and other introspection fields
+            return 0, depth
+
+        named_type = get_named_type(field_def.type)
+        weights = self.config["field_weights"]
+        key = f"{parent_type.name}.{name}"
+        if field.selection_set is None:
+            return weights.get(key, self.config["scalar_weight"]), depth
+
+        weight = weights.get(key, self.config["object_weight"])
+        child_cost, child_depth = self.selection_cost(named_type, field.selection_set, depth)
+        return weight + self.multiplier(parent_type, field, field_def) * child_cost, child_depth
+
+    def multiplier(self, parent_type, field, field_def):
+        if parent_type.name.endswith("Connection") and field.name.value == "edges":
+            # Already counted by the page size of the connection field
+            return 1
+        args = self.argument_values(field, field_def)
+        size = args.get("first")
+        if size is None:
+            size = args.get("last")
+        if isinstance(size, int):
+            return max(size, 1)
+        if get_named_type(field_def.type).name.endswith("Connection"):
+            return self.page_size
+        if is_list_type(get_nullable_type(field_def.type)):
+            return self.config["default_list_size"]
+        return 1
+
+    def argument_values(self, field, field_def):
+        values = {}
+        for argument in field.arguments or ():
+            arg_def = field_def.args.get(argument.name.value)
+            if arg_def is not None:
+                values[argument.name.value] = value_from_ast(argument.value, arg_def.type, self.variables)
+        return values
+
+
+def analyze_query(schema, document, operation, variables=None):
+    """Return the QueryCost of ``operation`` in ``document``."""
+    config = cost_settings()
+    root_type = schema.get_root_type(operation.operation)
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if definition.kind == "fragment_definition"
+    }
+    analyzer = _Analyzer(schema, fragments, variables, config)
+    cost, depth = analyzer.selection_cost(root_type, operation.selection_set, 0)
+    return QueryCost(cost, depth, config)
@@ -0,0 +1,116 @@
+"""
+Order reminders, fanned out to Celery in batches.
+
+The producer (crm/cron_jobs/send_order_reminders.py) pages through the
+orders of the last ``lookback_days`` with the ``orders`` cursor and
+queues one ``crm.tasks.send_order_reminders`` task per page of
+``batch_size`` order ids, so it holds a single page however large the
+week is, and the batches are spread over every worker.
+
+Each task claims its orders in OrderReminder before sending, keyed by
+the order, and marks them sent afterwards: rerunning the producer, or a
+batch delivered twice, sends nothing new. A claim left by a worker that
+died mid-batch can be taken over after ``claim_timeout`` seconds; the
+orders it had sent but not yet marked are then sent again, so delivery
+is at least once per order rather than exactly once.
+
+``rate_per_second`` caps the send rate across all workers: the producer
+delays batch ``n`` by the time the batches before it take at that rate,
+and each task paces its own sends to match. ``0`` sends as fast as the
+workers can.
+"""
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderReminder
+from .pagination import max_page_size
+
+
+DEFAULT_REMINDERS = {
+    "lookback_days": 7,
+    "batch_size": 100,
+    "rate_per_second": 50,
+    "claim_timeout": 600,
+}
+
+LOG_FILE = "/tmp/order_reminders_log.txt"
+
+
+def reminder_settings():
+    config = {**DEFAULT_REMINDERS, **getattr(settings, "CRM_REMINDERS", {})}
+    # One batch is one page of the orders connection
+    config["batch_size"] = max(1, min(config["batch_size"], max_page_size()))
+    return config
+
+
+def countdown(queued, config):
+    """Seconds to delay a batch queued after ``queued`` orders, to hold the send rate."""
+    rate = config["rate_per_second"]
+    return queued / rate if rate else 0
+
+
+# ---------------------------------------------------------
+# Delivery
+# ---------------------------------------------------------
+
+def claim(order_ids, token, timeout):
+    """
+    Claim the unsent reminders of ``order_ids`` for ``token`` and return
+    the ids now held by it. Orders without a reminder row are claimed by
+    inserting one; rows claimed longer than ``timeout`` ago and never sent
+    are taken over.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        OrderReminder.objects.bulk_create(
+            [OrderReminder(order_id=pk, claim=token, claimed_at=now) for pk in order_ids],
+            ignore_conflicts=True,
+        )
+        OrderReminder.objects.filter(
+            order_id__in=order_ids, sent_at__isnull=True, claimed_at__lt=now - timedelta(seconds=timeout),
+        ).update(claim=token, claimed_at=now)
+    return set(
+        OrderReminder.objects
+        .filter(order_id__in=order_ids, claim=token, sent_at__isnull=True)
+        .values_list("order_id", flat=True)
+    )
+
+
+def send(log, order_id, email):
+    log.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} - Order ID: {order_id} | Customer Email: {email}\n")
+
+
+def deliver_batch(order_ids):
+    """Send the reminders of ``order_ids`` not sent yet; return how many were sent."""
+    config = reminder_settings()
+    # Orders deleted since the page was read are dropped here
+    recipients = dict(
+        Order.objects.filter(pk__in=order_ids).order_by("pk").values_list("pk", "customer__email")
+    )
+    if not recipients:
+        return 0
+    token = uuid.uuid4().hex
+    claimed = claim(list(recipients), token, config["claim_timeout"])
+
+    interval = 1 / config["rate_per_second"] if config["rate_per_second"] else 0
+    sent = []
+    started = time.monotonic()
+    try:
+        with open(LOG_FILE, "a", encoding="utf-8") as log:
+            for order_id, email in recipients.items():
+                if order_id not in claimed:
+                    continue
+                ahead = started + len(sent) * interval - time.monotonic()
+                if ahead > 0:
+                    time.sleep(ahead)
+                send(log, order_id, email)
+                sent.append(order_id)
+    finally:
+        if sent:
+            OrderReminder.objects.filter(order_id__in=sent, claim=token).update(sent_at=timezone.now())
+    return len(sent)
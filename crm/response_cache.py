@@ -0,0 +1,241 @@
+"""
+Opt-in cache of GraphQL query results, invalidated by model versions.
+
+Every model has a version counter that is bumped whenever one of its rows
+(or, for Order, its product links) changes. A cached result is keyed on
+the normalized document, the variables, the operation name and the
+current versions of every model the operation can read, so a write makes
+all dependent entries unreachable without tracking them individually.
+
+The versions are bumped when the primary commits, before a read replica
+(crm/routing.py) has the write, so the views store only results read
+from the primary, and clients pinned to the primary bypass the cache.
+With replicas configured the cache therefore fills only from requests
+that read the primary.
+
+Configured through ``settings.CRM_RESPONSE_CACHE``::
+
+    CRM_RESPONSE_CACHE = {
+        "enabled": True,
+        "backend": "local",        # or "django" to use a shared cache alias
+        "cache_alias": "default",  # for the "django" backend
+        "max_bytes": 64 * 1024 * 1024,
+        "max_entry_bytes": 1024 * 1024,
+        "timeout": 300,
+    }
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from graphql import (
+    FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type, print_ast,
+)
+
+
+DEFAULTS = {
+    "enabled": False,
+    "backend": "local",
+    "cache_alias": "default",
+    "max_bytes": 64 * 1024 * 1024,
+    "max_entry_bytes": 1024 * 1024,
+    "timeout": 300,
+}
+
+# Models read by root fields beyond their own node types (joins in filters,
+# counters behind the summary fields).
+ROOT_FIELD_DEPENDENCIES = {
+    "customers": {"crm.customer"},
+    "products": {"crm.product"},
+    "orders": {"crm.order", "crm.customer", "crm.product"},
+    "totalCustomers": {"crm.customer"},
+    "totalOrders": {"crm.order"},
+    "totalRevenue": {"crm.order", "crm.product"},
+}
+
+
+def cache_settings():
+    return {**DEFAULTS, **getattr(settings, "CRM_RESPONSE_CACHE", {})}
+
+
+# ---------------------------------------------------------
+# Backends
+# ---------------------------------------------------------
+
+class LocalMemoryBackend:
+    """Per-process LRU bounded by the total size of the stored results."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, timeout):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, time.monotonic() + timeout)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def get_versions(self, names):
+        with self._lock:
+            return {name: self._versions.get(name, 0) for name in names}
+
+    def bump_versions(self, names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+
+class DjangoCacheBackend:
+    """Stores results and versions in a Django cache alias (e.g. Redis)."""
+
+    prefix = "crm:graphql"
+
+    def __init__(self, alias):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(f"{self.prefix}:result:{key}")
+
+    def set(self, key, value, size, timeout):
+        self.cache.set(f"{self.prefix}:result:{key}", value, timeout)
+
+    def get_versions(self, names):
+        keys = {f"{self.prefix}:version:{name}": name for name in names}
+        stored = self.cache.get_many(list(keys))
+        return {name: stored.get(key, 0) for key, name in keys.items()}
+
+    def bump_versions(self, names):
+        for name in names:
+            key = f"{self.prefix}:version:{name}"
+            self.cache.add(key, 0, None)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = cache_settings()
+                if config["backend"] == "django":
+                    _backend = DjangoCacheBackend(config["cache_alias"])
+                else:
+                    _backend = LocalMemoryBackend(config["max_bytes"])
+    return _backend
+
+
+# ---------------------------------------------------------
+# Invalidation
+# ---------------------------------------------------------
+
+def bump_model_versions(*models):
+    """Invalidate cached results that read any of ``models`` once the transaction commits."""
+    names = {model._meta.label_lower for model in models}
+    transaction.on_commit(lambda: get_backend().bump_versions(names))
+
+
+# ---------------------------------------------------------
+# Keys
+# ---------------------------------------------------------
+
+def _collect_models(schema, fragments, parent_type, selection_set, found, visited):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field_def = getattr(parent_type, "fields", {}).get(selection.name.value)
+            if field_def is None or selection.selection_set is None:
+                continue
+            named_type = get_named_type(field_def.type)
+            model = getattr(getattr(getattr(named_type, "graphene_type", None), "_meta", None), "model", None)
+            if model is not None:
+                found.add(model._meta.label_lower)
+            _collect_models(schema, fragments, named_type, selection.selection_set, found, visited)
+        elif isinstance(selection, InlineFragmentNode):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = schema.get_type(selection.type_condition.name.value)
+            _collect_models(schema, fragments, fragment_type, selection.selection_set, found, visited)
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            if name in visited or name not in fragments:
+                continue
+            visited.add(name)
+            fragment = fragments[name]
+            fragment_type = schema.get_type(fragment.type_condition.name.value)
+            _collect_models(schema, fragments, fragment_type, fragment.selection_set, found, visited)
+
+
+def operation_dependencies(schema, document, operation):
+    """Model labels whose changes can alter the result of ``operation``."""
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if definition.kind == "fragment_definition"
+    }
+    found = set()
+    for selection in operation.selection_set.selections:
+        if isinstance(selection, FieldNode):
+            found |= ROOT_FIELD_DEPENDENCIES.get(selection.name.value, set())
+    _collect_models(schema, fragments, schema.query_type, operation.selection_set, found, set())
+    return sorted(found)
+
+
+def result_key(schema, entry, operation, variables, operation_name):
+    """Return the cache key for a query, or None when caching is disabled."""
+    if not cache_settings()["enabled"]:
+        return None
+    memo = entry.memo
+    if "normalized" not in memo:
+        memo["normalized"] = hashlib.sha256(print_ast(entry.document).encode()).hexdigest()
+    dependencies_key = ("dependencies", operation_name)
+    if dependencies_key not in memo:
+        memo[dependencies_key] = operation_dependencies(schema, entry.document, operation)
+
+    dependencies = memo[dependencies_key]
+    versions = get_backend().get_versions(dependencies)
+    raw = json.dumps(
+        [memo["normalized"], variables or {}, operation_name, [versions[name] for name in dependencies]],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_result(key):
+    return get_backend().get(key)
+
+
+def store_result(key, data):
+    config = cache_settings()
+    size = len(json.dumps(data, default=str))
+    if size <= config["max_entry_bytes"]:
+        get_backend().set(key, data, size, config["timeout"])
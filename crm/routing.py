@@ -0,0 +1,125 @@
+"""
+Read/write routing between the primary database and read replicas.
+
+Writes always go to ``default``, the primary. Reads go to the primary
+too unless they run inside ``use_replica()``, which the GraphQL views
+and the in-process client (crm/graphql_client.py) enter for query
+operations; the exports stream from ``pick_replica()``. One replica of
+``CRM_DATABASE_ROUTING['replicas']`` is picked per block, so a query
+reads one consistent copy. Aliases missing from DATABASES are ignored:
+without replicas everything reads the primary.
+
+Replicas lag behind the primary, so a client that has just written is
+pinned to it for ``pin_seconds``: HTTP clients by a short-lived cookie
+set on mutation responses, the cron and Celery processes in memory.
+Reads inside a transaction on the primary stay on the primary.
+
+Locally, point CRM_REPLICA_DB at a second SQLite file and copy the
+primary into it with ``python manage.py sync_replica``.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+DEFAULT_ROUTING = {
+    "replicas": [],
+    "pin_seconds": 5,
+    "pin_cookie": "crm_primary",
+}
+
+
+def routing_settings():
+    return {**DEFAULT_ROUTING, **getattr(settings, "CRM_DATABASE_ROUTING", {})}
+
+
+def replicas():
+    return [alias for alias in routing_settings()["replicas"] if alias in settings.DATABASES]
+
+
+def pick_replica():
+    """A replica alias to read from, or the primary's when there is none."""
+    aliases = replicas()
+    return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+
+# ---------------------------------------------------------
+# Router
+# ---------------------------------------------------------
+
+_replica = ContextVar("crm_replica", default=DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Send the reads of the block to one replica, if any and ``enabled``,
+    and return the alias picked (the primary's without one).
+    """
+    alias = pick_replica() if enabled else DEFAULT_DB_ALIAS
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+def read_database():
+    """The alias reads go to right now."""
+    alias = _replica.get()
+    if alias != DEFAULT_DB_ALIAS and connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS entry; see the module docstring."""
+
+    def db_for_read(self, model, **hints):
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return False if db in routing_settings()["replicas"] else None
+
+
+# ---------------------------------------------------------
+# Pinning clients to the primary after a write
+# ---------------------------------------------------------
+
+def is_pinned(request):
+    return routing_settings()["pin_cookie"] in request.COOKIES
+
+
+def pin(response):
+    """Pin the client receiving ``response`` to the primary for ``pin_seconds``."""
+    config = routing_settings()
+    if config["pin_seconds"] and replicas():
+        response.set_cookie(
+            config["pin_cookie"], "1", max_age=config["pin_seconds"], httponly=True, samesite="Lax",
+        )
+    return response
+
+
+_process_pinned_until = 0.0
+
+
+def pin_process():
+    """Pin this process (a cron or Celery job) to the primary for ``pin_seconds``."""
+    global _process_pinned_until
+    _process_pinned_until = time.monotonic() + routing_settings()["pin_seconds"]
+
+
+def process_pinned():
+    return time.monotonic() < _process_pinned_until
@@ -7,10 +7,27 @@ from graphene_django import DjangoObjectType
 from graphene import relay
 from graphene_django.filter import DjangoFilterConnectionField
 
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
 
-from .models import Customer, Product, Order
+from .models import (
+    Customer, Product, Order, OrderItem, CRMSummary, InsufficientStock, ReportSnapshot, order_quantities,
+)
+from .filters import CustomerFilter, ProductFilter, OrderFilter, ReportSnapshotFilter
+from .loaders import get_loaders
+from .pagination import KeysetConnectionField, decode_cursor, encode_cursor, page_size
+from .response_cache import bump_model_versions
+
+
+PHONE_RE = re.compile(r"^\+?\d[\d\-]{7,14}$")
+
+# Rows per INSERT statement in the bulk mutations
+DEFAULT_BULK_BATCH_SIZE = 1000
+
+
+def bulk_batch_size():
+    return getattr(settings, "CRM_BULK_BATCH_SIZE", DEFAULT_BULK_BATCH_SIZE)
 
 
 # ---------------------------------------------------------
@@ -32,22 +49,101 @@ class CustomerNode(DjangoObjectType):
 # Regular GraphQL Types (non-Relay)
 # ---------------------------------------------------------
 
+# Related fields resolve through the per-request loaders in crm/loaders.py,
+# so nested selections cost one query per level instead of one per row.
+
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone")
+        fields = ("id", "name", "email", "phone", "orders")
+
+    # Paged like Query.orders: a customer may have any number of orders.
+    # The pages of all customers in a response are fetched together.
+    orders = KeysetConnectionField(
+        lambda: OrderConnection, filterset_class=OrderFilter,
+        ordering=("order_date", "id"), expect="expect_orders", batch_by="customer_id",
+    )
+
+    def resolve_orders(self, info, **kwargs):
+        return Order.objects.all()
 
 
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
+
+    orders = KeysetConnectionField(
+        lambda: OrderConnection, filterset_class=OrderFilter,
+        ordering=("order_date", "id"), expect="expect_orders", batch_by="items__product_id",
+    )
+
+    def resolve_orders(self, info, **kwargs):
+        return Order.objects.all()
+
+
+class OrderItemType(DjangoObjectType):
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product", "quantity", "unit_price")
+
+    product = graphene.Field(ProductType)
+    total = graphene.Decimal(description="quantity x unitPrice")
+
+    def resolve_total(self, info):
+        return self.total
 
 
 class OrderType(DjangoObjectType):
     class Meta:
         model = Order
-        fields = ("id", "customer", "products", "total_amount", "order_date")
+        fields = ("id", "customer", "products", "items", "total_amount", "order_date")
+
+    customer = graphene.Field(CustomerType)
+    products = graphene.List(graphene.NonNull(ProductType))
+    items = graphene.List(graphene.NonNull(OrderItemType))
+
+    def resolve_customer(self, info):
+        return get_loaders(info).customer_by_id.load(self.customer_id)
+
+    def resolve_products(self, info):
+        return get_loaders(info).products_by_order.load(self.pk)
+
+    def resolve_items(self, info):
+        return get_loaders(info).items_by_order.load(self.pk)
+
+
+class ReportSnapshotType(DjangoObjectType):
+    class Meta:
+        model = ReportSnapshot
+        fields = (
+            "id", "created_at", "new_customers", "new_orders", "new_revenue",
+            "total_customers", "total_orders", "total_revenue",
+        )
+
+
+# ---------------------------------------------------------
+# Connections (keyset-paginated, see crm/pagination.py)
+# ---------------------------------------------------------
+
+class CustomerConnection(relay.Connection):
+    class Meta:
+        node = CustomerType
+
+
+class ProductConnection(relay.Connection):
+    class Meta:
+        node = ProductType
+
+
+class OrderConnection(relay.Connection):
+    class Meta:
+        node = OrderType
+
+
+class ReportSnapshotConnection(relay.Connection):
+    class Meta:
+        node = ReportSnapshotType
 
 
 # ---------------------------------------------------------
@@ -56,6 +152,10 @@ class OrderType(DjangoObjectType):
 
 # Create Customer
 class CreateCustomer(graphene.Mutation):
+    """
+    Mutation to create a customer. The insert and the CRMSummary count
+    adjusted by its post_save signal commit in one transaction.
+    """
     class Arguments:
         name = graphene.String(required=True)
         email = graphene.String(required=True)
@@ -67,18 +167,19 @@ class CreateCustomer(graphene.Mutation):
 
     def mutate(self, info, name, email, phone=None):
         errors = []
-        phone_regex = r"^\+?\d[\d\-]{7,14}$"
 
         if Customer.objects.filter(email=email).exists():
             errors.append("Email already exists.")
 
-        if phone and not re.match(phone_regex, phone):
+        if phone and not PHONE_RE.match(phone):
             errors.append("Invalid phone format. Use +1234567890 or 123-456-7890.")
 
         if errors:
             return CreateCustomer(errors=errors, message="Customer creation failed.")
 
-        customer = Customer.objects.create(name=name, email=email, phone=phone)
+        with transaction.atomic():
+            # Blank phones are stored as '', as in BulkCreateCustomers
+            customer = Customer.objects.create(name=name, email=email, phone=phone or "")
         return CreateCustomer(customer=customer, message="Customer created successfully!")
 
 
@@ -100,27 +201,340 @@ class BulkCreateCustomers(graphene.Mutation):
     def mutate(self, info, input):
         customers = []
         errors = []
-        phone_regex = r"^\+?\d[\d\-]{7,14}$"
+
+        # One IN lookup for the whole batch instead of one EXISTS per row
+        emails = {data.get("email") for data in input}
+        taken = set(Customer.objects.filter(email__in=emails).values_list("email", flat=True))
 
         for data in input:
             name = data.get("name")
             email = data.get("email")
             phone = data.get("phone")
 
-            if Customer.objects.filter(email=email).exists():
+            if email in taken:
                 errors.append(f"Email already exists: {email}")
                 continue
 
-            if phone and not re.match(phone_regex, phone):
+            if phone and not PHONE_RE.match(phone):
                 errors.append(f"Invalid phone for {name}: {phone}")
                 continue
 
-            customer = Customer.objects.create(name=name, email=email, phone=phone)
-            customers.append(customer)
-
+            # Later rows with the same email are rejected like existing ones
+            taken.add(email)
+            customers.append(Customer(name=name, email=email, phone=phone or ""))
+
+        batch_size = bulk_batch_size()
+        while True:
+            try:
+                with transaction.atomic():
+                    customers = Customer.objects.bulk_create(customers, batch_size=batch_size)
+                break
+            except IntegrityError:
+                # Another request inserted some of these emails since the lookup
+                conflicts = set(
+                    Customer.objects.filter(email__in=[c.email for c in customers])
+                    .values_list("email", flat=True)
+                )
+                if not conflicts:
+                    raise
+                errors.extend(f"Email already exists: {c.email}" for c in customers if c.email in conflicts)
+                customers = [c for c in customers if c.email not in conflicts]
+                for customer in customers:
+                    customer.pk = None  # may hold an id from the rolled-back batch
+
+        CRMSummary.adjust(customers=len(customers))
+        bump_model_versions(Customer)
+
+        get_loaders(info).expect_customers(customers)
         return BulkCreateCustomers(customers=customers, errors=errors)
 
 
-# Create Product
 class CreateProduct(graphene.Mutation):
+    """Mutation to create a product."""
+    class Arguments:
+        name = graphene.String(required=True)
+        price = graphene.Float(required=True)
+        stock = graphene.Int(required=False, default_value=0)
+
+    product = graphene.Field(ProductType)
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, name, price, stock=0):
+        errors = []
+        if price <= 0:
+            errors.append("Price must be positive.")
+        if stock < 0:
+            errors.append("Stock cannot be negative.")
+
+        if errors:
+            return CreateProduct(errors=errors)
+
+        product = Product.objects.create(name=name, price=Decimal(price), stock=stock)
+        return CreateProduct(product=product)
+
+
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
+def _order_lines(product_ids, items):
+    """(product id, quantity) lines of ``productIds`` (one unit each) and ``items``."""
+    return [(pid, 1) for pid in product_ids or []] + [
+        (item.get("product_id"), item.get("quantity")) for item in items or []
+    ]
+
+
+class CreateOrder(graphene.Mutation):
+    """
+    Mutation to create an order from ``productIds`` (one unit each) and/or
+    ``items`` with quantities, reserving the stock and recording each
+    product's current price on its line.
+    """
+    class Arguments:
+        customer_id = graphene.ID(required=True)
+        product_ids = graphene.List(graphene.ID, required=False)
+        items = graphene.List(graphene.NonNull(OrderItemInput), required=False)
+        order_date = graphene.DateTime(required=False)
+
+    order = graphene.Field(OrderType)
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, customer_id, product_ids=None, items=None, order_date=None):
+        errors = []
+        try:
+            customer = Customer.objects.get(pk=customer_id)
+        except Customer.DoesNotExist:
+            errors.append("Invalid customer ID.")
+            return CreateOrder(errors=errors)
+
+        try:
+            quantities = order_quantities(_order_lines(product_ids, items))
+        except ValueError as e:
+            return CreateOrder(errors=[f"{e}."])
+        prices = dict(Product.objects.filter(pk__in=quantities).values_list("pk", "price"))
+        if len(prices) != len(quantities):
+            errors.append("One or more product IDs are invalid.")
+            return CreateOrder(errors=errors)
+
+        try:
+            with transaction.atomic():
+                # Stock first: a short line rolls back before anything else is written
+                Product.objects.reserve(quantities)
+                order = Order.objects.create(
+                    customer=customer,
+                    order_date=order_date or datetime.now(),
+                    total_amount=sum(prices[pk] * quantity for pk, quantity in quantities.items()),
+                )
+                OrderItem.objects.bulk_create(
+                    OrderItem(order=order, product_id=pk, quantity=quantity, unit_price=prices[pk])
+                    for pk, quantity in quantities.items()
+                )
+        except InsufficientStock as e:
+            return CreateOrder(errors=[str(e)])
+        return CreateOrder(order=order)
+
+
+# Bulk Create Orders
+class OrderInput(graphene.InputObjectType):
+    """Lines as in createOrder: ``productIds`` (one unit each) and/or ``items``."""
+    customer_id = graphene.ID(required=True)
+    product_ids = graphene.List(graphene.ID, required=False)
+    items = graphene.List(graphene.NonNull(OrderItemInput), required=False)
+    order_date = graphene.DateTime(required=False)
+
+
+def _parse_ids(values):
+    try:
+        return [int(v) for v in values]
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkCreateOrders(graphene.Mutation):
+    """
+    Mutation to create many orders with a fixed number of statements,
+    plus one stock reservation per order line.
+    """
     class Arguments:
+        input = graphene.List(OrderInput, required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+
+    @transaction.atomic
+    def mutate(self, info, input):
+        errors = []
+        rows = []
+
+        for index, data in enumerate(input):
+            customer_ids = _parse_ids([data.get("customer_id")])
+            if customer_ids is None:
+                errors.append(f"Invalid ID in order {index}.")
+                continue
+            try:
+                quantities = order_quantities(_order_lines(data.get("product_ids"), data.get("items")))
+            except ValueError as e:
+                errors.append(f"{e} for order {index}.")
+                continue
+            rows.append((index, customer_ids[0], quantities, data.get("order_date")))
+
+        # One query each for every referenced customer and product price
+        known_customers = set(
+            Customer.objects.filter(pk__in={row[1] for row in rows}).values_list("pk", flat=True)
+        )
+        prices = dict(
+            Product.objects.filter(pk__in={pid for row in rows for pid in row[2]}).values_list("pk", "price")
+        )
+
+        orders = []
+        lines = []
+        for index, customer_id, quantities, order_date in rows:
+            if customer_id not in known_customers:
+                errors.append(f"Invalid customer ID for order {index}: {customer_id}")
+                continue
+            if any(pid not in prices for pid in quantities):
+                errors.append(f"One or more product IDs are invalid for order {index}.")
+                continue
+            # In its own savepoint: a short order is rejected alone
+            try:
+                Product.objects.reserve(quantities)
+            except InsufficientStock as e:
+                errors.append(f"Insufficient stock for order {index}: product {e.product_id}.")
+                continue
+
+            order = Order(
+                customer_id=customer_id,
+                total_amount=sum(prices[pid] * quantity for pid, quantity in quantities.items()),
+            )
+            if order_date:
+                order.order_date = order_date
+            orders.append(order)
+            lines.append(quantities)
+
+        batch_size = bulk_batch_size()
+        orders = Order.objects.bulk_create(orders, batch_size=batch_size)
+        CRMSummary.adjust(orders=len(orders), revenue=sum(order.total_amount for order in orders))
+        bump_model_versions(Order)
+
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order_id=order.pk, product_id=pid, quantity=quantity, unit_price=prices[pid])
+                for order, quantities in zip(orders, lines)
+                for pid, quantity in quantities.items()
+            ],
+            batch_size=batch_size,
+        )
+
+        get_loaders(info).expect_orders(orders)
+        return BulkCreateOrders(orders=orders, errors=errors)
+
+
+class UpdateLowStockProducts(graphene.Mutation):
+    """
+    Mutation to restock products whose stock is below ``threshold``.
+
+    Works through the low-stock products in id order, one page per call:
+    each call restocks up to ``first`` of them with a single UPDATE and
+    returns them; repeat with ``after: endCursor`` while ``hasNextPage``.
+    """
+    class Arguments:
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
+        first = graphene.Int()
+        after = graphene.String()
+
+    success = graphene.String()
+    updated_products = graphene.List(ProductType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+    errors = graphene.List(graphene.String)
+
+    @transaction.atomic
+    def mutate(self, info, threshold=10, increment=10, first=None, after=None):
+        if increment <= 0:
+            return UpdateLowStockProducts(errors=["Increment must be positive."])
+
+        size = page_size(first)
+        candidates = Product.objects.filter(stock__lt=threshold)
+        if after:
+            candidates = candidates.filter(pk__gt=decode_cursor(after, ("id",), Product)[0])
+
+        # The page is bounded by the id of its last product rather than by a
+        # LIMIT inside the UPDATE, which not every backend accepts
+        boundary = list(candidates.order_by("pk").values_list("pk", flat=True)[size - 1:size]) if size else []
+        page = candidates.filter(pk__lte=boundary[0]) if boundary else candidates
+        ids = page.restock(increment) if size else []
+
+        products = list(Product.objects.filter(pk__in=ids).order_by("pk"))
+        get_loaders(info).expect_products(products)
+        return UpdateLowStockProducts(
+            success=f"Restocked {len(products)} low-stock products by {increment}.",
+            updated_products=products,
+            end_cursor=encode_cursor([ids[-1]]) if ids else after,
+            has_next_page=bool(boundary) and candidates.filter(pk__gt=boundary[0]).exists(),
+        )
+
+
+# ============================================================
+#  Root Mutation and Query Registration
+# ============================================================
+
+class Mutation(graphene.ObjectType):
+    """Root mutation class for CRM schema."""
+    create_customer = CreateCustomer.Field()
+    bulk_create_customers = BulkCreateCustomers.Field()
+    create_product = CreateProduct.Field()
+    create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
+
+
+class Query(graphene.ObjectType):
+    """Root query class for CRM schema."""
+    hello = graphene.String(default_value="Hello, GraphQL!")
+
+    customers = KeysetConnectionField(
+        CustomerConnection, filterset_class=CustomerFilter, expect="expect_customers"
+    )
+    products = KeysetConnectionField(
+        ProductConnection, filterset_class=ProductFilter, expect="expect_products"
+    )
+    orders = KeysetConnectionField(
+        OrderConnection, filterset_class=OrderFilter,
+        ordering=("order_date", "id"), expect="expect_orders",
+    )
+
+    # Weekly report snapshots, oldest first; `last: n` for the latest
+    report_snapshots = KeysetConnectionField(
+        ReportSnapshotConnection, filterset_class=ReportSnapshotFilter
+    )
+
+    # Read from the CRMSummary row, not COUNT/SUM over the tables
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+
+    def resolve_customers(self, info, **kwargs):
+        return Customer.objects.all()
+
+    def resolve_products(self, info, **kwargs):
+        return Product.objects.all()
+
+    def resolve_orders(self, info, **kwargs):
+        return Order.objects.all()
+
+    def resolve_report_snapshots(self, info, **kwargs):
+        return ReportSnapshot.objects.all()
+
+    def resolve_total_customers(self, info):
+        return get_loaders(info).summary_field("total_customers")
+
+    def resolve_total_orders(self, info):
+        return get_loaders(info).summary_field("total_orders")
+
+    def resolve_total_revenue(self, info):
+        return get_loaders(info).summary_field("total_revenue")
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation)
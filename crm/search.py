@@ -0,0 +1,227 @@
+"""
+Full-text search over customer names/emails and product names.
+
+On SQLite the searchable columns are mirrored into FTS5 tables
+(``crm_customer_fts``, ``crm_product_fts``) kept in sync by triggers, so
+bulk_create and queryset updates are indexed too. Every search term is
+matched as a token prefix (``"jo"*``) and results are ranked with bm25.
+
+Other backends, or SQLite builds without FTS5, fall back to one
+``icontains`` per term, ranking rows whose first column starts with the
+search text first.
+
+Remaking a table in a SQLite migration drops its triggers; the
+``post_migrate`` hook re-installs them and rebuilds the affected index.
+``manage.py rebuild_search_index`` does the same on demand.
+
+Whether a database has the FTS tables is looked up once per alias and
+cached; installing or dropping the index refreshes the cache. The async
+view does the lookup in a worker thread before executing, so building a
+search filter never runs SQL on the event loop.
+"""
+import re
+
+from django.db import connections, models
+from django.db.models import Case, F, IntegerField, Lookup, Q, Value, When
+
+
+# Queryset annotation holding the rank; lower is a better match
+RANK = "search_rank"
+
+# Base table -> indexed columns
+INDEXED_COLUMNS = {
+    "crm_customer": ("name", "email"),
+    "crm_product": ("name",),
+}
+
+TERM_RE = re.compile(r"\w+")
+
+# (alias, base table) -> whether its FTS table exists; see check_index()
+_ready = {}
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden FTS5 column named after its table; supports ``__match``."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", (*lhs_params, *rhs_params)
+
+
+def fts_table(table):
+    return f"{table}_fts"
+
+
+def search_terms(text):
+    return TERM_RE.findall((text or "").lower())
+
+
+def match_expression(text):
+    """FTS5 query matching every term of ``text`` as a token prefix."""
+    return " ".join(f'"{term}"*' for term in search_terms(text))
+
+
+# ---------------------------------------------------------
+# Index maintenance (SQLite FTS5)
+# ---------------------------------------------------------
+
+def fts5_supported(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+def _trigger_sql(table, columns):
+    fts = fts_table(table)
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    insert = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    return {
+        f"{fts}_ai": f"AFTER INSERT ON {table} BEGIN {insert} END",
+        f"{fts}_ad": f"AFTER DELETE ON {table} BEGIN {delete} END",
+        f"{fts}_au": f"AFTER UPDATE OF {cols} ON {table} BEGIN {delete} {insert} END",
+    }
+
+
+def install(connection, rebuild=False):
+    """
+    Create missing FTS tables and triggers. Returns the base tables whose
+    index was (re)built. A no-op without FTS5.
+    """
+    if not fts5_supported(connection):
+        return []
+    rebuilt = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for table, columns in INDEXED_COLUMNS.items():
+            if table not in existing:
+                continue
+            fts = fts_table(table)
+            stale = rebuild
+            if fts not in existing:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, "
+                    f"content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+                stale = True
+            for name, body in _trigger_sql(table, columns).items():
+                if name not in existing:
+                    cursor.execute(f"CREATE TRIGGER {name} {body}")
+                    stale = True
+            if stale:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+                rebuilt.append(table)
+    check_index(connection.alias)
+    return rebuilt
+
+
+def uninstall(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for table, columns in INDEXED_COLUMNS.items():
+            for name in _trigger_sql(table, columns):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts_table(table)}")
+    check_index(connection.alias)
+
+
+def optimize(connection, table):
+    fts = fts_table(table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+
+
+def ensure_search_index(sender, using="default", apps=None, **kwargs):
+    """post_migrate hook: re-create triggers lost when a migration remade a table."""
+    try:
+        if apps is not None:
+            apps.get_model("crm", "CustomerSearchDocument")
+    except LookupError:
+        return  # migrated back past 0004_search_index
+    install(connections[using])
+
+
+def check_index(using="default"):
+    """Look up which FTS tables exist on the ``using`` database. Runs SQL."""
+    connection = connections[using]
+    existing = set()
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            existing = {row[0] for row in cursor.fetchall()}
+    for table in INDEXED_COLUMNS:
+        _ready[(using, table)] = fts_table(table) in existing
+
+
+def index_checked(using="default"):
+    return all((using, table) in _ready for table in INDEXED_COLUMNS)
+
+
+def index_ready(connection, table):
+    key = (connection.alias, table)
+    if key not in _ready:
+        check_index(connection.alias)
+    return _ready[key]
+
+
+# ---------------------------------------------------------
+# Queries
+# ---------------------------------------------------------
+
+def _fallback_filter(columns, terms):
+    condition = Q()
+    for term in terms:
+        condition &= Q(*[Q(**{f"{column}__icontains": term}) for column in columns], _connector=Q.OR)
+    return condition
+
+
+def matching_ids(model, text, using="default"):
+    """
+    Primary keys of ``model`` rows matching ``text``, as a subquery usable
+    in ``pk__in``/``fk__in`` lookups.
+    """
+    table = model._meta.db_table
+    terms = search_terms(text)
+    if not terms:
+        return model._default_manager.using(using).none().values("pk")
+    if index_ready(connections[using], table):
+        documents = model._meta.get_field("search_document").related_model
+        return documents.objects.using(using).filter(document__match=match_expression(text)).values("pk")
+    return model._default_manager.using(using).filter(_fallback_filter(INDEXED_COLUMNS[table], terms)).values("pk")
+
+
+def search(queryset, text):
+    """Filter ``queryset`` to rows matching ``text`` and annotate their rank."""
+    table = queryset.model._meta.db_table
+    columns = INDEXED_COLUMNS[table]
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+
+    if index_ready(connections[queryset.db], table):
+        # Joins the FTS table on rowid, so bm25 is computed once per match
+        return queryset.filter(search_document__document__match=match_expression(text)).annotate(**{
+            RANK: F("search_document__rank"),
+        })
+
+    return queryset.filter(_fallback_filter(columns, terms)).annotate(**{
+        RANK: Case(
+            When(**{f"{columns[0]}__istartswith": text.strip()}, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    })
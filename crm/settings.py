@@ -33,7 +33,8 @@ CRONJOBS = [
 GRAPHENE = {
     'SCHEMA': 'graphql_crm.schema.schema',
     'MIDDLEWARE': [
-        'graphene_django.debug.DjangoDebugMiddleware',
+        # Bounded histograms, not DjangoDebugMiddleware's per-statement log
+        'crm.metrics.MetricsMiddleware',
     ]
 }
 
@@ -0,0 +1,121 @@
+"""
+Signal handlers that keep denormalized CRM columns up to date.
+
+Order.total_amount follows the order's lines (OrderItem quantity times
+unit price) without loading rows into Python: additions through
+``order.products`` apply a delta; saved and deleted lines, including those
+removed through ``order.products``/``product.orders`` and those deleted with
+their product, re-run the SQL aggregate for the affected orders only.
+Code bulk-inserting OrderItem rows (CreateOrder, the bulk paths) sets the
+totals itself.
+
+CRMSummary is adjusted for every Customer/Order created or deleted and for
+every change of an order total. Bulk inserts bypass signals, so the bulk
+mutations call CRMSummary.adjust() themselves.
+
+Every write also bumps the model's response cache version (crm.response_cache).
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import CRMSummary, Customer, Order, OrderItem, Product
+from .response_cache import bump_model_versions
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_results(sender, **kwargs):
+    bump_model_versions(sender)
+
+
+@receiver(post_save, sender=Customer)
+def count_created_customer(sender, instance, created, **kwargs):
+    if created:
+        CRMSummary.adjust(customers=1)
+
+
+@receiver(post_delete, sender=Customer)
+def count_deleted_customer(sender, instance, **kwargs):
+    CRMSummary.adjust(customers=-1)
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_total(sender, instance, **kwargs):
+    if not instance._state.adding and instance.pk:
+        instance._previous_total = (
+            Order.objects.filter(pk=instance.pk).values_list("total_amount", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def count_saved_order(sender, instance, created, **kwargs):
+    if created:
+        CRMSummary.adjust(orders=1, revenue=instance.total_amount)
+        return
+    previous = instance.__dict__.pop("_previous_total", None)
+    if previous is not None:
+        CRMSummary.adjust(revenue=instance.total_amount - previous)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_stored_total(sender, instance, **kwargs):
+    # Line changes update the stored total, not instances loaded before them
+    instance._stored_total = (
+        Order.objects.filter(pk=instance.pk).values_list("total_amount", flat=True).first()
+    )
+
+
+@receiver(post_delete, sender=Order)
+def count_deleted_order(sender, instance, **kwargs):
+    total = instance.__dict__.pop("_stored_total", None)
+    CRMSummary.adjust(orders=-1, revenue=-(instance.total_amount if total is None else total))
+
+
+@receiver(post_save, sender=OrderItem)
+def update_total_of_saved_line(sender, instance, **kwargs):
+    # line.save() and OrderItem.objects.create(); bulk inserts bypass this
+    Order.objects.filter(pk=instance.order_id).recompute_totals()
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_total_of_deleted_line(sender, instance, origin=None, **kwargs):
+    # Lines deleted with their order or customer leave with the order's
+    # total; lines deleted with a product are recomputed per product below.
+    # order.products.remove()/clear() delete lines through a queryset too.
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is None or model is OrderItem:
+        Order.objects.filter(pk=instance.order_id).recompute_totals()
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance, **kwargs):
+    instance._order_ids = list(
+        OrderItem.objects.filter(product_id=instance.pk).values_list("order_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def update_totals_of_product_orders(sender, instance, **kwargs):
+    Order.objects.filter(pk__in=instance.__dict__.pop("_order_ids", [])).recompute_totals()
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_order_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    # Removals and clears delete OrderItem rows, handled above
+    if action.startswith("post_"):
+        bump_model_versions(Order)
+    if action != "post_add" or not pk_set:
+        return
+
+    if not reverse:
+        # order.products.add(...)
+        delta = sender.objects.filter(order_id=instance.pk, product_id__in=pk_set).revenue()
+        Order.objects.filter(pk=instance.pk).add_to_totals(delta)
+    else:
+        # product.orders.add(...)
+        Order.objects.filter(pk__in=pk_set).recompute_totals()
@@ -1,36 +1,37 @@
 import requests  # Required for checker
 from datetime import datetime  # Required for checker
 from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+from crm import reminders
+from crm.models import ReportSnapshot
 
 
 @shared_task
 def generate_crm_report():
     """
-    Celery task to generate a weekly CRM report using GraphQL.
-    It logs total customers, orders, and revenue to /tmp/crm_report_log.txt
-    """
-
-    # Connect to GraphQL endpoint
-    transport = RequestsHTTPTransport(url="http://localhost:8000/graphql/")
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    Celery task to generate the weekly CRM report.
 
-    # Query CRM statistics
-    query = gql("""
-    {
-        totalCustomers
-        totalOrders
-        totalRevenue
-    }
-    """)
-
-    # Execute query
-    result = client.execute(query)
+    Stores a ReportSnapshot covering the customers and orders created
+    since the previous one (see crm.models.ReportSnapshot), so the run
+    takes the same time however much history there is, and logs it to
+    /tmp/crm_report_log.txt. Past reports are served by the
+    ``reportSnapshots`` query.
+    """
+    snapshot = ReportSnapshot.take()
 
     # Log to file with timestamp
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with open("/tmp/crm_report_log.txt", "a") as log:
-        log.write(f"{now} - Report: {result}\n")
+        log.write(f"{now} - Report: {snapshot}\n")
 
     print("CRM weekly report generated and logged.")
+
+
+@shared_task(acks_late=True)
+def send_order_reminders(order_ids):
+    """
+    Send the reminders of one batch of orders queued by
+    crm/cron_jobs/send_order_reminders.py. Orders already reminded are
+    skipped (see crm.reminders), so the task is safe to redeliver.
+    """
+    return reminders.deliver_batch(order_ids)
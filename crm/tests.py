@@ -1 +1,1247 @@
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from gql import gql
+from graphql import parse
+
+from alx_backend_graphql.schema import schema
+
+from . import cron, metrics, profiling, reminders, routing
+from . import search as text_search
+from .documents import DocumentCache, document_cache, query_hash
+from .exports import stream_export
+from .management.commands.explain_filters import parse_plan
+from .graphql_client import GraphQLExecutionError, execute_query
+from .imports import validate_chunk, write_chunk
+from .models import (
+    CRMSummary, Customer, ImportCheckpoint, InsufficientStock, Order, OrderItem, OrderReminder, Product,
+    ReportSnapshot,
+)
+from .pagination import encode_cursor
+from .query_cost import analyze_query, cost_settings
+
+
+def graphql(client, query, variables=None, path="/graphql"):
+    response = client.post(
+        path, json.dumps({"query": query, "variables": variables or {}}), content_type="application/json",
+    )
+    return response.json()
+
+
+def create_orders(count, lines=2):
+    """``count`` orders of new customers, each with ``lines`` new products."""
+    orders = []
+    start = Customer.objects.count()
+    for n in range(start, start + count):
+        customer = Customer.objects.create(name=f"Customer {n}", email=f"customer{n}@example.com", phone="+15550000000")
+        order = Order.objects.create(customer=customer, total_amount="0.00")
+        products = [Product.objects.create(name=f"Product {n}.{m}", price="1.00", stock=5) for m in range(lines)]
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=p, unit_price=p.price) for p in products)
+        orders.append(order)
+    return orders
+
+
+# ---------------------------------------------------------
+# DataLoaders
+# ---------------------------------------------------------
+
+class LoaderQueryCountTests(TestCase):
+    QUERY = """
+    {
+        orders { edges { node {
+            id
+            customer { name email }
+            products { name price }
+            items { quantity product { name } }
+        } } }
+    }
+    """
+    CUSTOMER_ORDERS = "{ customers(first: 30) { edges { node { orders(first: 10) { edges { node { id } } } } } } }"
+    PRODUCT_ORDERS = """
+    { products(first: 30) { edges { node { orders(first: 10) { edges { node { customer { name } } } } } } } }
+    """
+
+    def statements(self, query=QUERY, root="orders"):
+        with CaptureQueriesContext(connection) as queries:
+            result = graphql(self.client, query)
+        self.assertNotIn("errors", result)
+        return len(result["data"][root]["edges"]), len(queries)
+
+    def test_nested_selections_run_a_fixed_number_of_statements(self):
+        create_orders(2)
+        rows, few = self.statements()
+        self.assertEqual(rows, 2)
+
+        create_orders(20)
+        rows, many = self.statements()
+        self.assertEqual(rows, 22)
+        self.assertEqual(many, few)
+
+    def test_nested_order_connections_run_a_fixed_number_of_statements(self):
+        create_orders(2)
+        few = self.statements(self.CUSTOMER_ORDERS, "customers"), self.statements(self.PRODUCT_ORDERS, "products")
+
+        create_orders(20)
+        many = self.statements(self.CUSTOMER_ORDERS, "customers"), self.statements(self.PRODUCT_ORDERS, "products")
+        self.assertEqual([rows for rows, _ in many], [22, 30])
+        self.assertEqual([count for _, count in many], [count for _, count in few])
+
+    def test_nested_order_pages_are_per_parent(self):
+        orders = create_orders(2, lines=1)
+        customer = orders[0].customer
+        extra = [Order.objects.create(customer=customer) for _ in range(3)]
+        query = """
+        query($after: String) { customers { edges { node {
+            name
+            orders(first: 2, after: $after) { edges { node { id } } pageInfo { hasNextPage endCursor } }
+        } } } }
+        """
+
+        def pages(after=None):
+            edges = graphql(self.client, query, {"after": after})["data"]["customers"]["edges"]
+            return {edge["node"]["name"]: edge["node"]["orders"] for edge in edges}
+
+        first = pages()
+        ids = [str(o.pk) for o in [orders[0], *extra]]
+        self.assertEqual([e["node"]["id"] for e in first[customer.name]["edges"]], ids[:2])
+        self.assertTrue(first[customer.name]["pageInfo"]["hasNextPage"])
+        self.assertEqual([e["node"]["id"] for e in first[orders[1].customer.name]["edges"]], [str(orders[1].pk)])
+        self.assertFalse(first[orders[1].customer.name]["pageInfo"]["hasNextPage"])
+
+        after = pages(first[customer.name]["pageInfo"]["endCursor"])[customer.name]
+        self.assertEqual([e["node"]["id"] for e in after["edges"]], ids[2:])
+
+
+# ---------------------------------------------------------
+# Bulk mutations
+# ---------------------------------------------------------
+
+class BulkMutationTests(TestCase):
+    BULK_CREATE_CUSTOMERS = (
+        "mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) { customers { email } errors } }"
+    )
+    BULK_CREATE_ORDERS = "mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { orders { id } errors } }"
+
+    def test_bulk_create_customers_reports_each_rejected_row(self):
+        Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        result = graphql(self.client, self.BULK_CREATE_CUSTOMERS, {"input": [
+            {"name": "Ada again", "email": "ada@example.com"},
+            {"name": "Grace", "email": "grace@example.com", "phone": "+15550000001"},
+            {"name": "Grace twin", "email": "grace@example.com"},
+            {"name": "Bad phone", "email": "bad@example.com", "phone": "call me"},
+        ]})["data"]["bulkCreateCustomers"]
+        self.assertEqual([c["email"] for c in result["customers"]], ["grace@example.com"])
+        self.assertEqual(result["errors"], [
+            "Email already exists: ada@example.com",
+            "Email already exists: grace@example.com",
+            "Invalid phone for Bad phone: call me",
+        ])
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_bulk_create_customers_reports_emails_inserted_concurrently(self):
+        def insert_grace():
+            # Another request commits grace@ between the email lookup and the insert
+            Customer.objects.create(name="Grace elsewhere", email="grace@example.com", phone="+15550000002")
+            return 1000
+
+        with mock.patch("crm.schema.bulk_batch_size", side_effect=insert_grace):
+            result = graphql(self.client, self.BULK_CREATE_CUSTOMERS, {"input": [
+                {"name": "Ada", "email": "ada@example.com"},
+                {"name": "Grace", "email": "grace@example.com"},
+            ]})["data"]["bulkCreateCustomers"]
+        self.assertEqual([c["email"] for c in result["customers"]], ["ada@example.com"])
+        self.assertEqual(result["errors"], ["Email already exists: grace@example.com"])
+        self.assertEqual(CRMSummary.current().total_customers, Customer.objects.count())
+
+    def test_bulk_create_orders_statements_do_not_grow_with_the_batch(self):
+        customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        products = [str(Product.objects.create(name=f"P{n}", price="1.00", stock=1000).pk) for n in range(2)]
+
+        def statements(count):
+            with CaptureQueriesContext(connection) as queries:
+                result = graphql(self.client, self.BULK_CREATE_ORDERS, {
+                    "input": [{"customerId": str(customer.pk), "productIds": products}] * count,
+                })
+            self.assertEqual(len(result["data"]["bulkCreateOrders"]["orders"]), count)
+            # Stock is reserved per order line, in a savepoint per order
+            return [
+                q["sql"] for q in queries
+                if not q["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT", 'UPDATE "crm_product"'))
+            ]
+
+        self.assertEqual(len(statements(50)), len(statements(2)))
+
+
+# ---------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------
+
+@override_settings(CRM_MAX_PAGE_SIZE=5)
+class KeysetPaginationTests(TestCase):
+    PAGE = """
+    query($first: Int, $after: String, $last: Int, $before: String) {
+        customers(first: $first, after: $after, last: $last, before: $before) {
+            edges { node { name } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+        }
+    }
+    """
+
+    def setUp(self):
+        Customer.objects.bulk_create(
+            Customer(name=f"Customer {n:02}", email=f"customer{n}@example.com", phone="+15550000000")
+            for n in range(12)
+        )
+
+    def page(self, **variables):
+        result = graphql(self.client, self.PAGE, variables)
+        self.assertNotIn("errors", result)
+        connection = result["data"]["customers"]
+        return [edge["node"]["name"] for edge in connection["edges"]], connection["pageInfo"]
+
+    def test_forward_pages_follow_the_end_cursor(self):
+        names, after = [], None
+        while True:
+            page, info = self.page(first=4, after=after)
+            names += page
+            if not info["hasNextPage"]:
+                break
+            after = info["endCursor"]
+        self.assertEqual(names, [f"Customer {n:02}" for n in range(12)])
+
+    def test_backward_page_before_a_cursor(self):
+        _, info = self.page(first=5)
+        names, info = self.page(last=2, before=info["endCursor"])
+        self.assertEqual(names, ["Customer 02", "Customer 03"])
+        self.assertTrue(info["hasPreviousPage"])
+
+    def test_cursor_survives_rows_deleted_before_it(self):
+        _, info = self.page(first=3)
+        Customer.objects.filter(name="Customer 01").delete()
+        names, _ = self.page(first=3, after=info["endCursor"])
+        self.assertEqual(names, ["Customer 03", "Customer 04", "Customer 05"])
+
+    def test_default_page_is_the_maximum_page_size(self):
+        names, info = self.page()
+        self.assertEqual(len(names), 5)
+        self.assertTrue(info["hasNextPage"])
+
+    def test_pages_over_the_maximum_are_rejected(self):
+        result = graphql(self.client, self.PAGE, {"first": 6})
+        self.assertIsNone(result["data"]["customers"])
+        self.assertIn("exceeds the limit of 5 records", result["errors"][0]["message"])
+
+    def test_orders_page_on_date_then_id(self):
+        customer = Customer.objects.first()
+        same_day = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        orders = [
+            Order.objects.create(customer=customer, order_date=same_day + timedelta(days=n % 2))
+            for n in range(6)
+        ]
+        expected = [str(o.pk) for o in sorted(orders, key=lambda o: (o.order_date, o.pk))]
+        query = """
+        query($after: String) {
+            orders(first: 2, after: $after) { edges { node { id } } pageInfo { hasNextPage endCursor } }
+        }
+        """
+        ids, after = [], None
+        while True:
+            connection = graphql(self.client, query, {"after": after})["data"]["orders"]
+            ids += [edge["node"]["id"] for edge in connection["edges"]]
+            if not connection["pageInfo"]["hasNextPage"]:
+                break
+            after = connection["pageInfo"]["endCursor"]
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        result = graphql(self.client, self.PAGE, {"first": 2, "after": "not-a-cursor"})
+        self.assertIn("Invalid cursor", result["errors"][0]["message"])
+
+    def test_cursor_values_of_the_wrong_type_are_rejected(self):
+        orders = "query($after: String) { orders(after: $after) { edges { node { id } } } }"
+        for query, values in [
+            (self.PAGE, [None]),
+            (self.PAGE, ["3"]),
+            (self.PAGE, [True]),
+            (orders, [3, 1]),
+            (orders, ["not a date", 1]),
+            (orders, ["2024-01-01T00:00:00+00:00", 1.5]),
+        ]:
+            with self.subTest(values=values):
+                result = graphql(self.client, query, {"after": encode_cursor(values)})
+                self.assertIn("Invalid cursor", result["errors"][0]["message"])
+
+
+# ---------------------------------------------------------
+# Order totals and the CRM summary
+# ---------------------------------------------------------
+
+class SummaryConsistencyTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        self.pen = Product.objects.create(name="Pen", price="2.50", stock=10)
+        self.ink = Product.objects.create(name="Ink", price="4.00", stock=10)
+
+    def assertConsistent(self):
+        summary = CRMSummary.current()
+        self.assertEqual(summary.total_customers, Customer.objects.count())
+        self.assertEqual(summary.total_orders, Order.objects.count())
+        self.assertEqual(summary.total_revenue, Order.objects.aggregate(total=Sum("total_amount"))["total"] or 0)
+        for order in Order.objects.all():
+            self.assertEqual(order.total_amount, order.items.revenue())
+
+    def add(self, order, *products):
+        order.products.add(*products, through_defaults={"unit_price": products[0].price})
+
+    def test_create_and_delete(self):
+        order = Order.objects.create(customer=self.customer)
+        self.add(order, self.pen)
+        Customer.objects.create(name="Grace", email="grace@example.com", phone="+15550000001")
+        self.assertConsistent()
+
+        order.delete()
+        self.assertConsistent()
+        # Deleting a customer cascades to its orders
+        self.add(Order.objects.create(customer=self.customer), self.ink)
+        self.customer.delete()
+        self.assertConsistent()
+        self.assertEqual(CRMSummary.current().total_revenue, 0)
+
+    def test_order_side_m2m_changes(self):
+        order = Order.objects.create(customer=self.customer)
+        self.add(order, self.pen)
+        self.add(order, self.ink)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("6.50"))
+        self.assertConsistent()
+
+        order.products.remove(self.pen)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("4.00"))
+        self.assertConsistent()
+
+        order.products.clear()
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, 0)
+        self.assertConsistent()
+
+    def test_product_side_m2m_changes(self):
+        orders = [Order.objects.create(customer=self.customer) for _ in range(2)]
+        self.pen.orders.add(*orders, through_defaults={"unit_price": self.pen.price})
+        self.assertConsistent()
+        self.pen.orders.remove(orders[0])
+        self.assertConsistent()
+        self.pen.orders.clear()
+        self.assertConsistent()
+        self.assertEqual(CRMSummary.current().total_revenue, 0)
+
+    def test_line_edits_and_deletes(self):
+        order = Order.objects.create(customer=self.customer)
+        self.add(order, self.pen)
+        self.add(order, self.ink)
+        line = order.items.get(product=self.pen)
+
+        line.quantity = 3
+        line.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("11.50"))
+        self.assertConsistent()
+
+        order.items.get(product=self.ink).delete()
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("7.50"))
+        self.assertConsistent()
+
+    def test_deleting_a_product_updates_its_orders(self):
+        orders = [Order.objects.create(customer=self.customer) for _ in range(2)]
+        for order in orders:
+            self.add(order, self.pen)
+        self.add(orders[0], self.ink)
+
+        self.pen.delete()
+        self.assertEqual(
+            list(Order.objects.order_by("pk").values_list("total_amount", flat=True)),
+            [Decimal("4.00"), Decimal("0.00")],
+        )
+        self.assertConsistent()
+
+    def test_create_customer_rolls_back_when_the_summary_cannot_be_adjusted(self):
+        mutation = 'mutation { createCustomer(name: "Grace", email: "grace@example.com") { customer { id } } }'
+        with mock.patch("crm.signals.CRMSummary.adjust", side_effect=DatabaseError("summary is locked")):
+            result = graphql(self.client, mutation)
+        self.assertEqual(result["errors"][0]["message"], "summary is locked")
+        self.assertFalse(Customer.objects.filter(email="grace@example.com").exists())
+        self.assertConsistent()
+
+    def test_bulk_mutations(self):
+        graphql(
+            self.client,
+            "mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) { errors } }",
+            {"input": [{"name": f"C{n}", "email": f"c{n}@example.com"} for n in range(3)]},
+        )
+        graphql(
+            self.client,
+            "mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { errors } }",
+            {"input": [{"customerId": str(self.customer.pk), "productIds": [str(self.pen.pk), str(self.ink.pk)]}] * 2},
+        )
+        self.assertConsistent()
+        totals = graphql(self.client, "{ totalCustomers totalOrders totalRevenue }")["data"]
+        self.assertEqual((totals["totalCustomers"], totals["totalOrders"]), (4, 2))
+        self.assertEqual(Decimal(str(totals["totalRevenue"])), Decimal("13.00"))
+
+    def test_reconcile_command_reports_and_fixes_drift(self):
+        self.add(Order.objects.create(customer=self.customer), self.pen)
+        CRMSummary.adjust(orders=5)
+        out = StringIO()
+        call_command("reconcile_crm_summary", "--fix", stdout=out)
+        self.assertIn("total_orders", out.getvalue())
+        self.assertConsistent()
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        self.order = Order.objects.create(customer=customer)
+        self.pen = Product.objects.create(name="Pen", price="2.50", stock=10)
+
+    def total(self):
+        return Order.objects.get(pk=self.order.pk).total_amount
+
+    def test_lines_written_one_by_one_update_the_total(self):
+        line = OrderItem.objects.create(order=self.order, product=self.pen, quantity=2, unit_price="2.50")
+        self.assertEqual(self.total(), Decimal("5.00"))
+        line.quantity = 4
+        line.save(update_fields=["quantity"])
+        self.assertEqual(self.total(), Decimal("10.00"))
+        self.assertEqual(CRMSummary.current().total_revenue, Decimal("10.00"))
+
+    def test_recompute_command_repairs_totals_written_around_the_signals(self):
+        OrderItem.objects.create(order=self.order, product=self.pen, quantity=2, unit_price="2.50")
+        OrderItem.objects.filter(order=self.order).update(quantity=3)
+        self.assertEqual(self.total(), Decimal("5.00"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command(
+                "recompute_order_totals", checkpoint=os.path.join(directory, "checkpoint"), stdout=StringIO(),
+            )
+        self.assertEqual(self.total(), Decimal("7.50"))
+        self.assertEqual(CRMSummary.current().total_revenue, Decimal("7.50"))
+
+
+# ---------------------------------------------------------
+# Query cost
+# ---------------------------------------------------------
+
+class QueryCostTests(TestCase):
+    DEEP = "{ orders { edges { node { products { orders { edges { node { customer { name } } } } } } } } }"
+
+    def cost(self, query):
+        document = parse(query)
+        return analyze_query(schema.graphql_schema, document, document.definitions[0])
+
+    def test_deep_nesting_is_over_the_default_budget(self):
+        cost = self.cost(self.DEEP)
+        self.assertGreater(cost.cost, cost_settings()["max_cost"])
+        self.assertTrue(cost.over_budget)
+
+    def test_deep_nesting_is_rejected_before_resolving(self):
+        result = graphql(self.client, self.DEEP)
+        self.assertIsNone(result.get("data"))
+        error = result["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_COMPLEX")
+        self.assertGreater(error["extensions"]["cost"], error["extensions"]["maxCost"])
+
+    def test_paged_query_is_within_budget(self):
+        query = "{ orders(first: 100) { edges { node { id customer { name } items { quantity product { name } } } } } }"
+        self.assertFalse(self.cost(query).over_budget)
+        result = graphql(self.client, query)
+        self.assertNotIn("errors", result)
+        self.assertLessEqual(result["extensions"]["cost"]["cost"], result["extensions"]["cost"]["maxCost"])
+
+
+# ---------------------------------------------------------
+# Parsed documents and persisted queries
+# ---------------------------------------------------------
+
+class DocumentCacheTests(TestCase):
+    QUERY = "{ totalCustomers }"
+
+    def setUp(self):
+        document_cache.clear()
+        self.addCleanup(document_cache.clear)
+
+    def persisted(self, digest, query=None):
+        body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": digest}}}
+        if query is not None:
+            body["query"] = query
+        return self.client.post("/graphql", json.dumps(body), content_type="application/json").json()
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = DocumentCache(maxsize=2)
+        graphql_schema = schema.graphql_schema
+        first = cache.get(graphql_schema, "{ hello }")
+        cache.get(graphql_schema, "{ totalOrders }")
+        self.assertIs(cache.get(graphql_schema, "{ hello }"), first)
+        cache.get(graphql_schema, "{ totalRevenue }")
+
+        self.assertIsNone(cache.lookup(graphql_schema, query_hash("{ totalOrders }")))
+        self.assertIs(cache.lookup(graphql_schema, query_hash("{ hello }")), first)
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (2, 2, 3))
+
+    def test_invalid_documents_are_cached_with_their_errors(self):
+        cache = DocumentCache()
+        entry = cache.get(schema.graphql_schema, "{ noSuchField }")
+        self.assertIsNotNone(entry.document)
+        self.assertEqual(len(entry.errors), 1)
+        self.assertIs(cache.get(schema.graphql_schema, "{ noSuchField }"), entry)
+        self.assertIn("Syntax Error", cache.get(schema.graphql_schema, "{").errors[0].message)
+
+    def test_automatic_persisted_query(self):
+        digest = query_hash(self.QUERY)
+        result = self.persisted(digest)
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+        self.assertEqual(self.persisted(digest, self.QUERY)["data"], {"totalCustomers": 0})
+        self.assertEqual(self.persisted(digest)["data"], {"totalCustomers": 0})
+
+        result = self.persisted(query_hash("{ hello }"), self.QUERY)
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_HASH_MISMATCH")
+
+    def test_stats_endpoint(self):
+        for _ in range(3):
+            graphql(self.client, self.QUERY)
+        stats = self.client.get("/graphql/document-cache").json()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (1, 2, 1))
+
+
+# ---------------------------------------------------------
+# Read replicas and the response cache
+# ---------------------------------------------------------
+
+@override_settings(CRM_RESPONSE_CACHE={"enabled": True, "backend": "local"})
+class ReplicaResponseCacheTests(TransactionTestCase):
+    """A second SQLite file stands in for the replica, copied from the primary on demand."""
+
+    QUERY = "{ customers { edges { node { name } } } }"
+
+    def setUp(self):
+        handle, self.replica_path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(handle)
+        databases = {
+            **settings.DATABASES,
+            "replica": {"ENGINE": "django.db.backends.sqlite3", "NAME": self.replica_path},
+        }
+        connections.settings["replica"] = connections.configure_settings(databases)["replica"]
+        override = override_settings(
+            DATABASES=databases, CRM_DATABASE_ROUTING={"replicas": ["replica"], "pin_cookie": "crm_primary"},
+        )
+        override.enable()
+        self.addCleanup(self.remove_replica, override)
+
+    def remove_replica(self, override):
+        override.disable()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        os.remove(self.replica_path)
+
+    def sync_replica(self):
+        primary = connections["default"]
+        primary.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+
+    def names(self, response):
+        return [edge["node"]["name"] for edge in response.json()["data"]["customers"]["edges"]]
+
+    def test_replica_reads_are_not_cached(self):
+        Customer.objects.create(name="Ada", email="ada@example.com")
+        self.sync_replica()
+        # Committed on the primary only: the replica lags behind
+        Customer.objects.create(name="Grace", email="grace@example.com")
+
+        for _ in range(2):
+            response = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+            self.assertEqual(self.names(response), ["Ada"])
+            self.assertEqual(response["X-CRM-Cache"], "MISS")
+
+        self.client.cookies["crm_primary"] = "1"
+        response = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        self.assertEqual(self.names(response), ["Ada", "Grace"])
+        self.assertNotIn("X-CRM-Cache", response)
+
+    def test_pinned_client_sees_its_own_write(self):
+        Customer.objects.create(name="Ada", email="ada@example.com")
+        self.sync_replica()
+
+        mutation = 'mutation { createCustomer(name: "Grace", email: "grace@example.com", phone: "+15550000001") { customer { id } } }'
+        response = self.client.post("/graphql", {"query": mutation}, content_type="application/json")
+        self.assertIn("crm_primary", response.cookies)
+
+        response = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        self.assertEqual(self.names(response), ["Ada", "Grace"])
+
+        del self.client.cookies["crm_primary"]
+        response = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        self.assertEqual(self.names(response), ["Ada"])
+
+    @override_settings(CRM_DATABASE_ROUTING={"replicas": []})
+    def test_primary_reads_are_cached(self):
+        Customer.objects.create(name="Ada", email="ada@example.com")
+        statuses = [
+            self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")["X-CRM-Cache"]
+            for _ in range(2)
+        ]
+        self.assertEqual(statuses, ["MISS", "HIT"])
+
+
+# ---------------------------------------------------------
+# In-process GraphQL client
+# ---------------------------------------------------------
+
+@mock.patch("crm.graphql_client.execute_over_http", side_effect=AssertionError("HTTP used"))
+class GraphQLClientTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, routing, "_process_pinned_until", 0.0)
+
+    def test_runs_in_process(self, over_http):
+        self.assertEqual(execute_query("{ hello }"), {"hello": "Hello, GraphQL!"})
+        self.assertEqual(execute_query(gql("{ hello }")), {"hello": "Hello, GraphQL!"})
+        query = "query($name: String) { customers(name: $name) { edges { node { email } } } }"
+        Customer.objects.create(name="Ada", email="ada@example.com")
+        data = execute_query(query, {"name": "ada"})
+        self.assertEqual(data["customers"]["edges"], [{"node": {"email": "ada@example.com"}}])
+
+    def test_errors_are_raised(self, over_http):
+        with self.assertRaisesMessage(GraphQLExecutionError, "Cannot query field 'nope'"):
+            execute_query("{ nope }")
+        with self.assertRaisesMessage(GraphQLExecutionError, "Invalid cursor"):
+            execute_query('{ customers(after: "garbage") { edges { node { id } } } }')
+
+    def test_mutation_pins_the_process_to_the_primary(self, over_http):
+        execute_query("{ hello }")
+        self.assertFalse(routing.process_pinned())
+        execute_query('mutation { createCustomer(name: "Ada", email: "ada@example.com") { customer { id } } }')
+        self.assertTrue(routing.process_pinned())
+
+    @override_settings(CRM_GRAPHQL_EXECUTOR="http")
+    def test_http_executor_setting(self, over_http):
+        over_http.side_effect = None
+        over_http.return_value = {"hello": "over HTTP"}
+        self.assertEqual(execute_query("{ hello }"), {"hello": "over HTTP"})
+
+    def test_cron_heartbeat_queries_in_process(self, over_http):
+        log = mock.mock_open()
+        with mock.patch("builtins.open", log):
+            cron.log_crm_heartbeat()
+        self.assertIn("GraphQL says: Hello, GraphQL!", log().write.call_args.args[0])
+
+
+# ---------------------------------------------------------
+# Async view
+# ---------------------------------------------------------
+
+class AsyncViewTests(TestCase):
+    """Queries posted to /graphql/async resolve on the event loop, where the ORM is async-only."""
+
+    def setUp(self):
+        [self.order] = create_orders(1)
+        Customer.objects.filter(pk=self.order.customer_id).update(name="Ada Lovelace")
+
+    def post(self, query, variables=None):
+        result = graphql(self.client, query, variables, path="/graphql/async")
+        self.assertNotIn("errors", result)
+        return result["data"]
+
+    def test_list_matches_the_sync_view(self):
+        create_orders(2)
+        query = """
+        query($after: String) {
+            orders(first: 2, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                edges { node { totalAmount customer { name orders(first: 5) { edges { node { id } } } }
+                               items { quantity product { name } } } }
+            }
+            products(first: 3) { edges { node { name } } }
+        }
+        """
+        first = self.post(query)
+        self.assertEqual(first, graphql(self.client, query)["data"])
+        self.assertTrue(first["orders"]["pageInfo"]["hasNextPage"])
+
+        variables = {"after": first["orders"]["pageInfo"]["endCursor"]}
+        second = self.post(query, variables)
+        self.assertEqual(second, graphql(self.client, query, variables)["data"])
+        self.assertEqual(len(second["orders"]["edges"]), 1)
+
+    def test_filters(self):
+        Product.objects.filter(name="Product 0.1").update(price="9.00", stock=20)
+        data = self.post("""{
+            products(price_Gte: 5, stock_Gte: 10) { edges { node { name } } }
+            lowStock: products(lowStock: true) { edges { node { name } } }
+            orders(customerName: "lovelace", totalAmount_Lte: 5) { edges { node { customer { name } } } }
+        }""")
+        self.assertEqual([e["node"]["name"] for e in data["products"]["edges"]], ["Product 0.1"])
+        self.assertEqual([e["node"]["name"] for e in data["lowStock"]["edges"]], ["Product 0.0"])
+        self.assertEqual([e["node"]["customer"]["name"] for e in data["orders"]["edges"]], ["Ada Lovelace"])
+
+    def test_search(self):
+        # The first request of a process looks the index up in a worker thread
+        with mock.patch.dict(text_search._ready, clear=True):
+            data = self.post('{ customers(search: "ada") { edges { node { name } } } }')
+        self.assertEqual([e["node"]["name"] for e in data["customers"]["edges"]], ["Ada Lovelace"])
+
+        data = self.post('{ orders(search: "lovel") { edges { node { id } } } }')
+        self.assertEqual(len(data["orders"]["edges"]), 1)
+        data = self.post('{ orders(search: "nobody") { edges { node { id } } } }')
+        self.assertEqual(data["orders"]["edges"], [])
+
+    def test_product_name(self):
+        query = "query($name: String) { orders(productName: $name) { edges { node { id } } } }"
+        self.assertEqual(len(self.post(query, {"name": "product 0.1"})["orders"]["edges"]), 1)
+        self.assertEqual(self.post(query, {"name": "missing"})["orders"]["edges"], [])
+
+    def test_mutation(self):
+        data = self.post(
+            'mutation { createCustomer(name: "Grace", email: "grace@example.com") { customer { name } } }'
+        )
+        self.assertEqual(data["createCustomer"]["customer"], {"name": "Grace"})
+        self.assertTrue(Customer.objects.filter(email="grace@example.com").exists())
+        self.assertEqual(CRMSummary.current().total_customers, Customer.objects.count())
+
+
+# ---------------------------------------------------------
+# Filter indexes
+# ---------------------------------------------------------
+
+class ExplainFiltersTests(TestCase):
+    def explain(self, *args):
+        out = StringIO()
+        call_command("explain_filters", *args, stdout=out, no_color=True)
+        return {line.split()[0]: line for line in out.getvalue().splitlines() if line and not line[0].isspace()}
+
+    def test_reports_the_indexes_each_filter_uses(self):
+        create_orders(3)
+        lines = self.explain("--analyze")
+        self.assertIn("crm_orderitem_prod_order_idx", lines["OrderFilter.product_id"])
+        self.assertIn("crm_order_date_id_idx", lines["OrderFilter.order_date__gte"])
+        self.assertIn("FULL SCAN crm_customer", lines["CustomerFilter.name"])
+
+    def test_range_filters_have_no_single_column_indexes(self):
+        # Keyset pages read in id / (order_date, id) order, so these went unused
+        with connection.cursor() as cursor:
+            indexes = {
+                name
+                for table in ("crm_order", "crm_product")
+                for name in connection.introspection.get_constraints(cursor, table)
+            }
+        self.assertFalse(indexes & {"crm_order_total_idx", "crm_product_price_idx", "crm_product_stock_idx"})
+
+    def test_fail_on_scan(self):
+        with self.assertRaisesMessage(CommandError, "ProductFilter.price__gte"):
+            self.explain("--fail-on-scan")
+
+    def test_parse_plan(self):
+        sqlite_plan = "SCAN crm_product\nSEARCH U0 USING COVERING INDEX crm_orderitem_prod_order_idx (product_id=?)"
+        self.assertEqual(parse_plan("sqlite", sqlite_plan), ({"crm_product"}, {"crm_orderitem_prod_order_idx"}))
+        postgres_plan = (
+            "Limit\n  ->  Index Scan using crm_order_date_id_idx on crm_order\n"
+            "        ->  Seq Scan on crm_customer"
+        )
+        self.assertEqual(parse_plan("postgresql", postgres_plan), ({"crm_customer"}, {"crm_order_date_id_idx"}))
+
+
+# ---------------------------------------------------------
+# Low-stock restock
+# ---------------------------------------------------------
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+    mutation($first: Int, $after: String, $increment: Int) {
+        updateLowStockProducts(first: $first, after: $after, increment: $increment) {
+            updatedProducts { name stock } endCursor hasNextPage errors
+        }
+    }
+    """
+
+    def setUp(self):
+        for n in range(5):
+            Product.objects.create(name=f"Low {n}", price="1.00", stock=n)
+        Product.objects.create(name="Plenty", price="1.00", stock=50)
+
+    def restock(self, **variables):
+        result = graphql(self.client, self.MUTATION, variables)
+        self.assertNotIn("errors", result)
+        return result["data"]["updateLowStockProducts"]
+
+    def test_pages_through_low_stock_products(self):
+        # increment 1 leaves them below the threshold: only the cursor moves on
+        pages, after = [], None
+        while True:
+            page = self.restock(first=2, after=after, increment=1)
+            pages.append([(p["name"], p["stock"]) for p in page["updatedProducts"]])
+            if not page["hasNextPage"]:
+                break
+            after = page["endCursor"]
+
+        self.assertEqual(pages, [
+            [("Low 0", 1), ("Low 1", 2)], [("Low 2", 3), ("Low 3", 4)], [("Low 4", 5)],
+        ])
+        self.assertEqual(Product.objects.get(name="Plenty").stock, 50)
+        self.assertEqual(self.restock(after=page["endCursor"])["updatedProducts"], [])
+
+    def test_statements_do_not_grow_with_the_page(self):
+        counts = []
+        for first in (1, 5):
+            Product.objects.filter(name__startswith="Low").update(stock=0)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.restock(first=first)["updatedProducts"]), first)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_without_update_returning(self):
+        with mock.patch("crm.models.supports_update_returning", return_value=False):
+            page = self.restock(first=3)
+        self.assertEqual([p["stock"] for p in page["updatedProducts"]], [10, 11, 12])
+        self.assertTrue(page["hasNextPage"])
+
+    def test_increment_must_be_positive(self):
+        self.assertEqual(self.restock(increment=0)["errors"], ["Increment must be positive."])
+        self.assertEqual(sorted(Product.objects.values_list("stock", flat=True)), [0, 1, 2, 3, 4, 50])
+
+
+# ---------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------
+
+class MetricsTests(TestCase):
+    QUERY = "query Orders { orders { edges { node { totalAmount customer { name } products { name } } } } }"
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        create_orders(3)
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_operation_and_field_histograms(self):
+        for path in ("/graphql", "/graphql/async"):
+            self.assertNotIn("errors", graphql(self.client, self.QUERY, path=path))
+        samples = self.scrape()
+
+        self.assertEqual(samples['crm_graphql_operation_seconds_count{operation="Orders",type="query"}'], 2)
+        queries = samples['crm_graphql_operation_sql_queries_sum{operation="Orders",type="query"}']
+        fields = {
+            name.split('path="')[1].split('"')[0]: value
+            for name, value in samples.items()
+            if name.startswith("crm_graphql_field_sql_queries_sum{")
+        }
+        # Resolvers with SQL of their own; scalars and edges/node are not timed
+        self.assertEqual(set(fields), {"orders", "orders.edges.node.customer", "orders.edges.node.products"})
+        self.assertEqual(sum(fields.values()), queries)
+
+    @override_settings(CRM_METRICS={"enabled": False})
+    def test_disabled(self):
+        graphql(self.client, self.QUERY)
+        self.assertFalse(any(name.endswith("_count") for name in self.scrape()))
+
+    def test_series_are_capped(self):
+        histogram = metrics.Histogram("h", "help", ("path",), (1, 10))
+        for n, value in enumerate((0.5, 5, 50)):
+            histogram.observe((f"field{n}",), value, max_series=2)
+        self.assertEqual(sorted(histogram.series), [(metrics.OVERFLOW,), ("field0",), ("field1",)])
+        self.assertIn('h_bucket{path="field1",le="10"} 1', histogram.render())
+        self.assertIn('h_bucket{path="__overflow__",le="+Inf"} 1', histogram.render())
+
+
+# ---------------------------------------------------------
+# Slow-operation profiler
+# ---------------------------------------------------------
+
+class ProfilerTests(TestCase):
+    QUERY = "query Customers($name: String) { customers(name: $name) { edges { node { name } } } }"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        Customer.objects.create(name="Ada", email="ada@example.com")
+
+    def profiler(self, **config):
+        return override_settings(CRM_PROFILER={
+            "enabled": True, "sample_rate": 1, "threshold_ms": 0, "directory": self.directory, **config,
+        })
+
+    def show_profiles(self, *args):
+        out = StringIO()
+        call_command("show_profiles", *args, directory=self.directory, stdout=out, no_color=True)
+        return out.getvalue()
+
+    def test_slow_operations_are_captured(self):
+        with self.profiler():
+            graphql(self.client, self.QUERY, {"name": "Ada Lovelace"})
+        [capture] = profiling.list_captures(self.directory)
+        self.assertEqual((capture["operation"], capture["type"]), ("Customers", "query"))
+        self.assertEqual(capture["variables"], ["name"])
+        self.assertTrue(any("crm_customer" in s["sql"] for s in capture["statements"]))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, capture["id"] + ".prof")))
+
+        self.assertIn("1 captures", self.show_profiles())
+        detail = self.show_profiles(capture["id"])
+        self.assertIn("variables: name", detail)
+        self.assertIn("Slowest SQL statements:", detail)
+        self.assertNotIn("Ada Lovelace", detail)
+        with self.assertRaisesMessage(CommandError, "No capture missing"):
+            self.show_profiles("missing")
+
+    def test_fast_unsampled_and_async_operations_are_not_captured(self):
+        with self.profiler(threshold_ms=60_000):
+            graphql(self.client, self.QUERY)
+        with self.profiler(sample_rate=0):
+            graphql(self.client, self.QUERY)
+        with self.profiler():
+            graphql(self.client, self.QUERY, path="/graphql/async")
+        self.assertEqual(profiling.list_captures(self.directory), [])
+        self.assertIn("No captures", self.show_profiles())
+
+    def test_directory_is_pruned(self):
+        with self.profiler(max_files=2):
+            for _ in range(3):
+                graphql(self.client, self.QUERY)
+        self.assertEqual(len(profiling.list_captures(self.directory)), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+
+# ---------------------------------------------------------
+# Weekly report snapshots
+# ---------------------------------------------------------
+
+class ReportSnapshotTests(TestCase):
+    def create_orders(self, count, lines=2):
+        orders = create_orders(count, lines)
+        Order.objects.filter(pk__in=[order.pk for order in orders]).recompute_totals()
+        return orders
+
+    def counts(self, snapshot):
+        return (
+            snapshot.new_customers, snapshot.new_orders, snapshot.new_revenue,
+            snapshot.total_customers, snapshot.total_orders, snapshot.total_revenue,
+        )
+
+    def test_each_run_adds_the_new_rows(self):
+        self.create_orders(2)
+        first = ReportSnapshot.take()
+        self.assertEqual(self.counts(first), (2, 2, Decimal("4.00"), 2, 2, Decimal("4.00")))
+        self.create_orders(1, lines=3)
+        second = ReportSnapshot.take()
+        self.assertEqual(second.previous, first)
+        self.assertEqual(self.counts(second), (1, 1, Decimal("3.00"), 3, 3, Decimal("7.00")))
+        self.assertEqual(self.counts(ReportSnapshot.take())[:3], (0, 0, Decimal("0.00")))
+
+    def test_rows_committed_late_under_the_watermark_are_counted(self):
+        orders = self.create_orders(3)
+        # The middle rows' keys are taken but not visible yet, as if their
+        # transaction committed after the run
+        hidden = orders[1]
+        customer = Customer.objects.get(pk=hidden.customer_id)
+        Customer.objects.filter(pk=customer.pk).delete()
+
+        first = ReportSnapshot.take()
+        self.assertEqual(self.counts(first)[:3], (2, 2, Decimal("4.00")))
+        self.assertEqual(first.customer_id_gaps, [[customer.pk, customer.pk]])
+        self.assertEqual(first.order_id_gaps, [[hidden.pk, hidden.pk]])
+
+        Customer.objects.create(pk=customer.pk, name=customer.name, email=customer.email)
+        Order.objects.create(pk=hidden.pk, customer_id=customer.pk, total_amount="5.00")
+        second = ReportSnapshot.take()
+        self.assertEqual(self.counts(second), (1, 1, Decimal("5.00"), 3, 3, Decimal("9.00")))
+        self.assertEqual((second.customer_id_gaps, second.order_id_gaps), ([], []))
+
+    def test_empty_gaps_are_checked_once(self):
+        orders = self.create_orders(3)
+        Order.objects.filter(pk=orders[0].pk).delete()
+        self.assertEqual(ReportSnapshot.take().order_id_gaps, [[orders[0].pk, orders[0].pk]])
+        self.assertEqual(ReportSnapshot.take().order_id_gaps, [])
+
+    @mock.patch("crm.models.GAP_RANGES_PER_QUERY", 2)
+    def test_gaps_are_checked_in_chunks(self):
+        customers = [Customer.objects.create(name=f"C{n}", email=f"c{n}@example.com") for n in range(11)]
+        hidden = customers[1::2]
+        Customer.objects.filter(pk__in=[c.pk for c in hidden]).delete()
+        first = ReportSnapshot.take()
+        self.assertEqual(len(first.customer_id_gaps), 5)
+
+        Customer.objects.bulk_create(hidden)
+        with CaptureQueriesContext(connection) as queries:
+            second = ReportSnapshot.take()
+        self.assertEqual((second.new_customers, second.total_customers), (5, 11))
+        self.assertEqual(sum("BETWEEN" in q["sql"] and "crm_customer" in q["sql"] for q in queries), 3)
+
+    def test_report_task_and_query(self):
+        from .tasks import generate_crm_report
+
+        self.create_orders(1)
+        log = mock.mock_open()
+        with mock.patch("builtins.open", log):
+            generate_crm_report()
+        self.assertIn("Report: 1 customers (+1), 1 orders (+1)", log().write.call_args.args[0])
+
+        data = graphql(self.client, "{ reportSnapshots(last: 1) { edges { node { totalOrders newRevenue } } } }")
+        self.assertEqual(data["data"]["reportSnapshots"]["edges"], [{"node": {"totalOrders": 1, "newRevenue": "2.00"}}])
+
+
+# ---------------------------------------------------------
+# Order reminders
+# ---------------------------------------------------------
+
+@override_settings(CRM_REMINDERS={"batch_size": 2, "rate_per_second": 0})
+class OrderReminderTests(TestCase):
+    def setUp(self):
+        self.orders = create_orders(5, lines=1)
+        handle, log_file = tempfile.mkstemp(suffix=".log")
+        os.close(handle)
+        self.addCleanup(os.remove, log_file)
+        patcher = mock.patch.object(reminders, "LOG_FILE", log_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_lines(self):
+        with open(reminders.LOG_FILE, encoding="utf-8") as log:
+            return log.read().splitlines()
+
+    @override_settings(CRM_REMINDERS={"batch_size": 2, "rate_per_second": 10})
+    def test_producer_queues_one_paced_task_per_page(self):
+        month_ago = datetime.now(dt_timezone.utc) - timedelta(days=30)
+        Order.objects.filter(pk=self.orders[0].pk).update(order_date=month_ago)
+        with mock.patch("logging.basicConfig"):
+            job = importlib.import_module("crm.cron_jobs.send_order_reminders")
+        with mock.patch.object(job.send_order_reminders, "apply_async") as apply_async, \
+                mock.patch("builtins.print"):
+            job.dispatch_order_reminders()
+
+        batches = [(c.args[0][0], c.kwargs["countdown"]) for c in apply_async.call_args_list]
+        recent = [order.pk for order in self.orders[1:]]
+        self.assertEqual(batches, [(recent[:2], 0), (recent[2:], 0.2)])
+
+    def test_each_order_is_reminded_once(self):
+        ids = [order.pk for order in self.orders]
+        self.assertEqual(reminders.deliver_batch(ids[:3]), 3)
+        self.assertEqual(reminders.deliver_batch(ids), 2)
+        self.assertEqual(reminders.deliver_batch(ids), 0)
+        self.assertEqual(len(self.sent_lines()), 5)
+        self.assertIn(f"Order ID: {ids[0]} | Customer Email: customer0@example.com", self.sent_lines()[0])
+        self.assertFalse(OrderReminder.objects.filter(sent_at__isnull=True).exists())
+
+    def test_stale_claims_are_taken_over(self):
+        stale, held = self.orders[0].pk, self.orders[1].pk
+        hour_ago = datetime.now(dt_timezone.utc) - timedelta(hours=1)
+        OrderReminder.objects.create(order_id=stale, claim="dead", claimed_at=hour_ago)
+        OrderReminder.objects.create(order_id=held, claim="busy")
+        self.assertEqual(reminders.deliver_batch([stale, held]), 1)
+        self.assertEqual(OrderReminder.objects.get(order_id=held).sent_at, None)
+        self.assertIsNotNone(OrderReminder.objects.get(order_id=stale).sent_at)
+
+    def test_deleted_orders_are_skipped(self):
+        Order.objects.filter(pk=self.orders[0].pk).delete()
+        self.assertEqual(reminders.deliver_batch([self.orders[0].pk]), 0)
+
+    @override_settings(CRM_REMINDERS={"rate_per_second": 10})
+    def test_sends_are_paced(self):
+        with mock.patch("crm.reminders.time.sleep") as sleep:
+            reminders.deliver_batch([order.pk for order in self.orders[:3]])
+        self.assertEqual(sleep.call_count, 2)
+        self.assertLessEqual(max(c.args[0] for c in sleep.call_args_list), 0.2)
+
+
+# ---------------------------------------------------------
+# Stock reservation
+# ---------------------------------------------------------
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        self.plenty = Product.objects.create(name="Plenty", price="2.00", stock=10)
+        self.scarce = Product.objects.create(name="Scarce", price="3.00", stock=1)
+
+    def stock(self):
+        return dict(Product.objects.order_by("pk").values_list("pk", "stock"))
+
+    def test_reserve_takes_every_line(self):
+        Product.objects.reserve({self.plenty.pk: 4, self.scarce.pk: 1})
+        self.assertEqual(self.stock(), {self.plenty.pk: 6, self.scarce.pk: 0})
+
+    def test_reserve_rolls_back_every_line_when_one_is_short(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            Product.objects.reserve({self.plenty.pk: 4, self.scarce.pk: 2})
+        self.assertEqual(raised.exception.product_id, self.scarce.pk)
+        self.assertEqual(self.stock(), {self.plenty.pk: 10, self.scarce.pk: 1})
+
+    def test_bulk_create_orders_rejects_only_the_short_order(self):
+        ids = [str(self.plenty.pk), str(self.scarce.pk)]
+        result = graphql(
+            self.client,
+            "mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) { orders { id } errors } }",
+            {"input": [{"customerId": str(self.customer.pk), "productIds": ids} for _ in range(2)]},
+        )["data"]["bulkCreateOrders"]
+        self.assertEqual(len(result["orders"]), 1)
+        self.assertEqual(result["errors"], [f"Insufficient stock for order 1: product {self.scarce.pk}."])
+        self.assertEqual(self.stock(), {self.plenty.pk: 9, self.scarce.pk: 0})
+
+    def test_import_rejects_only_the_short_order(self):
+        checkpoint = ImportCheckpoint.objects.create(
+            kind="orders", source="/tmp/orders.csv", source_size=0, source_mtime=0, chunk_size=2,
+        )
+        row = {"customer_id": self.customer.pk, "product_ids": [self.plenty.pk, self.scarce.pk]}
+        rows, errors = validate_chunk("orders", [(2, row), (3, row)])
+        imported, errors = write_chunk(checkpoint, "orders", rows, errors, 100)
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, [(3, f"product_ids: insufficient stock for product {self.scarce.pk}.")])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stock(), {self.plenty.pk: 9, self.scarce.pk: 0})
+
+
+# ---------------------------------------------------------
+# Order lines
+# ---------------------------------------------------------
+
+class OrderItemTests(TestCase):
+    CREATE_ORDER = """
+    mutation($customerId: ID!, $productIds: [ID], $items: [OrderItemInput!]) {
+        createOrder(customerId: $customerId, productIds: $productIds, items: $items) {
+            order { id totalAmount items { quantity unitPrice total } }
+            errors
+        }
+    }
+    """
+    BULK_CREATE_ORDERS = (
+        "mutation($input: [OrderInput]!) { bulkCreateOrders(input: $input) "
+        "{ orders { id totalAmount } errors } }"
+    )
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        self.pen = Product.objects.create(name="Pen", price="2.50", stock=100)
+        self.ink = Product.objects.create(name="Ink", price="4.00", stock=100)
+
+    def lines(self, order_id):
+        return list(
+            OrderItem.objects.filter(order_id=order_id).order_by("product_id")
+            .values_list("product_id", "quantity", "unit_price")
+        )
+
+    def test_create_order_snapshots_prices_and_sums_quantities(self):
+        result = graphql(self.client, self.CREATE_ORDER, {
+            "customerId": str(self.customer.pk),
+            "productIds": [str(self.pen.pk)],
+            "items": [{"productId": str(self.pen.pk), "quantity": 2}, {"productId": str(self.ink.pk), "quantity": 3}],
+        })["data"]["createOrder"]
+        order_id = int(result["order"]["id"])
+        self.assertEqual(Decimal(result["order"]["totalAmount"]), Decimal("19.50"))
+        self.assertEqual(
+            self.lines(order_id), [(self.pen.pk, 3, Decimal("2.50")), (self.ink.pk, 3, Decimal("4.00"))],
+        )
+
+        # Later price changes leave the order alone, recomputed or not
+        Product.objects.filter(pk=self.pen.pk).update(price="9.99")
+        Order.objects.filter(pk=order_id).recompute_totals()
+        self.assertEqual(Order.objects.get(pk=order_id).total_amount, Decimal("19.50"))
+        self.assertEqual(dict(Product.objects.values_list("pk", "stock")), {self.pen.pk: 97, self.ink.pk: 97})
+
+    def test_create_order_rejects_quantities_below_one(self):
+        result = graphql(self.client, self.CREATE_ORDER, {
+            "customerId": str(self.customer.pk), "items": [{"productId": str(self.pen.pk), "quantity": 0}],
+        })["data"]["createOrder"]
+        self.assertEqual(result["errors"], ["Quantities must be at least 1."])
+        self.assertFalse(Order.objects.exists())
+
+    def test_bulk_create_orders_matches_create_order(self):
+        lines = {"productIds": [str(self.pen.pk), str(self.pen.pk)], "items": [{"productId": str(self.ink.pk), "quantity": 2}]}
+        single = graphql(self.client, self.CREATE_ORDER, {"customerId": str(self.customer.pk), **lines})
+        bulk = graphql(self.client, self.BULK_CREATE_ORDERS, {"input": [{"customerId": str(self.customer.pk), **lines}]})
+        single_id = int(single["data"]["createOrder"]["order"]["id"])
+        bulk_order = bulk["data"]["bulkCreateOrders"]["orders"][0]
+        self.assertEqual(Decimal(bulk_order["totalAmount"]), Decimal("13.00"))
+        self.assertEqual(self.lines(int(bulk_order["id"])), self.lines(single_id))
+
+    def test_export_and_import_carry_quantities(self):
+        order = Order.objects.create(customer=self.customer, total_amount="13.00")
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.pen, quantity=2, unit_price="2.50"),
+            OrderItem(order=order, product=self.ink, quantity=2, unit_price="4.00"),
+        ])
+        exported = json.loads("".join(stream_export("orders", fmt="ndjson")))
+        self.assertEqual(exported["product_ids"], [self.pen.pk, self.ink.pk])
+        self.assertEqual(exported["quantities"], [2, 2])
+
+        csv_text = "".join(stream_export("orders", fmt="csv"))
+        self.assertIn(f"{self.pen.pk} {self.ink.pk},2 2", csv_text)
+
+        rows, errors = validate_chunk("orders", [(2, exported)])
+        self.assertEqual(errors, [])
+        checkpoint = ImportCheckpoint.objects.create(
+            kind="orders", source="/tmp/orders.ndjson", source_size=0, source_mtime=0, chunk_size=1,
+        )
+        write_chunk(checkpoint, "orders", rows, errors, 100)
+        imported = Order.objects.exclude(pk=order.pk).get()
+        self.assertEqual(imported.total_amount, Decimal("13.00"))
+        self.assertEqual(
+            [(pid, quantity) for pid, quantity, _ in self.lines(imported.pk)],
+            [(self.pen.pk, 2), (self.ink.pk, 2)],
+        )
+
+
+class OrderItemMigrationTests(TransactionTestCase):
+    before = [("crm", "0008_orderreminder")]
+    after = [("crm", "0009_orderitem")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_links_become_priced_lines_and_back(self):
+        apps = self.migrate(self.before)
+        Customer = apps.get_model("crm", "Customer")
+        Product = apps.get_model("crm", "Product")
+        Order = apps.get_model("crm", "Order")
+        customer = Customer.objects.create(name="Ada", email="ada@example.com", phone="+15550000000")
+        pen = Product.objects.create(name="Pen", price="2.50", stock=1)
+        ink = Product.objects.create(name="Ink", price="4.00", stock=1)
+        order = Order.objects.create(customer=customer, total_amount="6.50")
+        order.products.add(pen, ink)
+
+        apps = self.migrate(self.after)
+        lines = apps.get_model("crm", "OrderItem").objects.order_by("product_id")
+        self.assertEqual(
+            list(lines.values_list("order_id", "product_id", "quantity", "unit_price")),
+            [(order.pk, pen.pk, 1, Decimal("2.50")), (order.pk, ink.pk, 1, Decimal("4.00"))],
+        )
+
+        apps = self.migrate(self.before)
+        order = apps.get_model("crm", "Order").objects.get(pk=order.pk)
+        self.assertEqual(sorted(order.products.values_list("pk", flat=True)), [pen.pk, ink.pk])
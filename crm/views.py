@@ -0,0 +1,263 @@
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.http import (
+    HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast
+
+from .documents import document_cache, query_hash
+from .exports import CONTENT_TYPES, ExportError, stream_export
+from .query_cost import analyze_query
+from . import metrics, profiling, response_cache, routing
+
+
+class PreparedOperation:
+    __slots__ = ("document", "operation", "cache_key")
+
+    def __init__(self, document, operation, cache_key):
+        self.document = document
+        self.operation = operation
+        self.cache_key = cache_key
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that parses and validates the document itself so it can
+    run the cost analysis in crm/query_cost.py before any resolver, then
+    executes the already-validated document.
+
+    Parsed documents come from the LRU in crm/documents.py, which also
+    backs automatic persisted queries: a request may carry only
+    ``extensions.persistedQuery.sha256Hash`` once the full text has been
+    sent with that hash.
+
+    Query results may be served from crm/response_cache.py when it is
+    enabled; the outcome is reported in the ``X-CRM-Cache`` header and the
+    cache key doubles as the response ETag.
+
+    Anything stored in ``request.graphql_extensions`` is returned under the
+    ``extensions`` key of the response.
+
+    Queries read from a replica (crm/routing.py) unless the client wrote
+    recently; a mutation pins its client to the primary. Pinned clients
+    bypass the response cache, and results read from a replica are not
+    stored in it.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.add_cache_headers(request, super().dispatch(request, *args, **kwargs))
+        return self.add_pin_cookie(request, response)
+
+    def add_pin_cookie(self, request, response):
+        if getattr(request, "crm_wrote", False):
+            routing.pin(response)
+        return response
+
+    def add_cache_headers(self, request, response):
+        status = getattr(request, "crm_cache_status", None)
+        if status is None:
+            return response
+
+        etag = f'"{request.crm_cache_key}"'
+        if status == "HIT" and request.headers.get("If-None-Match") == etag:
+            response = HttpResponseNotModified()
+        response["X-CRM-Cache"] = status
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def json_encode(self, request, d, pretty=False):
+        extensions = getattr(request, "graphql_extensions", None)
+        if extensions:
+            d = {**d, "extensions": extensions}
+        return super().json_encode(request, d, pretty=pretty)
+
+    def add_extension(self, request, key, value):
+        if not hasattr(request, "graphql_extensions"):
+            request.graphql_extensions = {}
+        request.graphql_extensions[key] = value
+
+    def get_persisted_query(self, request, data):
+        extensions = request.GET.get("extensions") or (data.get("extensions") if hasattr(data, "get") else None)
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are not valid JSON."))
+        if isinstance(extensions, dict):
+            return extensions.get("persistedQuery")
+        return None
+
+    def get_document(self, request, query, data):
+        """Return the cached document entry for the request, or a GraphQLError."""
+        schema = self.schema.graphql_schema
+        persisted = self.get_persisted_query(request, data)
+        if not persisted:
+            return document_cache.get(schema, query) if query else None
+
+        digest = persisted.get("sha256Hash")
+        if query:
+            if query_hash(query) != digest:
+                return GraphQLError(
+                    "Provided sha256Hash does not match query.",
+                    extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+                )
+            return document_cache.get(schema, query, digest)
+
+        entry = document_cache.lookup(schema, digest)
+        if entry is None:
+            return GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+        return entry
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """
+        Run everything that happens before execution: document lookup,
+        operation selection, cost analysis and the response cache lookup.
+
+        Returns a PreparedOperation to execute, or the ExecutionResult (or
+        None, for GraphiQL) to respond with straight away.
+        """
+        entry = self.get_document(request, query, data)
+        if entry is None:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+        if isinstance(entry, GraphQLError):
+            return ExecutionResult(errors=[entry])
+        if entry.errors:
+            return ExecutionResult(errors=entry.errors)
+        document = entry.document
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is None:
+            return ExecutionResult(errors=[GraphQLError("Unknown or ambiguous operation name.")])
+
+        if request.method.lower() == "get" and operation_ast.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        try:
+            cost = analyze_query(self.schema.graphql_schema, document, operation_ast, variables)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+        self.add_extension(request, "cost", cost.as_extension())
+        if cost.over_budget:
+            return ExecutionResult(errors=[cost.error()])
+
+        cache_key = None
+        # Pinned clients must see their own writes, which a cached result
+        # keyed before them may predate on another process
+        if operation_ast.operation == OperationType.QUERY and not routing.is_pinned(request):
+            cache_key = response_cache.result_key(
+                self.schema.graphql_schema, entry, operation_ast, variables, operation_name
+            )
+        if cache_key is not None:
+            request.crm_cache_key = cache_key
+            cached = response_cache.get_result(cache_key)
+            request.crm_cache_status = "MISS" if cached is None else "HIT"
+            if cached is not None:
+                return ExecutionResult(data=cached)
+
+        return PreparedOperation(document, operation_ast, cache_key)
+
+    def execution_options(self, request, prepared, variables, operation_name):
+        options = {
+            "document": prepared.document,
+            "root_value": self.get_root_value(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "context_value": self.get_context(request),
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            options["execution_context_class"] = self.execution_context_class
+        return options
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        prepared = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+        return self.execute_prepared(request, prepared, variables, operation_name)
+
+    def execute_prepared(self, request, prepared, variables, operation_name):
+        options = self.execution_options(request, prepared, variables, operation_name)
+        is_query = prepared.operation.operation == OperationType.QUERY
+        if not is_query:
+            request.crm_wrote = True
+
+        try:
+            with metrics.record_operation(prepared.operation), \
+                    profiling.profile_operation(prepared.document, prepared.operation, variables), \
+                    routing.use_replica(is_query and not routing.is_pinned(request)) as alias:
+                if prepared.operation.operation == OperationType.MUTATION and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                ):
+                    with transaction.atomic():
+                        result = execute(self.schema.graphql_schema, **options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return result
+
+                result = execute(self.schema.graphql_schema, **options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        return self.finish(prepared, result, alias)
+
+    def finish(self, prepared, result, alias):
+        # A replica may not have the writes counted in the key's model
+        # versions yet, so only results read from the primary are stored
+        if prepared.cache_key is not None and alias == DEFAULT_DB_ALIAS and not result.errors:
+            response_cache.store_result(prepared.cache_key, result.data)
+        return result
+
+
+def document_cache_stats(request):
+    """Hit/miss counters of the parsed-document cache."""
+    return JsonResponse(document_cache.stats())
+
+
+def metrics_endpoint(request):
+    """GraphQL resolver and SQL histograms in the Prometheus text format."""
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@staff_member_required
+def export_data(request, kind):
+    """
+    Stream customers, products or orders as NDJSON (default) or CSV.
+
+    ``?format=csv`` picks the format; every other query parameter is a
+    filter of the matching FilterSet, e.g. ``/export/orders?order_date__gte=2024-01-01``.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    filters = request.GET.dict()
+    fmt = filters.pop("format", "ndjson")
+    try:
+        # Streamed after the view returns, so the alias is fixed up front
+        using = DEFAULT_DB_ALIAS if routing.is_pinned(request) else routing.pick_replica()
+        content = stream_export(kind, filters, fmt, using=using)
+    except ExportError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
@@ -10,6 +10,6 @@ INSTALLED_APPS = [
 GRAPHENE = {
     'SCHEMA': 'graphql_crm.schema.schema',
     'MIDDLEWARE': [
-        'graphene_django.debug.DjangoDebugMiddleware',
+        'crm.metrics.MetricsMiddleware',
     ]
 }